@@ -0,0 +1,4 @@
+"""
+Benchmarks for the extractors and utility functions, run against synthetic
+data of different sizes. See run.py for usage.
+"""
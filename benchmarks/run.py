@@ -0,0 +1,329 @@
+"""
+Time the public entry points of the library against synthetic data.
+
+Each benchmark runs in a fresh process, so that the peak RSS is that of
+the benchmark alone, and the results are written as JSON so they can be
+compared between versions:
+
+    $ python -m benchmarks.run --users 1000 100000 1000000 --output results.json
+    $ python -m benchmarks.run --users 1000 --compare results.json
+
+The time to import the package is also measured (in a fresh interpreter) against 
+IMPORT_TIME_BUDGET, so that a slower import shows up in the results.
+"""
+
+from typing import Dict, List, Optional
+
+import argparse, json, multiprocessing, os, platform, queue, resource, subprocess
+import sys, tempfile, time
+
+from .synthetic import write_raw_events, INTERACTION_EVENTS, ALIASES
+
+CASES = ('to_dict', 'parse', 'parse_parallel', 'parse_chunks', 'statistics', 'sequences', 'slices')
+PARSE_CASES = ('parse', 'parse_parallel', 'parse_chunks')
+DEFAULT_USERS = (1000, 100000, 1000000)
+
+# the import time budget (seconds) for the package: numpy is the only heavy dependency
+# that is imported up front (~0.2s when measured), the others are imported lazily (see
+# tests/test_util/test_import_time.py)
+IMPORT_TIME_BUDGET = 0.75
+IMPORT_MODULES = ('interlib', 'interlib.preprocessing', 'interlib.util')
+
+
+def _peak_rss_mb() -> float:
+    """ The peak resident set size of this process, in MB """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak / (1024 ** 2) if sys.platform == 'darwin' else peak / 1024
+
+
+def _measure(case: str, path: str, n_jobs: int) -> Dict:
+    """ Run a single benchmark case (in the current process) """
+    from interlib.util import to_dict, parse_raw_data, parse_raw_data_parallel
+    from interlib.preprocessing import Statistics, Sequences, StatisticalSlices
+
+    if case == 'to_dict':
+        start = time.perf_counter()
+        user_events = to_dict(path)
+        seconds = time.perf_counter() - start
+    elif case in PARSE_CASES: # parsing the raw events, which are loaded beforehand
+        with open(path, 'r') as in_file: raw_data = json.load(in_file)
+        loaded_rss = _peak_rss_mb()
+
+        start = time.perf_counter()
+        if case == 'parse':
+            parse_raw_data(raw_data)
+        elif case == 'parse_parallel':
+            parse_raw_data_parallel(raw_data, n_jobs = n_jobs)
+        else:
+            parse_raw_data_parallel(raw_data, n_jobs = n_jobs, as_chunks = True)
+        seconds = time.perf_counter() - start
+    else:
+        user_events = to_dict(path)
+        loaded_rss = _peak_rss_mb()
+
+        start = time.perf_counter()
+        if case == 'statistics':
+            Statistics(user_events, n_jobs = n_jobs).calculate_statistics(INTERACTION_EVENTS)
+        elif case == 'sequences':
+            Sequences(user_events, n_jobs = n_jobs).get_sequences(INTERACTION_EVENTS, ALIASES)
+        elif case == 'slices':
+            StatisticalSlices(user_events, INTERACTION_EVENTS).get_slices()
+        else:
+            raise ValueError('Unknown benchmark case: {0}'.format(case))
+        seconds = time.perf_counter() - start
+
+    if case in PARSE_CASES: n_events = len(raw_data)
+    else: n_events = sum(len(events) for events in user_events.values())
+    result = {
+        'seconds': seconds,
+        'n_events': n_events,
+        'events_per_sec': n_events / seconds if seconds else float('inf'),
+        'peak_rss_mb': _peak_rss_mb()
+    }
+    if case != 'to_dict': result['loaded_rss_mb'] = loaded_rss
+    return result
+
+
+def _measure_in_child(case: str, path: str, n_jobs: int, queue) -> None:
+    try:
+        queue.put(_measure(case, path, n_jobs))
+    except Exception as e: # report the failure rather than hanging the parent
+        queue.put({'error': repr(e)})
+    finally: # joblib keeps its workers alive to reuse, which stops this process exiting
+        from joblib.externals.loky import get_reusable_executor
+        get_reusable_executor().shutdown(wait = True)
+
+
+def run_case(
+    case: str, 
+    path: str, 
+    n_jobs: int = 1, 
+    timeout: Optional[float] = None,
+    poll_interval: float = 1.0
+) -> Dict:
+    """
+        Run a benchmark case in a fresh process. If the process dies without a result
+        (e.g. it's killed for running out of memory) or takes longer than the timeout,
+        the case is reported as failed rather than waiting forever.
+
+        :params case: one of CASES
+        :params path: the path to the (raw) synthetic data
+        :params n_jobs: passed to the extractors
+        :params timeout: the most seconds to wait for the case, default is no limit
+        :params poll_interval: how often (seconds) to check that the process is alive
+        :returns: the timings and memory usage of the case, or {'error': ...}
+    """
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target = _measure_in_child, args = (case, path, n_jobs, results))
+    process.start()
+
+    start = time.perf_counter()
+    while True:
+        try:
+            result = results.get(timeout = poll_interval)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                try: # the result may have been put just before the process exited
+                    result = results.get(timeout = poll_interval)
+                except queue.Empty:
+                    result = {'error': 'the benchmark process exited with code {0}'.format(
+                        process.exitcode)}
+                break
+
+            if timeout is not None and time.perf_counter() - start > timeout:
+                process.terminate()
+                result = {'error': 'timed out after {0} seconds'.format(timeout)}
+                break
+
+    process.join()
+    return result
+
+
+def measure_import_time(modules: List[str] = IMPORT_MODULES, repeat: int = 5) -> Dict:
+    """
+        Time importing the package in a fresh interpreter, taking the best of a few
+        runs to reduce the noise.
+
+        :params modules: the modules to import
+        :params repeat: the number of runs
+        :returns: the import time, the budget and whether it's within the budget
+    """
+    code = (
+        'import time; start = time.perf_counter(); import {0}; '
+        'print(time.perf_counter() - start)'
+    ).format(', '.join(modules))
+
+    seconds = min(
+        float(subprocess.run(
+            [sys.executable, '-c', code], stdout = subprocess.PIPE, universal_newlines = True,
+            check = True, cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout)
+        for _ in range(repeat)
+    )
+    return {
+        'seconds': seconds, 
+        'budget_seconds': IMPORT_TIME_BUDGET, 
+        'within_budget': seconds <= IMPORT_TIME_BUDGET
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], stdout = subprocess.PIPE, stderr = subprocess.PIPE,
+            universal_newlines = True, check = True,
+            cwd = os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(
+    users: List[int] = DEFAULT_USERS,
+    cases: List[str] = CASES,
+    events_per_user: int = 50,
+    visibility_density: float = 0.02,
+    nec_density: float = 0.1,
+    n_narrative_elements: int = 30,
+    n_jobs: int = 1,
+    seed: int = 42,
+    timeout: Optional[float] = None,
+    import_time: bool = True
+) -> Dict:
+    """
+        Run the benchmark cases for each of the dataset sizes.
+
+        :params users: the numbers of users to benchmark
+        :params cases: the benchmark cases to run
+        :params events_per_user: the number of events per user
+        :params visibility_density: the proportion of events that are hidden/visible toggles
+        :params nec_density: the proportion of events that are narrative element changes
+        :params n_narrative_elements: the number of narrative elements in the story
+        :params n_jobs: passed to the extractors
+        :params seed: the random seed for the synthetic data
+        :params timeout: the most seconds to wait for each case (see run_case)
+        :params import_time: whether to measure the import time (see measure_import_time)
+        :returns: the results, {'meta': {...}, 'results': [{...}, ...], 'import_time': {...}}
+    """
+    unknown_cases = set(cases) - set(CASES)
+    if unknown_cases:
+        raise ValueError('Unknown benchmark cases: {0}'.format(unknown_cases))
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_users in users:
+            path = os.path.join(tmp_dir, 'raw_{0}.json'.format(n_users))
+            write_raw_events(
+                path, n_users, 
+                events_per_user = events_per_user,
+                visibility_density = visibility_density,
+                nec_density = nec_density,
+                n_narrative_elements = n_narrative_elements,
+                seed = seed
+            )
+
+            for case in cases:
+                result = {'case': case, 'n_users': n_users}
+                result.update(run_case(case, path, n_jobs, timeout))
+                results.append(result)
+
+            os.remove(path)
+
+    output = {
+        'meta': {
+            'git_revision': _git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'events_per_user': events_per_user,
+            'visibility_density': visibility_density,
+            'nec_density': nec_density,
+            'n_narrative_elements': n_narrative_elements,
+            'n_jobs': n_jobs,
+            'seed': seed,
+            'timeout': timeout
+        },
+        'results': results
+    }
+    if import_time: output['import_time'] = measure_import_time()
+    return output
+
+
+def compare(current: Dict, previous: Dict) -> List[Dict]:
+    """
+        Compare two sets of benchmark results, matching on the case and number 
+        of users. A speedup above 1 means the current version is faster.
+
+        :params current: results from run_benchmarks
+        :params previous: results from run_benchmarks (e.g. a previous version)
+        :returns: a list of comparisons
+    """
+    previous_results = {(r['case'], r['n_users']): r for r in previous['results']}
+
+    comparisons = []
+    for result in current['results']:
+        other = previous_results.get((result['case'], result['n_users']))
+        if other is None or 'error' in result or 'error' in other: continue
+
+        comparisons.append({
+            'case': result['case'], 'n_users': result['n_users'],
+            'speedup': result['events_per_sec'] / other['events_per_sec'],
+            'peak_rss_ratio': result['peak_rss_mb'] / other['peak_rss_mb']
+        })
+
+    if 'import_time' in current and 'import_time' in previous:
+        comparisons.append({
+            'case': 'import', 'n_users': None,
+            'speedup': previous['import_time']['seconds'] / current['import_time']['seconds']
+        })
+    return comparisons
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description = 'Benchmark the interlib extractors')
+    parser.add_argument('--users', type = int, nargs = '+', default = list(DEFAULT_USERS))
+    parser.add_argument('--cases', nargs = '+', default = list(CASES), choices = CASES)
+    parser.add_argument('--events-per-user', type = int, default = 50)
+    parser.add_argument('--visibility-density', type = float, default = 0.02)
+    parser.add_argument('--nec-density', type = float, default = 0.1)
+    parser.add_argument('--narrative-elements', type = int, default = 30)
+    parser.add_argument('--n-jobs', type = int, default = 1)
+    parser.add_argument('--seed', type = int, default = 42)
+    parser.add_argument('--timeout', type = float, help = 'the most seconds to wait for each case')
+    parser.add_argument(
+        '--no-import-time', action = 'store_true', help = 'do not measure the import time')
+    parser.add_argument('--output', help = 'write the results to this file (default: stdout)')
+    parser.add_argument('--compare', help = 'a previous results file to compare against')
+    args = parser.parse_args(args)
+
+    results = run_benchmarks(
+        users = args.users,
+        cases = args.cases,
+        events_per_user = args.events_per_user,
+        visibility_density = args.visibility_density,
+        nec_density = args.nec_density,
+        n_narrative_elements = args.narrative_elements,
+        n_jobs = args.n_jobs,
+        seed = args.seed,
+        timeout = args.timeout,
+        import_time = not args.no_import_time
+    )
+
+    if args.compare:
+        with open(args.compare, 'r') as in_file:
+            results['comparison'] = compare(results, json.load(in_file))
+
+    output = json.dumps(results, indent = 2, sort_keys = True)
+    if args.output:
+        with open(args.output, 'w') as out_file:
+            out_file.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
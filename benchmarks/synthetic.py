@@ -0,0 +1,204 @@
+"""
+Synthetic interaction data, in the same (raw) format as the JSON exports
+from the DB (see tests/test_data_files/raw_test_data.json).
+"""
+
+from datetime import datetime as dt, timedelta
+from typing import Dict, Iterator, List, Optional
+
+import json, random, uuid
+
+USER_ACTIONS = [
+    'PLAY_PAUSE_BUTTON_CLICKED', 'NEXT_BUTTON_CLICKED', 'BACK_BUTTON_CLICKED',
+    'SEEK_FORWARD_BUTTON_CLICKED', 'SEEK_BACKWARD_BUTTON_CLICKED', 'VIDEO_SCRUBBED',
+    'VARIABLE_PANEL_NEXT_CLICKED', 'USER_SET_VARIABLE', 'LINK_CHOICE_CLICKED',
+    'SUBTITLES_BUTTON_CLICKED', 'VOLUME_MUTE_TOGGLED', 'FULLSCREEN_BUTTON_CLICKED'
+]
+
+RENDERER_ACTIONS = [
+    'BUTTONS_DEACTIVATED', 'BUTTONS_ACTIVATED', 'START_BEHAVIOUR_PHASE_STARTED',
+    'START_BEHAVIOUR_PHASE_ENDED', 'COMPLETE_BEHAVIOUR_PHASE_STARTED'
+]
+
+# the events considered by the extractors in the benchmarks
+INTERACTION_EVENTS = set(USER_ACTIONS) | {
+    'NARRATIVE_ELEMENT_CHANGE', 'BROWSER_VISIBILITY_CHANGE', 'WINDOW_ORIENTATION_CHANGE'
+}
+
+ALIASES = {event: 'E{0}'.format(idx) for idx, event in enumerate(sorted(INTERACTION_EVENTS))}
+
+EXPERIENCE_ID = '43806773-1227-4cbb-8a4f-aeab81a87f48'
+START_TIME = dt(2019, 8, 5, 6, 0, 0)
+
+
+def narrative_elements(n_narrative_elements: int) -> List[Dict[str, str]]:
+    """ 
+        The narrative elements (nodes) of the synthetic story, each with a 
+        name (romper_to_state) and a (deterministic) representation id.
+    """
+    return [
+        {
+            'name': 'NE_{0:04d}'.format(idx),
+            'id': str(uuid.uuid5(uuid.NAMESPACE_OID, 'interlib-ne-{0}'.format(idx)))
+        }
+        for idx in range(n_narrative_elements)
+    ]
+
+
+def _raw_event(
+    event_id: int, 
+    user: str, 
+    timestamp: dt, 
+    item: str, 
+    action: str, 
+    node: Dict[str, str],
+    from_state: str = 'not_set', 
+    to_state: str = 'not_set'
+) -> Dict:
+    message = {
+        'romper_type': item, 'romper_name': action, 'romper_id': '',
+        'romper_from_state': from_state, 'romper_to_state': to_state,
+        'current_narrative_element': node['id'], 'current_representation': ''
+    }
+    return {
+        'id': event_id, 'experienceid': EXPERIENCE_ID, 'userid': user,
+        'timestamp': timestamp.strftime('%Y-%m-%d %H:%M:%S.%f') + '000',
+        'item': item, 'action': action, 'message': json.dumps(message),
+        'narrativeelement': node['id'], 'representation': ''
+    }
+
+
+def generate_user_events(
+    rng: random.Random,
+    user: str,
+    events_per_user: int,
+    nodes: List[Dict[str, str]],
+    visibility_density: float = 0.02,
+    nec_density: float = 0.1,
+    first_id: int = 0
+) -> List[Dict]:
+    """
+        Generate the raw events for a single user. The user clicks the start 
+        button, then moves through the narrative elements in order while 
+        interacting, occasionally hiding (and then showing) the browser tab.
+
+        :params rng: the random number generator
+        :params user: the user id
+        :params events_per_user: the (approximate) number of events for the user
+        :params nodes: the narrative elements in the story
+        :params visibility_density: the proportion of events that are hidden/visible toggles
+        :params nec_density: the proportion of events that are narrative element changes
+        :params first_id: the id of the first event
+        :returns: a list of raw events
+    """
+    timestamp = START_TIME + timedelta(seconds = rng.uniform(0, 30 * 24 * 60 * 60))
+    node_idx = 0
+    events = [
+        _raw_event(
+            first_id, user, timestamp, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 
+            nodes[0], from_state = 'null', to_state = nodes[0]['name']
+        ),
+        _raw_event(
+            first_id + 1, user, timestamp + timedelta(milliseconds = 50), 
+            'USER_ACTION', 'START_BUTTON_CLICKED', nodes[0]
+        )
+    ]
+    timestamp += timedelta(milliseconds = 50)
+
+    while len(events) < events_per_user:
+        timestamp += timedelta(seconds = rng.expovariate(1 / 8.0))
+        event_id = first_id + len(events)
+        draw = rng.random()
+
+        if draw < visibility_density / 2: # hide the tab, then show it again later
+            events.append(_raw_event(
+                event_id, user, timestamp, 'RENDERER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 
+                nodes[node_idx], from_state = 'visible', to_state = 'hidden'
+            ))
+            timestamp += timedelta(seconds = rng.expovariate(1 / 120.0))
+            events.append(_raw_event(
+                event_id + 1, user, timestamp, 'RENDERER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 
+                nodes[node_idx], from_state = 'hidden', to_state = 'visible'
+            ))
+        elif draw < visibility_density / 2 + nec_density and node_idx + 1 < len(nodes):
+            node_idx += 1
+            events.append(_raw_event(
+                event_id, user, timestamp, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE',
+                nodes[node_idx], from_state = nodes[node_idx - 1]['name'], 
+                to_state = nodes[node_idx]['name']
+            ))
+        elif draw < 0.6:
+            events.append(_raw_event(
+                event_id, user, timestamp, 'USER_ACTION', rng.choice(USER_ACTIONS), nodes[node_idx]
+            ))
+        else:
+            events.append(_raw_event(
+                event_id, user, timestamp, 'RENDERER_ACTION', rng.choice(RENDERER_ACTIONS), 
+                nodes[node_idx]
+            ))
+
+    return events
+
+
+def generate_raw_events(
+    n_users: int,
+    events_per_user: int = 50,
+    visibility_density: float = 0.02,
+    n_narrative_elements: int = 30,
+    nec_density: float = 0.1,
+    seed: Optional[int] = 42
+) -> Iterator[Dict]:
+    """
+        Generate synthetic raw events for a number of users (lazily, a user at a time).
+
+        :params n_users: the number of users
+        :params events_per_user: the (approximate) number of events per user
+        :params visibility_density: the proportion of events that are hidden/visible toggles
+        :params n_narrative_elements: the number of narrative elements in the story
+        :params nec_density: the proportion of events that are narrative element changes
+        :params seed: the random seed, so that the data is reproducible
+        :returns: an iterator of raw events
+    """
+    if n_narrative_elements < 1:
+        raise ValueError('n_narrative_elements should be at least 1: {0}'.format(
+            n_narrative_elements))
+
+    if not 0 <= visibility_density <= 1 or not 0 <= nec_density <= 1:
+        raise ValueError('visibility_density and nec_density should be between 0 and 1')
+
+    rng = random.Random(seed)
+    nodes = narrative_elements(n_narrative_elements)
+
+    event_id = 0
+    for _ in range(n_users):
+        user = str(uuid.UUID(int = rng.getrandbits(128), version = 4))
+        events = generate_user_events(
+            rng, user, events_per_user, nodes, 
+            visibility_density = visibility_density, 
+            nec_density = nec_density,
+            first_id = event_id
+        )
+        event_id += len(events)
+        yield from events
+
+
+def write_raw_events(path: str, n_users: int, **kwargs) -> int:
+    """
+        Write synthetic raw events to a JSON file (the format read by to_dict),
+        the events are streamed to the file rather than held in memory.
+
+        :params path: the file to write to
+        :params n_users: the number of users
+        :params kwargs: passed to generate_raw_events
+        :returns: the number of events written
+    """
+    n_events = 0
+    with open(path, 'w') as out_file:
+        out_file.write('[\n')
+        for event in generate_raw_events(n_users, **kwargs):
+            if n_events > 0: out_file.write(',\n')
+            out_file.write(json.dumps(event))
+            n_events += 1
+        out_file.write('\n]\n')
+
+    return n_events
@@ -1,3 +1,7 @@
 from .sequences import *
 from .statistics import *
-from .slices import *
\ No newline at end of file
+from .slices import *
+from .out_of_core import *
+from .partial import *
+from .narrative import *
+from .windows import *
@@ -0,0 +1,140 @@
+"""
+    Opt-in timing of the stages of the extractors: sorting, splitting the users,
+    dispatching the work to the joblib workers, the per-user computation and
+    merging the results (see BaseExtractor).
+"""
+
+from contextlib import contextmanager
+from typing import Optional, Callable, Dict, List
+
+import heapq, time
+
+
+class Profiler():
+    """
+        Records how long each stage takes. Each stage is recorded as a dict,
+        {'method': ..., 'stage': ..., 'seconds': ..., ...}, which is appended
+        to the records and passed to the callback (if there is one).
+    """
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = False,
+        callback: Optional[Callable[[Dict], None]] = None,
+        n_slowest_users: Optional[int] = 10
+    ) -> None:
+        if callback is not None and not callable(callback):
+            raise TypeError('profile_callback should be callable: {0}'.format(callback))
+
+        self.enabled = enabled or callback is not None
+        self.callback = callback
+        self.n_slowest_users = n_slowest_users
+        self.records = []
+        self.user_costs = {} # {user -> {'seconds': ..., 'n_events': ...}}
+
+    def add(self, record: Dict) -> None:
+        """ record a stage and pass it to the callback """
+        if not self.enabled: return
+
+        self.records.append(record)
+        if self.callback is not None: self.callback(record)
+
+    @contextmanager
+    def stage(self, method: str, stage: str, **fields):
+        """
+            Time the body of the with statement as a stage of method. The
+            record is yielded so further fields (e.g. the event count) can be
+            added to it.
+        """
+        record = {'method': method, 'stage': stage, **fields}
+        start = time.perf_counter()
+        yield record
+        record['seconds'] = time.perf_counter() - start
+        self.add(record)
+
+    def add_parallel(self, method: str, seconds: float, worker_timings: List[Dict]) -> None:
+        """
+            Record the compute and dispatch stages of a parallel run from the
+            timings returned by each worker (see timed_worker). The compute time is
+            the longest running worker, the rest of the wall time is spent
+            pickling the users' events, sending them to the workers and
+            returning the results.
+
+            :params method: the extractor method that was run
+            :params seconds: the wall time of the parallel run
+            :params worker_timings: the timings from each worker
+        """
+        workers = [{
+            'worker': idx,
+            'seconds': timing['end'] - timing['start'],
+            'n_users': len(timing['users']),
+            'n_events': sum(n_events for _, _, n_events in timing['users'])
+        } for idx, timing in enumerate(worker_timings)]
+
+        for timing in worker_timings:
+            for user, user_seconds, n_events in timing['users']:
+                cost = self.user_costs.setdefault(user, {'seconds': 0.0, 'n_events': n_events})
+                cost['seconds'] += user_seconds
+
+        compute_seconds = max((w['seconds'] for w in workers), default = 0.0)
+        slowest_users = heapq.nlargest(
+            self.n_slowest_users,
+            (user_timing for timing in worker_timings for user_timing in timing['users']),
+            key = lambda x: x[1]
+        )
+
+        self.add({
+            'method': method, 'stage': 'dispatch',
+            'seconds': max(seconds - compute_seconds, 0.0),
+            'n_tasks': len(workers)
+        })
+        self.add({
+            'method': method, 'stage': 'compute',
+            'seconds': compute_seconds,
+            'n_users': sum(w['n_users'] for w in workers),
+            'n_events': sum(w['n_events'] for w in workers),
+            'workers': workers,
+            'slowest_users': [
+                {'user': user, 'seconds': user_seconds, 'n_events': n_events}
+                for user, user_seconds, n_events in slowest_users
+            ]
+        })
+
+
+def timed_worker(func, user_chunk, data_chunk, *args):
+    """
+        Run one of the extractors' worker functions a user at a time, timing
+        each of the users.
+
+        This is not quite the same work as an unprofiled run, where func is called
+        once with the whole chunk: here the chunk's events are grouped by user first
+        and func is called once per user, so any per-call work in func (e.g. grouping
+        its events) is repeated for each user. The worker and compute times therefore
+        include that per-call overhead; it's the price of the per-user costs.
+
+        :params func: the worker function, func(user_chunk, data_chunk, *args) -> {user: x},
+            or ({user: x}, an aggregate of the users with a merge, e.g. FunnelCounts)
+        :params user_chunk: the users for this worker
+        :params data_chunk: the events of those users
+        :returns: the results of func and the timings of the worker
+    """
+    start = time.time()
+
+    user_dict = {user: [] for user in user_chunk}
+    for d in data_chunk: user_dict[d['user']].append(d)
+
+    if not user_dict: # the (empty) results in the shape that func returns them
+        return func(user_chunk, data_chunk, *args), {'start': start, 'end': time.time(), 'users': []}
+
+    results, aggregate, user_timings = {}, None, []
+    for user, events in user_dict.items():
+        user_start = time.perf_counter()
+        user_results = func([user], events, *args)
+        if isinstance(user_results, tuple): # the users' aggregates are merged together
+            user_results, user_aggregate = user_results
+            aggregate = user_aggregate if aggregate is None else aggregate.merge(user_aggregate)
+        results.update(user_results)
+        user_timings.append((user, time.perf_counter() - user_start, len(events)))
+
+    if aggregate is not None: results = (results, aggregate)
+    return results, {'start': start, 'end': time.time(), 'users': user_timings}
@@ -1,10 +1,28 @@
-from joblib import cpu_count
 from datetime import datetime as dt
-from typing import Union, Dict, Optional, List
+from typing import Union, Dict, Optional, List, Sequence, Tuple, Callable, Set
 
 import numpy as np
+import time
 
+from ._profiling import Profiler, timed_worker
 from ..util.data import _get_users_clicked_start_button
+from ..util.helpers import is_sorted
+
+# the lower bounds (in seconds) of the short, medium, long and very long pauses
+PAUSE_EDGES = (1, 5, 15, 30)
+PAUSE_TYPES = ('SP', 'MP', 'LP', 'VLP')
+
+# a pause scheme maps each pause type to its lower bound in seconds
+DEFAULT_PAUSE_SCHEME = dict(zip(PAUSE_TYPES, PAUSE_EDGES))
+
+# what to do with the users that have more than max_user_events events
+HEAVY_USER_POLICIES = ('cap', 'isolate', 'skip')
+
+def _as_completion_points(completion_point: Optional[Union[str, Set[str]]]) -> frozenset:
+    """ the completion point(s) as a set, a single completion point is a set of one """
+    if not completion_point: return frozenset()
+    if isinstance(completion_point, str): return frozenset([completion_point])
+    return frozenset(completion_point)
 
 class BaseExtractor():
     """ Base class for all of the extractors """
@@ -12,8 +30,13 @@ class BaseExtractor():
     def __init__(
         self, 
         user_event_dict: Dict[str, List], 
-        completion_point: Optional[str] = None, 
-        n_jobs: Optional[int] = -1
+        completion_point: Optional[Union[str, Set[str]]] = None, 
+        n_jobs: Optional[int] = -1,
+        presorted: Optional[bool] = False,
+        profile: Optional[bool] = False,
+        profile_callback: Optional[Callable[[Dict], None]] = None,
+        max_user_events: Optional[int] = None,
+        heavy_user_policy: Optional[str] = 'cap'
     ):
         if not isinstance(user_event_dict, dict):
             raise TypeError('User Event dictionary is not a dict')
@@ -21,14 +44,45 @@ class BaseExtractor():
         if len(user_event_dict) == 0:
             raise ValueError('User event dictionary must have at least one value or not None')
 
-        if completion_point and not isinstance(completion_point, str):
-            raise TypeError('completion_point should be a str')
+        if completion_point and not (isinstance(completion_point, str) or (
+            isinstance(completion_point, (set, frozenset)) and 
+            all(isinstance(point, str) for point in completion_point))):
+            raise TypeError('completion_point should be a str or a set of str')
 
         if not isinstance(n_jobs, int):
             raise TypeError('n_jobs should be an int')
 
-        self.data = self._sort_events(user_event_dict)
+        if max_user_events is not None and (
+            not isinstance(max_user_events, int) or max_user_events < 1):
+            raise ValueError('max_user_events should be a positive int: {0}'.format(
+                max_user_events))
+
+        if heavy_user_policy not in HEAVY_USER_POLICIES:
+            raise ValueError('heavy_user_policy should be one of {0}: {1}'.format(
+                HEAVY_USER_POLICIES, heavy_user_policy))
+
+        # opt-in timing of each stage, see profile_report
+        self._profiler = Profiler(enabled = profile, callback = profile_callback)
+
+        with self._profiler.stage('__init__', 'sort', n_users = len(user_event_dict)) as record:
+            self.data = self._sort_events(user_event_dict, presorted)
+            if self._profiler.enabled:
+                record['n_events'] = sum(len(events) for events in self.data.values())
+
+        # the users with more than max_user_events events {user -> number of events}
+        self.max_user_events = max_user_events
+        self.heavy_user_policy = heavy_user_policy
+        self.heavy_users = {
+            user: len(events) for user, events in self.data.items() 
+            if max_user_events is not None and len(events) > max_user_events
+        }
+        if heavy_user_policy == 'cap': # only keep the first max_user_events events
+            for user in self.heavy_users:
+                self.data[user] = self.data[user][:max_user_events]
+
+        # a set of completion points is for experiences with multiple endings
         self.completion_point = completion_point
+        self._completion_points = _as_completion_points(completion_point)
         self.n_jobs = n_jobs
 
         if self.completion_point:
@@ -37,22 +91,50 @@ class BaseExtractor():
             self.last_ne = {user: np.nan for user in self.data.keys()}
             self._users_reached_completion_point = {user: False for user in self.data.keys()}
 
-        if self.n_jobs == -1: self._num_cpu = cpu_count()
+        if self.n_jobs == -1: 
+            from joblib import cpu_count
+            self._num_cpu = cpu_count()
         else: self._num_cpu = n_jobs
 
         self._users = set(self.data.keys())
-        self._users_split = self._split_users()
+        with self._profiler.stage('__init__', 'split', n_users = len(self._users)):
+            self._users_split = self._split_users()
+
+    def _sort_events(self, user_event_dict, presorted = False):
+        """ 
+            Sort each user's events by timestamp. Only the users whose events
+            are out of order are sorted, the rest are copied as they are. The lists
+            are always copied (a shallow copy, the events themselves are shared), so
+            changing the caller's lists doesn't change the extractor's and vice versa.
+
+            :params user_event_dict: the user events {user -> [events]}
+            :params presorted: the events are known to be sorted (e.g. from to_dict), 
+                skip checking the order altogether
+            :returns: the sorted user events
+        """
+        if presorted: return {user: list(events) for user, events in user_event_dict.items()}
 
-    def _sort_events(self, user_event_dict):
         data = {}
         for user, events in user_event_dict.items():
-            data[user] = sorted(events, key = lambda x: x['timestamp'])
+            if is_sorted(events): data[user] = list(events)
+            else: data[user] = sorted(events, key = lambda x: x['timestamp'])
         return data
 
     def _split_users(self):
-        """ """
-        split_events = [[] for _ in range(0, self._num_cpu)]
-        splits = np.array_split(list(self._users), self._num_cpu)
+        """ 
+            Split the users (and their events) into a chunk per core. Depending on 
+            the heavy_user_policy, the heavy users are either given a chunk of their
+            own (isolate) or left out altogether (skip).
+        """
+        users, isolated = list(self._users), []
+        if self.heavy_users and self.heavy_user_policy != 'cap':
+            users = [user for user in users if user not in self.heavy_users]
+            if self.heavy_user_policy == 'isolate': isolated = list(self.heavy_users)
+
+        splits = np.array_split(users, self._num_cpu)
+        splits.extend(np.array([user]) for user in isolated)
+
+        split_events = [[] for _ in range(0, len(splits))]
         for idx, split in enumerate(splits):
             for u in split:
                 for e in self.data[u]:
@@ -60,6 +142,78 @@ class BaseExtractor():
 
         return zip(splits, split_events)
 
+    def _run_parallel(
+        self, 
+        func: Callable, 
+        method: str, 
+        splits = None, 
+        args: Optional[Tuple] = (), 
+        verbose: Optional[int] = 0
+    ) -> List[Dict]:
+        """
+            Run one of the worker functions over each split of the users in parallel.
+            When profiling, the split, dispatch and compute stages are recorded.
+
+            :params func: the worker function, func(user_chunk, data_chunk, *args) -> {user: x}
+            :params method: the name of the method running func (for the profile)
+            :params splits: the split users and their events, default is _split_users()
+            :params args: any further arguments to func
+            :params verbose: the level of output passed to the joblib backend
+            :returns: the results from each worker
+        """
+        from joblib import Parallel, delayed # joblib is imported when it's first needed
+
+        parallel = Parallel(n_jobs = self._num_cpu, verbose = verbose)
+
+        if not self._profiler.enabled:
+            if splits is None: splits = self._split_users()
+            return parallel(delayed(func) (u, e, *args) for u, e in splits)
+
+        if splits is None:
+            with self._profiler.stage(method, 'split', n_users = len(self._users)):
+                splits = list(self._split_users())
+
+        start = time.perf_counter()
+        res = parallel(delayed(timed_worker) (func, u, e, *args) for u, e in splits)
+        self._profiler.add_parallel(
+            method, time.perf_counter() - start, [timing for _, timing in res])
+
+        return [results for results, _ in res]
+
+    def profile_report(self) -> List[Dict]:
+        """
+            The stages recorded when profiling (profile = True or a profile_callback), 
+            in the order they were run. Each stage is a dict with the method, the stage 
+            (sort, split, dispatch, compute or merge) and the wall time in seconds. 
+            The compute stage also has the time taken by each worker and the slowest users.
+            To time each user, the workers run the users one at a time when profiling 
+            (see timed_worker), so the compute times include some per-user overhead 
+            that an unprofiled run (one call per chunk) doesn't have.
+
+            :returns: a list of the recorded stages (empty if not profiling)
+        """
+        return list(self._profiler.records)
+
+    def user_costs(self) -> Dict[str, Dict[str, Union[int, float]]]:
+        """
+            The processing time of each user (summed over the methods that have been 
+            run) and their number of events, recorded when profiling.
+
+            :returns: {user -> {'seconds': ..., 'n_events': ...}} (empty if not profiling)
+        """
+        return {user: dict(cost) for user, cost in self._profiler.user_costs.items()}
+
+    @property
+    def skipped_users(self) -> Set[str]:
+        """ the heavy users that are left out of the results (heavy_user_policy = 'skip') """
+        if self.heavy_user_policy != 'skip': return set()
+        return set(self.heavy_users)
+
+    def _flag_skipped(self, results: Dict[str, Dict]) -> Dict[str, Dict]:
+        """ mark the skipped users in the results, {user -> {'skipped': True}} """
+        for user in self.skipped_users: results[user] = {'skipped': True}
+        return results
+
     def _reached_completion_point(self):
         """ """
         reached_end = {}
@@ -75,7 +229,7 @@ class BaseExtractor():
                 last_narrative_element_seen[user] = ne_changes[-1]['data']['romper_to_state']
 
             for ne_change in ne_changes:
-                if ne_change['data']['romper_to_state'] == self.completion_point:
+                if ne_change['data']['romper_to_state'] in self._completion_points:
                     reached_end[user] = True 
                     break
             
@@ -108,8 +262,96 @@ class BaseExtractor():
 
         diff = (next_timestamp - timestamp).total_seconds()
         
-        if 1 <= diff <= 5: return 'SP', diff # 1 -> 5
-        elif 5 < diff <= 15: return 'MP', diff # 6 -> 15
-        elif 15 < diff <= 30: return 'LP', diff # 16 -> 30
-        elif diff > 30: return 'VLP', diff # more than 30
-        else: return 0, diff # base case
\ No newline at end of file
+        if diff < PAUSE_EDGES[0]: return 0, diff # base case
+
+        # SP: 1 -> 5, MP: 6 -> 15, LP: 16 -> 30
+        for pause_type, upper_bound in zip(PAUSE_TYPES, PAUSE_EDGES[1:]):
+            if diff <= upper_bound: return pause_type, diff
+        return PAUSE_TYPES[-1], diff # VLP: more than 30
+
+    @staticmethod
+    def _pause_gaps(
+        timestamps: Sequence[dt],
+        mask: Optional[Sequence[bool]] = None
+    ) -> np.ndarray:
+        """
+            Compute the differences (in seconds) between each pair of consecutive
+            (included) timestamps.
+
+            :params timestamps: the event times (sorted)
+            :params mask: which of the timestamps to include, default is all
+            :returns: an array of the differences in seconds
+        """
+        timestamps = np.asarray(timestamps, dtype = 'datetime64[us]')
+        if mask is not None:
+            timestamps = timestamps[np.asarray(mask, dtype = bool)]
+
+        if np.isnat(timestamps).any():
+            raise ValueError('All timestamps have to be initialised')
+
+        diffs = np.diff(timestamps) / np.timedelta64(1, 's')
+        if (diffs < 0).any():
+            raise ValueError('Next timestamp cannot be before current timestamps')
+
+        return diffs
+
+    @staticmethod
+    def _bucket_pauses(
+        diffs: np.ndarray, 
+        bucket_edges: Sequence[Union[int, float]] = PAUSE_EDGES
+    ) -> np.ndarray:
+        """
+            Vectorised version of _type_of_pause, buckets the differences between
+            timestamps (from _pause_gaps) into pause types in one go.
+
+            The bucket edges are the lower bounds of each type of pause, a
+            difference less than the first edge is not a pause, otherwise 
+            edges[i] < diff <= edges[i + 1] is pause type i (with the first
+            bucket also including edges[0] and the last being unbounded). The
+            defaults give the SP, MP, LP and VLP pauses (PAUSE_TYPES).
+
+            The edges aren't checked here (this runs for every user), they're checked
+            once up front by _check_bucket_edges.
+
+            :params diffs: the differences in seconds
+            :params bucket_edges: the lower bounds of each pause type in seconds
+            :returns: an array with the index of the pause type for each difference 
+            (-1 where there isn't a pause)
+        """
+        pauses = np.digitize(diffs, bucket_edges[1:], right = True)
+        pauses[diffs < bucket_edges[0]] = -1 # base case, not a pause
+
+        return pauses
+
+    @staticmethod
+    def _check_bucket_edges(bucket_edges: Sequence[Union[int, float]], name: str = '') -> None:
+        """ check that the bucket edges (lower bounds of the pause types) are increasing """
+        if len(bucket_edges) == 0 or any(
+            bucket_edges[i] >= bucket_edges[i + 1] for i in range(len(bucket_edges) - 1)
+        ):
+            raise ValueError('{0}bucket_edges should be increasing: {1}'.format(
+                name and 'pause scheme {0} '.format(name), bucket_edges))
+
+    def _check_pause_schemes(self, pause_schemes: Dict[str, Dict[str, float]]) -> None:
+        """
+            Check that the pause schemes are in the format {name -> {pause type -> lower 
+            bound}}, with the lower bounds increasing, e.g. DEFAULT_PAUSE_SCHEME.
+
+            :params pause_schemes: the named pause schemes
+        """
+        if not isinstance(pause_schemes, dict):
+            raise TypeError('pause_schemes should be a dict: {0} ({1})'.format(
+                pause_schemes, type(pause_schemes)))
+
+        if len(pause_schemes) == 0:
+            raise ValueError('pause_schemes cannot be empty: {0}'.format(pause_schemes))
+
+        for name, scheme in pause_schemes.items():
+            if not isinstance(scheme, dict) or len(scheme) == 0:
+                raise TypeError('pause scheme {0} should be a non-empty dict: {1}'.format(
+                    name, scheme))
+            
+            if not all(isinstance(edge, (int, float)) for edge in scheme.values()):
+                raise TypeError('pause scheme {0} edges are not ints or floats'.format(name))
+
+            self._check_bucket_edges(list(scheme.values()), name)
@@ -0,0 +1,504 @@
+"""
+Sparse (users x narrative elements) representations of how the users move through
+the story.
+"""
+
+from .base import BaseExtractor
+from ..util.sketch import QuantileSketch
+
+from array import array
+from collections import Counter
+from heapq import nlargest
+from typing import Optional, Union, Callable, List, Dict, Iterable, Tuple
+
+import numpy as np
+
+NEC = 'NARRATIVE_ELEMENT_CHANGE'
+
+# the from state of the first NEC of a session (there isn't a previous narrative element)
+START_STATES = (None, '', 'null')
+
+
+def _import_sparse():
+    """ scipy is imported when a matrix is first built """
+    from scipy import sparse
+    return sparse
+
+
+class NarrativeElementTimes():
+    """
+        The time each user spent on each narrative element, as a sparse matrix of
+        users (rows) x narrative elements (columns). Only the narrative elements a user
+        visited are stored, so the matrix scales to millions of users and hundreds of
+        narrative elements. A visit with no time (0.0) is still stored.
+    """
+
+    def __init__(
+        self,
+        users: List[str],
+        narrative_elements: List[str],
+        rows: Iterable[int],
+        columns: Iterable[int],
+        times: Iterable[float]
+    ) -> None:
+        """
+            :params users: the user of each row
+            :params narrative_elements: the narrative element of each column
+            :params rows: the row of each (user, narrative element) time
+            :params columns: the column of each time
+            :params times: the times in seconds
+        """
+        sparse = _import_sparse()
+
+        self.users = list(users)
+        self.narrative_elements = list(narrative_elements)
+        self._user_rows = {user: row for row, user in enumerate(self.users)}
+        self._columns = {nec: column for column, nec in enumerate(self.narrative_elements)}
+
+        self.matrix = sparse.csr_matrix(
+            (np.asarray(times, dtype = np.float64), (
+                np.asarray(rows, dtype = np.int32), np.asarray(columns, dtype = np.int32))),
+            shape = (len(self.users), len(self.narrative_elements))
+        )
+        self._csc = None
+
+    @classmethod
+    def from_dict(cls, user_times: Dict[str, Dict[str, float]]) -> 'NarrativeElementTimes':
+        """
+            :params user_times: {user -> {narrative element -> time}}
+            :returns: the sparse matrix of the times
+        """
+        builder = _TimesBuilder()
+        for user, times in user_times.items(): builder.add(user, times)
+        return builder.build()
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.matrix.shape
+
+    def _column_index(self, narrative_element: str) -> int:
+        if narrative_element not in self._columns:
+            raise ValueError('Invalid narrative element: {0}'.format(narrative_element))
+        return self._columns[narrative_element]
+
+    def column(self, narrative_element: str) -> Dict[str, float]:
+        """
+            :params narrative_element: the narrative element
+            :returns: the time each user (that visited it) spent on it {user -> time}
+        """
+        if self._csc is None: self._csc = self.matrix.tocsc()
+        column = self._column_index(narrative_element)
+        start, end = self._csc.indptr[column], self._csc.indptr[column + 1]
+        return {
+            self.users[row]: float(time)
+            for row, time in zip(self._csc.indices[start:end], self._csc.data[start:end])
+        }
+
+    def user(self, user: str) -> Dict[str, float]:
+        """
+            :params user: the user id
+            :returns: the time the user spent on each narrative element {nec -> time}
+        """
+        if user not in self._user_rows:
+            raise ValueError('Invalid user id: {0}'.format(user))
+        row = self._user_rows[user]
+        start, end = self.matrix.indptr[row], self.matrix.indptr[row + 1]
+        return {
+            self.narrative_elements[column]: float(time)
+            for column, time in zip(self.matrix.indices[start:end], self.matrix.data[start:end])
+        }
+
+    def column_counts(self) -> Dict[str, int]:
+        """ :returns: the number of users that visited each narrative element """
+        counts = np.bincount(self.matrix.indices, minlength = len(self.narrative_elements))
+        return dict(zip(self.narrative_elements, counts.tolist()))
+
+    def column_sums(self) -> Dict[str, float]:
+        """ :returns: the total time spent on each narrative element by all of the users """
+        sums = np.bincount(
+            self.matrix.indices, weights = self.matrix.data,
+            minlength = len(self.narrative_elements))
+        return dict(zip(self.narrative_elements, sums.tolist()))
+
+    def column_means(self) -> Dict[str, float]:
+        """ :returns: the average time spent on each narrative element by the users that visited it """
+        counts, sums = self.column_counts(), self.column_sums()
+        return {nec: sums[nec] / counts[nec] if counts[nec] else np.nan for nec in sums}
+
+    def column_stds(self) -> Dict[str, float]:
+        """ :returns: the standard deviation of the time spent on each narrative element """
+        counts, means = self.column_counts(), self.column_means()
+        column_means = np.array([means[nec] for nec in self.narrative_elements])
+        squares = np.bincount( # the squared differences from the mean of each column
+            self.matrix.indices, weights = (self.matrix.data - column_means[self.matrix.indices]) ** 2,
+            minlength = len(self.narrative_elements))
+        return {
+            nec: np.sqrt(squares[column] / counts[nec]) if counts[nec] else np.nan
+            for column, nec in enumerate(self.narrative_elements)
+        }
+
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """ :returns: {user -> {narrative element -> time}} """
+        return {user: self.user(user) for user in self.users}
+
+
+class _TimesBuilder():
+    """
+        collects the (user, narrative element, time) entries in compact arrays and, with 
+        a relative accuracy, a sketch of the times on each narrative element. The builders
+        of each worker are merged, so only the entries and sketches are sent back.
+    """
+
+    def __init__(self, relative_accuracy: Optional[float] = None) -> None:
+        self.users, self.narrative_elements = [], {}
+        self.rows, self.columns, self.times = array('i'), array('i'), array('d')
+        self.relative_accuracy = relative_accuracy
+        self.sketches = {} # {nec -> QuantileSketch}, if there's a relative accuracy
+
+    def add(self, user: str, times: Dict[str, float]) -> None:
+        row = len(self.users)
+        self.users.append(user)
+        for nec, time in times.items():
+            column = self.narrative_elements.setdefault(nec, len(self.narrative_elements))
+            self.rows.append(row)
+            self.columns.append(column)
+            self.times.append(time)
+
+            if self.relative_accuracy is not None:
+                if nec not in self.sketches:
+                    self.sketches[nec] = QuantileSketch(self.relative_accuracy)
+                self.sketches[nec].add(time)
+
+    def merge(self, other: '_TimesBuilder') -> '_TimesBuilder':
+        """ append the users of another builder (e.g. a worker's), after those of this one """
+        columns = np.array([
+            self.narrative_elements.setdefault(nec, len(self.narrative_elements))
+            for nec in other.narrative_elements
+        ], dtype = np.intc)
+
+        self.rows.frombytes(
+            (np.asarray(other.rows, dtype = np.intc) + len(self.users)).astype(np.intc).tobytes())
+        self.columns.frombytes(
+            columns[np.asarray(other.columns, dtype = np.intp)].astype(np.intc).tobytes())
+        self.times.extend(other.times)
+        self.users.extend(other.users)
+
+        for nec, sketch in other.sketches.items():
+            if nec in self.sketches: self.sketches[nec].merge(sketch)
+            else: self.sketches[nec] = sketch
+        return self
+
+    def build(self) -> NarrativeElementTimes:
+        return NarrativeElementTimes(
+            self.users, list(self.narrative_elements), self.rows, self.columns, self.times)
+
+
+class _PathTrie():
+    """ counts the paths, and every prefix of the paths, in a trie of the narrative elements """
+
+    def __init__(self) -> None:
+        self._root = [0, 0, {}] # [paths through the node, paths ending at the node, children]
+
+    def add(self, path: Tuple[str, ...]) -> None:
+        node = self._root
+        node[0] += 1
+        for element in path:
+            node = node[2].setdefault(element, [0, 0, {}])
+            node[0] += 1
+        node[1] += 1
+
+    def merge(self, other: '_PathTrie') -> '_PathTrie':
+        """ add the counts of another trie (e.g. a worker's), whose nodes are taken over """
+        stack = [(self._root, other._root)]
+        while stack:
+            node, other_node = stack.pop()
+            node[0] += other_node[0]
+            node[1] += other_node[1]
+            for element, other_child in other_node[2].items():
+                child = node[2].get(element)
+                if child is None: node[2][element] = other_child
+                else: stack.append((child, other_child))
+        return self
+
+    def _walk(self, max_depth: Optional[int] = None):
+        """ yields (path, node) for each node, depth first """
+        stack = [((), self._root)]
+        while stack:
+            path, node = stack.pop()
+            yield path, node
+            if max_depth is not None and len(path) >= max_depth: continue
+            for element, child in node[2].items(): stack.append((path + (element, ), child))
+
+    def top_paths(self, k: int) -> List[Tuple[Tuple[str, ...], int]]:
+        return nlargest(
+            k, ((path, node[1]) for path, node in self._walk() if node[1] > 0 and path),
+            key = lambda item: item[1])
+
+    def top_prefixes(self, k: int, length: int) -> List[Tuple[Tuple[str, ...], int]]:
+        return nlargest(
+            k, ((path, node[0]) for path, node in self._walk(length) if len(path) == length),
+            key = lambda item: item[1])
+
+
+class _PathShard():
+    """
+        A worker's share of the paths: the narrative elements it has seen, the (from, to)
+        transition counts (the COO triplets of the transition matrix) and a trie of its
+        paths. The shards are merged in the parent, so the paths aren't walked again there.
+    """
+
+    def __init__(self) -> None:
+        self.narrative_elements = {} # {narrative element -> index}
+        self.transitions = Counter() # {(from index, to index) -> count}
+        self.trie = _PathTrie()
+
+    def _index(self, narrative_element: str) -> int:
+        return self.narrative_elements.setdefault(narrative_element, len(self.narrative_elements))
+
+    def add(self, transitions: List[Tuple[str, str]]) -> None:
+        """ :params transitions: a user's (from, to) narrative elements, in order """
+        for from_state, to_state in transitions:
+            if from_state in START_STATES: 
+                self._index(to_state)
+            else:
+                from_index = self._index(from_state)
+                self.transitions[(from_index, self._index(to_state))] += 1
+        self.trie.add(tuple(to_state for _, to_state in transitions))
+
+    def merge(self, other: '_PathShard') -> '_PathShard':
+        """ add another shard (its narrative elements are indexed after those of this one) """
+        indexes = [self._index(narrative_element) for narrative_element in other.narrative_elements]
+        for (from_index, to_index), count in other.transitions.items():
+            self.transitions[(indexes[from_index], indexes[to_index])] += count
+        self.trie.merge(other.trie)
+        return self
+
+    def triplets(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """ :returns: the rows (from), columns (to) and counts of the transitions """
+        n_transitions = len(self.transitions)
+        rows = np.fromiter(
+            (from_index for from_index, _ in self.transitions), dtype = np.int32, count = n_transitions)
+        columns = np.fromiter(
+            (to_index for _, to_index in self.transitions), dtype = np.int32, count = n_transitions)
+        counts = np.fromiter(self.transitions.values(), dtype = np.int64, count = n_transitions)
+        return rows, columns, counts
+
+
+class NarrativePaths(BaseExtractor):
+    """
+        The users' paths through the story, from the NARRATIVE_ELEMENT_CHANGE events
+        (romper_from_state -> romper_to_state): the path of each user, the node to node
+        transition counts and the most frequent paths. The transition counts and the trie 
+        of the paths are built by each worker alongside the paths, then merged.
+    """
+
+    def __init__(
+        self,
+        user_event_dict: Dict[str, List[Dict]],
+        n_jobs: Optional[int] = -1,
+        presorted: Optional[bool] = False,
+        profile: Optional[bool] = False,
+        profile_callback: Optional[Callable[[Dict], None]] = None,
+        max_user_events: Optional[int] = None,
+        heavy_user_policy: Optional[str] = 'cap'
+    ) -> None:
+        BaseExtractor.__init__(
+            self,
+            user_event_dict = user_event_dict,
+            n_jobs = n_jobs,
+            presorted = presorted,
+            profile = profile,
+            profile_callback = profile_callback,
+            max_user_events = max_user_events,
+            heavy_user_policy = heavy_user_policy
+        )
+
+        self._transitions = {} # {user -> [(from, to), ...]}
+        self._encodings = {}
+        self._shard = None # the merged _PathShard of the workers
+
+    def _get_transitions(self, verbose: Optional[int] = 0) -> Dict[str, List[Tuple[str, str]]]:
+        """ the (from, to) narrative elements of each user's NECs, in order """
+        def _nec_transitions(user_chunk, data_chunk):
+            results = {user: [] for user in user_chunk}
+            for event in data_chunk:
+                if event['action_name'] == NEC:
+                    results[event['user']].append((
+                        event['data'].get('romper_from_state'),
+                        event['data']['romper_to_state']
+                    ))
+
+            # the worker's transition counts and paths are counted here, so only the 
+            # shards are merged
+            shard = _PathShard()
+            for transitions in results.values(): shard.add(transitions)
+            return results, shard
+
+        if not self._transitions:
+            self._transitions.update({user: [] for user in self._users})
+            res = self._run_parallel(_nec_transitions, 'get_paths', verbose = verbose)
+
+            with self._profiler.stage('get_paths', 'merge'):
+                self._shard = _PathShard()
+                for worker_transitions, worker_shard in res:
+                    self._transitions.update(worker_transitions)
+                    self._shard.merge(worker_shard)
+
+                # encode each user's path with the index of the narrative elements
+                index = self._shard.narrative_elements
+                for user, transitions in self._transitions.items():
+                    self._encodings[user] = np.fromiter(
+                        (index[to_state] for _, to_state in transitions), 
+                        dtype = np.int32, count = len(transitions))
+        return self._transitions
+
+    @property
+    def narrative_elements(self) -> List[str]:
+        """ the narrative elements, in the order of their index (in the encodings and matrix) """
+        self._get_transitions()
+        return list(self._shard.narrative_elements)
+
+    def get_paths(
+        self,
+        verbose: Optional[int] = 0,
+        user_id: Optional[str] = None
+    ) -> Union[Dict[str, List[str]], List[str]]:
+        """
+            :params verbose: the level of output passed to the joblib backend
+            :params user_id: a specific user to get the path of
+            :returns: the narrative elements each user visited, in order {user -> path}
+        """
+        transitions = self._get_transitions(verbose = verbose)
+        if user_id is not None:
+            if not isinstance(user_id, str):
+                raise TypeError('user_id should be a string: {0} (type: {1})'.format(
+                    user_id, type(user_id)))
+
+            if user_id not in self._users:
+                raise ValueError('Invalid user_id: {0}'.format(user_id))
+
+            return [to_state for _, to_state in transitions[user_id]]
+        return {
+            user: [to_state for _, to_state in user_transitions]
+            for user, user_transitions in transitions.items()
+        }
+
+    def path_encodings(self, verbose: Optional[int] = 0) -> Dict[str, np.ndarray]:
+        """
+            The paths encoded as the index of each narrative element (see narrative_elements),
+            a compact form for large numbers of users.
+
+            :params verbose: the level of output passed to the joblib backend
+            :returns: {user -> array of narrative element indexes}
+        """
+        self._get_transitions(verbose = verbose)
+        return self._encodings
+
+    def transition_matrix(self, verbose: Optional[int] = 0):
+        """
+            The number of times the users moved from one narrative element to another, 
+            as a sparse matrix (from narrative element x to narrative element), indexed 
+            by narrative_elements. The first NEC of a session (with no from state) isn't 
+            a transition.
+
+            :params verbose: the level of output passed to the joblib backend
+            :returns: the transition counts (a scipy.sparse CSR matrix)
+        """
+        sparse = _import_sparse()
+
+        self._get_transitions(verbose = verbose)
+        rows, columns, counts = self._shard.triplets()
+
+        n_elements = len(self._shard.narrative_elements)
+        return sparse.csr_matrix(
+            (counts, (rows, columns)), shape = (n_elements, n_elements))
+
+    def top_paths(
+        self,
+        k: Optional[int] = 10,
+        prefix_length: Optional[int] = None,
+        verbose: Optional[int] = 0
+    ) -> List[Tuple[Tuple[str, ...], int]]:
+        """
+            The most frequent paths through the story, counted in a trie of the paths.
+
+            :params k: the number of paths
+            :params prefix_length: if given, the most frequent starts of the paths with this
+                many narrative elements (counting every user whose path is at least that
+                long), otherwise the most frequent full paths
+            :params verbose: the level of output passed to the joblib backend
+            :returns: [(path, number of users), ...] most frequent first
+        """
+        if not isinstance(k, int) or k < 1:
+            raise ValueError('k should be a positive int: {0}'.format(k))
+
+        if prefix_length is not None and (not isinstance(prefix_length, int) or prefix_length < 1):
+            raise ValueError('prefix_length should be a positive int: {0}'.format(prefix_length))
+
+        self._get_transitions(verbose = verbose)
+        if prefix_length is None: return self._shard.trie.top_paths(k)
+        return self._shard.trie.top_prefixes(k, prefix_length)
+
+
+class FunnelCounts():
+    """
+        The aggregate of a funnel (see Statistics.funnel): the number of users that reached
+        each of the ordered points, the drop off after each point and the distribution of
+        the (hidden time adjusted) time between the points. The counts of each worker (or 
+        partition) are merged with merge.
+    """
+
+    def __init__(self, points: Iterable[str]) -> None:
+        """ :params points: the ordered narrative elements (romper_to_state) of the funnel """
+        self.points = tuple(points)
+        self.n_users = 0
+        self.reached = np.zeros(len(self.points), dtype = np.int64)
+        self.step_times = [QuantileSketch() for _ in self.points]
+
+    def add(self, user_funnel: Dict) -> 'FunnelCounts':
+        """
+            :params user_funnel: a user's funnel, {'steps_reached': ..., 'step_times': [...]}
+            :returns: the counts
+        """
+        self.n_users += 1
+        self.reached[:user_funnel['steps_reached']] += 1
+        for sketch, time in zip(self.step_times, user_funnel['step_times']): sketch.add(time)
+        return self
+
+    def merge(self, other: 'FunnelCounts') -> 'FunnelCounts':
+        """
+            :params other: the counts of another worker (or partition) for the same points
+            :returns: the counts
+        """
+        if not isinstance(other, FunnelCounts):
+            raise TypeError('Can only merge FunnelCounts: {0}'.format(type(other)))
+
+        if other.points != self.points:
+            raise ValueError('Cannot merge funnels of different points: {0}, {1}'.format(
+                self.points, other.points))
+
+        self.n_users += other.n_users
+        self.reached += other.reached
+        for sketch, other_sketch in zip(self.step_times, other.step_times): sketch.merge(other_sketch)
+        return self
+
+    @property
+    def drop_off(self) -> np.ndarray:
+        """ the number of users that reached each point but not the next one """
+        return self.reached - np.append(self.reached[1:], 0)
+
+    def to_list(self) -> List[Dict[str, Union[str, int, float]]]:
+        """
+            :returns: for each point, the number of users that reached it, the proportion of
+            all of the users, the drop off after it and the median time from the previous
+            point (or the start of the session, for the first point)
+        """
+        return [
+            {
+                'point': point, 'reached': int(reached), 
+                'proportion': reached / self.n_users if self.n_users else 0.0,
+                'drop_off': int(drop_off), 'median_step_time': sketch.quantile(0.5)
+            }
+            for point, reached, drop_off, sketch in zip(
+                self.points, self.reached, self.drop_off, self.step_times)
+        ]
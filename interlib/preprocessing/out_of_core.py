@@ -0,0 +1,138 @@
+"""
+Run the extractors over datasets that are larger than memory, one partition of
+users at a time (see interlib.util.partitions).
+"""
+
+from .statistics import Statistics
+from .sequences import Sequences
+from ..util.data import to_parquet
+
+from typing import Optional, Union, Callable, Iterable, Dict, List
+
+import json, os
+
+import numpy as np
+
+EXTRACTORS = ('statistics', 'sequences')
+
+
+class JSONLinesSink():
+    """
+        Writes the results of each partition to a JSON Lines file, a line per user:
+        {key_name: user, ...statistics} or {key_name: user, value_name: sequence}
+    """
+
+    def __init__(self, path: str, key_name: Optional[str] = 'user', value_name: Optional[str] = 'sequence'):
+        self.path = path
+        self.key_name = key_name
+        self.value_name = value_name
+        self._out_file = open(path, 'w')
+
+    def __call__(self, results: Dict[str, Union[Dict, List]]) -> None:
+        for user, value in results.items():
+            if isinstance(value, dict): row = {self.key_name: user, **value}
+            else: row = {self.key_name: user, self.value_name: value}
+            self._out_file.write(json.dumps(row, default = _to_json) + '\n')
+
+    def close(self) -> None:
+        self._out_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ParquetSink():
+    """ Writes the results of each partition to a Parquet file in a directory (see to_parquet) """
+
+    def __init__(self, out_dir: str, key_name: Optional[str] = 'user', value_name: Optional[str] = 'sequence'):
+        self.out_dir = out_dir
+        self.key_name = key_name
+        self.value_name = value_name
+        self._n_parts = 0
+        os.makedirs(out_dir, exist_ok = True)
+
+    def __call__(self, results: Dict[str, Union[Dict, List]]) -> None:
+        if not results: return
+        to_parquet(
+            results, os.path.join(self.out_dir, 'part-{0:05d}.parquet'.format(self._n_parts)),
+            key_name = self.key_name, value_name = self.value_name)
+        self._n_parts += 1
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _to_json(value):
+    """ convert the numpy values in the statistics so they can be written as JSON """
+    if isinstance(value, np.generic): return value.item()
+    raise TypeError('Object of type {0} is not JSON serializable'.format(type(value)))
+
+
+def process_partitions(
+    partitions: Iterable[Dict[str, List]],
+    extractor: Optional[Union[str, Callable[[Dict[str, List]], Dict]]] = 'statistics',
+    sink: Optional[Callable[[Dict], None]] = None,
+    extractor_kwargs: Optional[Dict] = None,
+    check_partitions: Optional[bool] = False,
+    **method_kwargs
+) -> Optional[Dict]:
+    """
+        Run an extractor over each partition of the users, passing the results of each
+        partition to the sink. Only one partition (and its results) is held in memory
+        at a time, as long as the results are passed to a sink.
+
+        :params partitions: the partitions, {user -> events}, e.g. from iter_partitions
+        :params extractor: statistics (Statistics.calculate_statistics), sequences
+            (Sequences.get_sequences) or a function from {user -> events} to {user -> results}
+        :params sink: called with the results of each partition, e.g. JSONLinesSink. If
+            there isn't a sink then the results are collected and returned.
+        :params extractor_kwargs: passed to the extractor when it's created, e.g. n_jobs
+        :params check_partitions: check that each user is only in one partition (for 
+            debugging your own partitions, those of iter_partitions are by construction),
+            this keeps every user id seen so far in memory
+        :params method_kwargs: passed to calculate_statistics or get_sequences, e.g.
+            interaction_events
+        :returns: the results of all of the partitions {user -> results}, if there isn't a sink
+    """
+    if isinstance(extractor, str) and extractor not in EXTRACTORS:
+        raise ValueError('extractor should be one of {0} or a function: {1}'.format(
+            EXTRACTORS, extractor))
+
+    if not isinstance(extractor, str) and not callable(extractor):
+        raise TypeError('extractor should be one of {0} or a function: {1}'.format(
+            EXTRACTORS, extractor))
+
+    extractor_kwargs = {'n_jobs': 1, **(extractor_kwargs or {})}
+
+    all_results = {} if sink is None else None
+    seen_users = set() if check_partitions else None
+    for user_events in partitions:
+        if not user_events: continue
+
+        if check_partitions: # each user's events have to be in a single partition
+            repeated_users = seen_users.intersection(user_events.keys())
+            if repeated_users:
+                raise ValueError('Users are in more than one partition: {0}'.format(repeated_users))
+            seen_users.update(user_events.keys())
+
+        if extractor == 'statistics':
+            results = Statistics(user_events, **extractor_kwargs).calculate_statistics(
+                **method_kwargs)
+        elif extractor == 'sequences':
+            results = Sequences(user_events, **extractor_kwargs).get_sequences(**method_kwargs)
+        else:
+            results = extractor(user_events, **method_kwargs)
+
+        if sink is None: all_results.update(results)
+        else: sink(results)
+
+    return all_results
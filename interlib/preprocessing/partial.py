@@ -0,0 +1,395 @@
+"""
+Mergeable partial statistics, so that a user's statistics can be computed from shards
+of their events (e.g. a partition per day) on different workers and then reduced.
+"""
+
+from .base import BaseExtractor, DEFAULT_PAUSE_SCHEME, _as_completion_points
+from .statistics import (
+    NEC, BVC, _active_time, _nec_time_statistics, _event_statistics, _endpoint_statistics)
+
+from datetime import datetime as dt
+from collections import defaultdict
+from typing import Optional, Union, Tuple, List, Dict, Set
+
+import numpy as np
+
+
+class PartialStatistics():
+    """
+        The statistics (see Statistics.calculate_statistics) of one user over a shard of
+        their events, in a form that can be merged with the other shards.
+
+        Alongside the counts, a partial keeps the state that is open at the edges of the
+        shard: the hidden period that hasn't been followed by a visible event, the NEC
+        span that hasn't reached the next NEC (and the last BVC event before the first 
+        NEC, which can end the previous shard's span) and the first and last events 
+        counted in the pauses. The times of the completion points and the NEC spans are
+        only known once the hidden periods around them are, so they're kept as points
+        (see _point) and put on the active clock (see statistics._visibility) by finalize.
+        The hidden times and spans are kept in order so that finalize sums them in the 
+        same order as a single run, and gives identical results.
+
+        merge is associative, so the shards can be reduced in any grouping, but the shards
+        that are merged have to be next to each other in time (merge_partial_statistics
+        puts each user's shards in order before merging them).
+    """
+
+    def __init__(
+        self,
+        user: str,
+        interaction_events: Set[str],
+        completion_point: Optional[Union[str, Set[str]]] = None,
+        include_link_choices: Optional[bool] = False,
+        pauses_include_events: Optional[Set] = frozenset(),
+        pauses_exclude_events: Optional[Set] = frozenset(),
+        include_user_set_variables: Optional[bool] = False,
+        narrative_element_durations: Optional[Dict[str, float]] = None
+    ) -> None:
+        """ an empty partial (no events), see from_events """
+        self.user = user
+        self.interaction_events = frozenset(interaction_events)
+        self.completion_point = completion_point
+        self._completion_points = _as_completion_points(completion_point)
+        self.include_link_choices = include_link_choices
+        self.pauses_include_events = frozenset(pauses_include_events)
+        self.pauses_exclude_events = frozenset(pauses_exclude_events)
+        self.include_user_set_variables = include_user_set_variables
+        self.narrative_element_durations = narrative_element_durations
+
+        self.n_events = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+        # hidden time: the hidden periods that have ended, the start of the one still 
+        # open and the first visible event (and whether it ended a hidden period)
+        self.hidden_times = []
+        self.hidden_since = None
+        self.first_visible = None
+        self.first_visible_ends_hidden = False
+
+        # time to completion: the point the completion point was (last) reached
+        self.reach_end = False
+        self.completion = None
+        self.endpoint_hits = {} # {completion point -> point}, see _endpoint_statistics
+        self.last_ne_seen = None
+
+        # NEC time: the closed spans (node, start point, end point) in order, the open 
+        # span at the end (node, start point, last BVC point or None) and the first NEC 
+        # and the last BVC event before it
+        self.nec_spans = []
+        self.open_span = None
+        self.first_nec = None
+        self.leading_bvc = None
+
+        # pauses: the counts between the included events and the edges
+        self.pause_counts = np.zeros(len(DEFAULT_PAUSE_SCHEME), dtype = np.int64)
+        self.first_included = None
+        self.last_included = None
+
+        self.event_counts = {event: 0 for event in self.interaction_events}
+
+    @classmethod
+    def from_events(
+        cls,
+        user: str,
+        events: List[Dict],
+        interaction_events: Set[str],
+        **params
+    ) -> 'PartialStatistics':
+        """
+            Build the partial statistics of a user from a shard of their events.
+
+            :params user: the user id
+            :params events: the shard of the user's events (sorted by timestamp)
+            :params interaction_events: the events to count in the statistics
+            :params params: completion_point, include_link_choices, pauses_include_events,
+                pauses_exclude_events, include_user_set_variables and
+                narrative_element_durations (as in Statistics)
+            :returns: the partial statistics
+        """
+        partial = cls(user, interaction_events, **params)
+        if len(events) == 0: return partial
+
+        partial.n_events = len(events)
+        partial.first_timestamp = events[0]['timestamp']
+        partial.last_timestamp = events[-1]['timestamp']
+
+        included = []
+        for event in events:
+            action_name, timestamp = event['action_name'], event['timestamp']
+
+            if action_name == BVC:
+                to_state = event['data']['romper_to_state']
+                if to_state == 'hidden' and partial.hidden_since is None:
+                    partial.hidden_since = timestamp
+                elif to_state == 'visible':
+                    if partial.first_visible is None: 
+                        partial.first_visible = timestamp
+                        partial.first_visible_ends_hidden = partial.hidden_since is not None
+                    if partial.hidden_since is not None:
+                        partial.hidden_times.append(
+                            (timestamp - partial.hidden_since).total_seconds())
+                        partial.hidden_since = None
+
+            if event['action_type'] == 'STORY_NAVIGATION':
+                partial.last_ne_seen = event['data']['romper_to_state']
+                if partial.last_ne_seen in partial._completion_points:
+                    partial.reach_end = True
+                    partial.completion = partial._point(timestamp)
+                    partial.endpoint_hits.pop(partial.last_ne_seen, None)
+                    partial.endpoint_hits[partial.last_ne_seen] = partial.completion
+
+            if action_name == NEC:
+                point = partial._point(timestamp)
+                if partial.first_nec is None: partial.first_nec = point
+                if partial.open_span is not None:
+                    partial.nec_spans.append(partial.open_span[:2] + (point, ))
+                partial.open_span = (event['data']['romper_to_state'], point, None)
+            elif action_name == BVC:
+                point = partial._point(timestamp)
+                if partial.open_span is None: partial.leading_bvc = point
+                else: partial.open_span = partial.open_span[:2] + (point, )
+
+            if ((event['action_type'] == 'USER_ACTION' or
+                 action_name in partial.pauses_include_events) and
+                action_name not in partial.pauses_exclude_events):
+                included.append(timestamp)
+
+            if action_name in partial.event_counts:
+                partial.event_counts[action_name] += 1
+
+        if included:
+            partial.first_included, partial.last_included = included[0], included[-1]
+            partial.pause_counts += _count_pauses(included)
+
+        return partial
+
+    def _point(self, timestamp: dt) -> Tuple:
+        """
+            The state of the hidden time at an event, to put it on the active clock once 
+            the rest of the user's events are known: (timestamp, the number of hidden 
+            periods ended before it, the start of the hidden period it's in and whether
+            it's before the shard's first visible event)
+        """
+        return (timestamp, len(self.hidden_times), self.hidden_since, self.first_visible is None)
+
+    def _shift(self, point: Tuple, first: 'PartialStatistics') -> Tuple:
+        """ a point of this shard, as a point of the shards merged after the first """
+        timestamp, n_hidden, hidden_since, leading = point
+        if leading: # the first's open hidden period (if any) runs to this shard's first visible
+            if first.hidden_since is not None: hidden_since = first.hidden_since
+            return (timestamp, len(first.hidden_times), hidden_since, first.first_visible is None)
+
+        if first.hidden_since is not None and not self.first_visible_ends_hidden: 
+            n_hidden += 1 # the hidden period ended by this shard's first visible
+        return (timestamp, len(first.hidden_times) + n_hidden, hidden_since, False)
+
+    def _clock(self, point: Tuple) -> float:
+        """ the time of a point on the active clock (see statistics._visibility) """
+        timestamp, n_hidden, hidden_since, _ = point
+        if n_hidden == len(self.hidden_times): hidden_since = None # never visible again
+        return _active_time(
+            timestamp, self.first_timestamp, sum(self.hidden_times[:n_hidden]), hidden_since)
+
+    def _check_compatible(self, other: 'PartialStatistics') -> None:
+        if not isinstance(other, PartialStatistics):
+            raise TypeError('Can only merge PartialStatistics: {0}'.format(type(other)))
+
+        if other.user != self.user:
+            raise ValueError('Cannot merge the statistics of different users: {0}, {1}'.format(
+                self.user, other.user))
+
+        if self._params() != other._params():
+            raise ValueError('Cannot merge statistics calculated with different parameters')
+
+    def _params(self) -> Tuple:
+        return (
+            self.interaction_events, self.completion_point, self.include_link_choices,
+            self.pauses_include_events, self.pauses_exclude_events,
+            self.include_user_set_variables, self.narrative_element_durations
+        )
+
+    def _copy(self) -> 'PartialStatistics':
+        partial = PartialStatistics(self.user, self.interaction_events)
+        partial.__dict__.update(self.__dict__)
+        partial.hidden_times = list(self.hidden_times)
+        partial.nec_spans = list(self.nec_spans)
+        partial.pause_counts = self.pause_counts.copy()
+        partial.event_counts = dict(self.event_counts)
+        partial.endpoint_hits = dict(self.endpoint_hits)
+        return partial
+
+    def merge(self, other: 'PartialStatistics') -> 'PartialStatistics':
+        """
+            Merge with the partial statistics of another shard of the user's events.
+
+            :params other: the partial statistics of the other shard
+            :returns: the partial statistics of both shards (neither is changed)
+        """
+        self._check_compatible(other)
+        if other.n_events == 0: return self._copy()
+        if self.n_events == 0: return other._copy()
+
+        # the shards are joined in time order
+        first, second = (self, other)
+        if other.first_timestamp < self.first_timestamp: first, second = (other, self)
+
+        if first.last_timestamp > second.first_timestamp:
+            raise ValueError('The shards of {0} overlap in time: {1} - {2}, {3} - {4}'.format(
+                self.user, first.first_timestamp, first.last_timestamp,
+                second.first_timestamp, second.last_timestamp))
+
+        merged = first._copy()
+        merged.n_events += second.n_events
+        merged.last_timestamp = second.last_timestamp
+
+        # the points of the second shard, with the hidden time of the first before them
+        shift = lambda point: second._shift(point, first)
+
+        if second.reach_end:
+            merged.reach_end = True
+            merged.completion = shift(second.completion)
+            for point, hit in second.endpoint_hits.items():
+                merged.endpoint_hits.pop(point, None)
+                merged.endpoint_hits[point] = shift(hit)
+        if second.last_ne_seen is not None: merged.last_ne_seen = second.last_ne_seen
+
+        # the last BVC event before the second shard's first NEC can end the open span
+        if second.leading_bvc is not None:
+            if merged.open_span is not None:
+                merged.open_span = merged.open_span[:2] + (shift(second.leading_bvc), )
+            elif merged.first_nec is None: merged.leading_bvc = shift(second.leading_bvc)
+
+        if second.first_nec is not None:
+            if merged.open_span is not None:
+                merged.nec_spans.append(merged.open_span[:2] + (shift(second.first_nec), ))
+            if merged.first_nec is None: merged.first_nec = shift(second.first_nec)
+            merged.nec_spans.extend(
+                (nec, shift(start), shift(end)) for nec, start, end in second.nec_spans)
+            nec, start, end = second.open_span
+            merged.open_span = (nec, shift(start), None if end is None else shift(end))
+
+        # the hidden period left open is ended by the second shard's first visible event
+        # (replacing the period that event ends in the second shard, if there is one)
+        second_hidden = second.hidden_times
+        if first.hidden_since is not None and second.first_visible is not None:
+            second_hidden = [(second.first_visible - first.hidden_since).total_seconds()] + (
+                second_hidden[1:] if second.first_visible_ends_hidden else second_hidden)
+        merged.hidden_times.extend(second_hidden)
+
+        if first.first_visible is None and second.first_visible is not None:
+            merged.first_visible = second.first_visible
+            merged.first_visible_ends_hidden = (
+                second.first_visible_ends_hidden or first.hidden_since is not None)
+        if second.first_visible is not None or first.hidden_since is None:
+            merged.hidden_since = second.hidden_since
+
+        # the pause between the last included event of the first shard and the first
+        # included event of the second
+        merged.pause_counts += second.pause_counts
+        if second.first_included is not None:
+            if merged.last_included is not None:
+                merged.pause_counts += _count_pauses(
+                    [merged.last_included, second.first_included])
+            else:
+                merged.first_included = second.first_included
+            merged.last_included = second.last_included
+
+        for event, count in second.event_counts.items():
+            merged.event_counts[event] += count
+
+        return merged
+
+    def finalize(self) -> Dict[str, Union[int, float]]:
+        """
+            :returns: the statistics of the user, as returned by Statistics.calculate_statistics
+        """
+        if self.n_events == 0:
+            return {
+                'hidden_time': 0.0, 'raw_session_length': 0.0, 'avg_nec_time': 0.0,
+                'std_nec_time': 0.0, 'med_nec_time': 0.0, 'session_length': 0.0,
+                **{pause: 0 for pause in DEFAULT_PAUSE_SCHEME},
+                **{event: 0 for event in self.interaction_events}
+            }
+
+        # (the hidden period still open isn't ended by a visible event, so isn't counted)
+        hidden_time = np.sum(self.hidden_times)
+        raw_session_length = (self.last_timestamp - self.first_timestamp).total_seconds()
+        results = {'hidden_time': hidden_time}
+
+        if self.completion_point:
+            if not self.reach_end:
+                results['time_to_completion'] = 0.0
+            else:
+                results['time_to_completion'] = self._clock(self.completion)
+            results.update({
+                'reach_end': self.reach_end,
+                'last_ne_seen': np.nan if self.last_ne_seen is None else self.last_ne_seen
+            })
+
+            if not isinstance(self.completion_point, str):
+                results.update(_endpoint_statistics({
+                    point: self._clock(hit) for point, hit in self.endpoint_hits.items()}))
+
+        results['raw_session_length'] = raw_session_length
+
+        # the last NEC span runs to the last BVC event (if there is one)
+        times = defaultdict(float)
+        nec_spans = list(self.nec_spans)
+        if self.open_span is not None and self.open_span[2] is not None:
+            nec_spans.append(self.open_span)
+        for nec, start, end in nec_spans: times[nec] += self._clock(end) - self._clock(start)
+        results.update(_nec_time_statistics(times, self.narrative_element_durations))
+
+        results['session_length'] = raw_session_length - hidden_time
+
+        # the pauses are measured from the first event
+        pause_counts = self.pause_counts.copy()
+        if self.first_included is not None:
+            pause_counts += _count_pauses([self.first_timestamp, self.first_included])
+        results.update({
+            pause: int(count) for pause, count in zip(DEFAULT_PAUSE_SCHEME, pause_counts)})
+
+        results.update(_event_statistics(
+            self.event_counts, self.include_link_choices, self.include_user_set_variables))
+        return results
+
+
+def _count_pauses(timestamps: List[dt]) -> np.ndarray:
+    """ the number of each type of pause (DEFAULT_PAUSE_SCHEME) between the timestamps """
+    pauses = BaseExtractor._bucket_pauses(
+        BaseExtractor._pause_gaps(timestamps), list(DEFAULT_PAUSE_SCHEME.values()))
+    return np.bincount(pauses[pauses >= 0], minlength = len(DEFAULT_PAUSE_SCHEME))
+
+
+def merge_partial_statistics(
+    *shards: Dict[str, PartialStatistics]
+) -> Dict[str, PartialStatistics]:
+    """
+        Merge the partial statistics of each shard (e.g. from Statistics.partial_statistics),
+        a user can be in any number of the shards and the shards can be in any order.
+
+        :params shards: the partial statistics of each shard {user -> partial}
+        :returns: the merged partial statistics {user -> partial}
+    """
+    user_partials = defaultdict(list)
+    for shard in shards:
+        for user, partial in shard.items(): user_partials[user].append(partial)
+
+    merged = {}
+    for user, partials in user_partials.items():
+        # (the empty shards don't have a timestamp, they are merged first)
+        partials.sort(key = lambda p: (p.n_events > 0, p.first_timestamp or dt.min))
+        merged[user] = partials[0]
+        for partial in partials[1:]: merged[user] = merged[user].merge(partial)
+    return merged
+
+
+def finalize_statistics(
+    partials: Dict[str, PartialStatistics]
+) -> Dict[str, Dict[str, Union[int, float]]]:
+    """
+        :params partials: the (merged) partial statistics {user -> partial}
+        :returns: the statistics of each user, as returned by Statistics.calculate_statistics
+    """
+    return {user: partial.finalize() for user, partial in partials.items()}
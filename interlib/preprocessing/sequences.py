@@ -2,14 +2,12 @@
 
 """
 
-from .base import BaseExtractor
+from .base import BaseExtractor, DEFAULT_PAUSE_SCHEME
 from ._event_handler import EventHandler
 
 from datetime import datetime as dt
 from collections import Counter, defaultdict
 from typing import Optional, Union, List, Set, Dict, Counter
-from joblib import Parallel, delayed
-from nltk import ngrams
 
 
 class SequenceError(Exception):
@@ -24,10 +22,17 @@ class SequenceError(Exception):
 
 class Sequences(BaseExtractor):
 
-    def __init__(self, user_event_dict, completion_point=None, n_jobs=-1):
-        super().__init__(user_event_dict, completion_point=completion_point, n_jobs=n_jobs)
+    def __init__(
+        self, user_event_dict, completion_point=None, n_jobs=-1, presorted=False, 
+        profile=False, profile_callback=None, max_user_events=None, heavy_user_policy='cap'
+    ):
+        super().__init__(
+            user_event_dict, completion_point=completion_point, n_jobs=n_jobs, presorted=presorted,
+            profile=profile, profile_callback=profile_callback, 
+            max_user_events=max_user_events, heavy_user_policy=heavy_user_policy)
 
         self._sequences = {}
+        self._sequence_variants = {}
 
     def _compress_events(self, sequence: List[str], compress_event: str = 'NEC') -> List[str]:
         """ """
@@ -71,59 +76,105 @@ class Sequences(BaseExtractor):
         compress: Optional[bool] = True,
         compress_event: Optional[str] = None,
         categories: Optional[Dict[str, str]] = None,
-        time_threshold: Optional[Union[float, int]] = None,
+        time_threshold: Optional[Union[float, int, List[Union[float, int]]]] = None,
+        pause_schemes: Optional[Dict[str, Dict[str, float]]] = None,
         verbose: Optional[int] = 0
     ) -> Dict[str, Dict]:
         """ 
         
-        :params time_threshold: upper limit in seconds (not minutes!)
+        :params time_threshold: upper limit in seconds (not minutes!). A list of
+            thresholds can be passed, e.g. [60, 300, 600], in which case each user's
+            sequence is extracted once and the offsets where each threshold is crossed
+            are recorded, the result is then {threshold -> {user -> sequence}}
+        :params pause_schemes: named pause schemes, in the format {name -> {pause type -> 
+            lower bound in seconds}}, e.g. {'default': {'SP': 1, 'MP': 5, 'LP': 15, 'VLP': 30}}.
+            The sequences for all of the schemes are built from a single pass over the events
+            and the result is keyed by scheme: {name -> {user -> sequence}}
+        :returns: {user -> sequence}. A heavy user that was skipped (heavy_user_policy
+            = 'skip') also gets an empty sequence, which looks the same as a user with
+            no interaction events: check skipped_users to tell them apart.
         """
+        multiple_thresholds = isinstance(time_threshold, list)
+        if multiple_thresholds: thresholds = sorted(set(time_threshold))
+        elif time_threshold: thresholds = [time_threshold]
+        else: thresholds = []
+
+        schemes = pause_schemes if pause_schemes else {None: DEFAULT_PAUSE_SCHEME}
+
+        def _reshape(nested):
+            """ {scheme -> {threshold -> X}} into the shape requested by the parameters """
+            if not multiple_thresholds:
+                nested = {name: t_x[time_threshold or None] for name, t_x in nested.items()}
+            return nested if pause_schemes else nested[None]
+
         def _seq(user_chunk, data_chunk, e_handler):
             user_dict = {user: [] for user in user_chunk}
             for d in data_chunk: user_dict[d['user']].append(d)
 
-            results = {user: [] for user in user_chunk}
+            results = {
+                user: {name: {t: [] for t in (thresholds or [None])} for name in schemes}
+                for user in user_chunk
+            }
             nec = 'NARRATIVE_ELEMENT_CHANGE'
 
             for user, events in user_dict.items():
                 if len(events) < 1: # if there is no events, just continue
                     continue
                 
-                if time_threshold:
-                    first_event_ts = None
-
-                previous_timestamp = None 
-                for idx, event in enumerate(events): # for each event in the users events
-                    if idx == 0: # if it's the first timestamp
-                        first_event_ts = event['timestamp']
-                    
+                sequences = {name: [] for name in schemes}
+                offsets = {name: {} for name in schemes} # {threshold -> length when crossed}
+                remaining_thresholds = list(thresholds)
+                first_event_ts = events[0]['timestamp']
+
+                # pauses are tracked between the events that are being tracked and
+                # that are to be included in the sequence, so classify them all in one go
+                captured = [event['action_name'] in interaction_events for event in events]
+                gaps = self._pause_gaps([event['timestamp'] for event in events], captured)
+                pauses = {
+                    name: self._bucket_pauses(gaps, list(scheme.values()))
+                    for name, scheme in schemes.items()
+                }
+                pause_types = {name: list(scheme.keys()) for name, scheme in schemes.items()}
+
+                n_captured = 0
+                for event, is_captured in zip(events, captured): # for each of the users events
                     # if the event is one that should be captured
-                    if event['action_name'] in interaction_events:
-                        
-                        # pauses are tracked between the events that are being tracked and
-                        # that are to be included in the sequence
-                        if previous_timestamp == None: 
-                            previous_timestamp = event['timestamp']
-                        
-                        pause_type, _ = self._type_of_pause(
-                            previous_timestamp, event['timestamp']
-                        )
-                        if pause_type != 0:
-                            results[user].append(pause_type)
-                        previous_timestamp = event['timestamp']
-
-                        results[user].append(e_handler.process_event(event))
+                    if is_captured:
+                        processed_event = e_handler.process_event(event)
+
+                        for name, sequence in sequences.items():
+                            # the pause before this event (there isn't one before the first)
+                            if n_captured > 0 and pauses[name][n_captured - 1] >= 0:
+                                sequence.append(pause_types[name][pauses[name][n_captured - 1]])
+                            sequence.append(processed_event)
+                        n_captured += 1
                     
-                    if (time_threshold and 
-                        (event['timestamp'] - first_event_ts).total_seconds() > time_threshold):
-                        # if we've hit the threshold provided
-                        break
-                
-                if compress:
-                    results[user] = self._compress_events(results[user], compress_event)
+                    if remaining_thresholds:
+                        elapsed = (event['timestamp'] - first_event_ts).total_seconds()
+
+                        # record the offset for each of the thresholds that have been hit
+                        while remaining_thresholds and elapsed > remaining_thresholds[0]:
+                            t = remaining_thresholds.pop(0)
+                            for name, sequence in sequences.items():
+                                offsets[name][t] = len(sequence)
+                        
+                        if not remaining_thresholds: # we've hit all of the thresholds
+                            break
                 
-                if categories:
-                    results[user] = self._categorize_sequence(results[user], categories)
+                for name, sequence in sequences.items():
+                    # any thresholds that were not reached get the whole sequence
+                    for t in remaining_thresholds: offsets[name][t] = len(sequence)
+
+                    for t in (thresholds or [None]):
+                        user_seq = sequence[:offsets[name][t]] if t is not None else sequence
+                    
+                        if compress:
+                            user_seq = self._compress_events(user_seq, compress_event)
+                    
+                        if categories:
+                            user_seq = self._categorize_sequence(user_seq, categories)
+
+                        results[user][name][t] = user_seq
 
                 e_handler = e_handler.reset()
 
@@ -142,7 +193,27 @@ class Sequences(BaseExtractor):
         if not set(interaction_events) == set(aliases.keys()):
             raise ValueError('interaction events and aliases keys should be the same')
 
-        if not self._sequences:
+        if multiple_thresholds:
+            if len(time_threshold) == 0:
+                raise ValueError('time_threshold cannot be an empty list')
+            
+            if not all(isinstance(t, (int, float)) for t in time_threshold):
+                raise TypeError('Contents of time_threshold are not ints or floats.')
+
+        if pause_schemes is not None: self._check_pause_schemes(pause_schemes)
+
+        # the multiple threshold and pause scheme sequences are stored separately
+        if multiple_thresholds or pause_schemes:
+            variant_key = (
+                tuple(thresholds) if multiple_thresholds else time_threshold,
+                tuple((name, tuple(scheme.items())) for name, scheme in pause_schemes.items())
+                if pause_schemes else None
+            )
+            sequences = self._sequence_variants.setdefault(variant_key, {})
+        else:
+            sequences = self._sequences
+
+        if not sequences:
             if user_id is not None: 
                 if not isinstance(user_id, str):
                     raise TypeError('user_id should be a string: {0} (type: {1})'.format(
@@ -152,26 +223,37 @@ class Sequences(BaseExtractor):
                 if user_id not in self._users:
                     raise ValueError('Invalid user_id: {0}'.format(user_id))
 
+                if user_id in self.skipped_users: # an empty sequence, as in the results
+                    return _reshape({
+                        name: {t: [] for t in (thresholds or [None])} for name in schemes})
+
                 e_handler = EventHandler(aliases)
-                return _seq(
+                return _reshape(_seq(
                     user_chunk = [user_id], 
                     data_chunk = self.data[user_id],
-                    e_handler = e_handler)[user_id]
+                    e_handler = e_handler)[user_id])
             
-            self._sequences = {user: [] for user in self._users}
-            parallel = Parallel(n_jobs = self._num_cpu, verbose = verbose)
-
+            # {scheme -> {threshold -> {user -> sequence}}}
+            all_sequences = {
+                name: {t: {user: [] for user in self._users} for t in (thresholds or [None])}
+                for name in schemes
+            }
             e_handler = EventHandler(aliases)
 
             # runs the _seq function in parallel
-            res = parallel(delayed(_seq) (u, e, e_handler) for u, e in self._split_users())
+            res = self._run_parallel(
+                _seq, 'get_sequences', args = (e_handler, ), verbose = verbose)
 
             # unpack the results and add them to the sequences dict
-            for r in res:
-                for u, s in r.items():
-                    self._sequences[u] = s
-
-            return self._sequences
+            with self._profiler.stage('get_sequences', 'merge'):
+                for r in res:
+                    for u, s in r.items():
+                        for name, scheme_seqs in s.items():
+                            for t, t_seq in scheme_seqs.items(): 
+                                all_sequences[name][t][u] = t_seq
+
+                sequences.update(_reshape(all_sequences))
+            return sequences
         else:
             if user_id is not None:
                 if not isinstance(user_id, str):
@@ -182,8 +264,14 @@ class Sequences(BaseExtractor):
                 if user_id not in self._users:
                     raise ValueError('Invalid user_id: {0}'.format(user_id))
 
-                return self._sequences[user_id]
-            return self._sequences
+                def _user_sequences(nested, depth):
+                    """ select the user's sequence(s) from the (nested) sequences """
+                    if depth == 0: return nested[user_id]
+                    return {k: _user_sequences(v, depth - 1) for k, v in nested.items()}
+
+                return _user_sequences(
+                    sequences, depth = bool(pause_schemes) + multiple_thresholds)
+            return sequences
 
     def get_ngrams(
         self, 
@@ -208,6 +296,8 @@ class Sequences(BaseExtractor):
             raise TypeError(
                 'counter should be a bool: {0} (type: {1})'.format(counter, type(counter)))
 
+        from nltk import ngrams # nltk is slow to import, so only when it's needed
+
         # Get the n-grams for all of the users
         ngrams_dict = defaultdict(list) # {user_id -> [n_grams, ...], ...}
         for user, sequence in self._sequences.items():
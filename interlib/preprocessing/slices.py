@@ -1,8 +1,6 @@
 """
     
 """
-import pandas as pd 
-
 from .base import BaseExtractor
 from .statistics import Statistics
 from ..util import to_dataframe
@@ -14,9 +12,10 @@ class StatisticalSlices(BaseExtractor):
         self, 
         user_events: Dict[str, List[Dict]], 
         interaction_events: List[str],
-        narrative_element_durations: Optional[Dict[str, float]] = None 
+        narrative_element_durations: Optional[Dict[str, float]] = None,
+        presorted: Optional[bool] = False
     ):
-        super().__init__(user_events)
+        super().__init__(user_events, presorted = presorted)
 
         self._slices = []
         self._interaction_events = interaction_events
@@ -48,7 +47,7 @@ class StatisticalSlices(BaseExtractor):
 
     def get_slices(self, as_df = False):
         if self._is_sliced:
-            if as_df: return pd.DataFrame(self._slices)
+            if as_df: return self._to_dataframe()
             else: return self._slices
 
         for user, events in self.data.items():
@@ -62,7 +61,7 @@ class StatisticalSlices(BaseExtractor):
 
                     s = Statistics(
                         {user: wind}, completion_point = end_point, n_jobs = 1,
-                        narrative_element_durations = self._nec_durations
+                        narrative_element_durations = self._nec_durations, presorted = True
                     )
                     wind_stats = s.calculate_statistics(
                         self._interaction_events, 
@@ -80,7 +79,8 @@ class StatisticalSlices(BaseExtractor):
                 else:
                     # abandon
                     s = Statistics(
-                        {user: wind}, n_jobs = 1, narrative_element_durations = self._nec_durations
+                        {user: wind}, n_jobs = 1, narrative_element_durations = self._nec_durations,
+                        presorted = True # the windows are slices of the already sorted events
                     )
                     wind_stats = s.calculate_statistics(
                         self._interaction_events,
@@ -99,8 +99,12 @@ class StatisticalSlices(BaseExtractor):
         
         self._is_sliced = True
 
-        if as_df: return pd.DataFrame(self._slices)
+        if as_df: return self._to_dataframe()
         else: return self._slices
+
+    def _to_dataframe(self):
+        import pandas as pd # only needed when a DataFrame is requested
+        return pd.DataFrame(self._slices)
         
 
 
@@ -1,44 +1,252 @@
 """ """
 
-from numpy.core.multiarray import result_type
-from .base import BaseExtractor
+from .base import BaseExtractor, DEFAULT_PAUSE_SCHEME
+from .narrative import NarrativeElementTimes, FunnelCounts, _TimesBuilder
+from .windows import EventCounts, window_counts, preallocated_counts
 from ..util import get_hidden_time, missing_hidden_visibility_change, safe_division
+from ..util.sketch import QuantileSketch, DEFAULT_RELATIVE_ACCURACY
 
-from joblib import Parallel, delayed, cpu_count
 from datetime import datetime as dt
 from collections import Counter, defaultdict
-from typing import Optional, Union, List, Set, Dict
+from typing import Optional, Union, List, Set, Dict, Callable, Sequence, Tuple
 
+import copy
 import numpy as np 
-import pandas as pd 
 
 np.random.seed(42)
 
 NEC = 'NARRATIVE_ELEMENT_CHANGE'
 BVC = 'BROWSER_VISIBILITY_CHANGE'
 
+def _active_time(
+    timestamp: dt, 
+    first_timestamp: dt, 
+    hidden_total: float, 
+    hidden_since: Optional[dt] = None
+) -> float:
+    """
+        The time of an event on the active clock (see _visibility): the seconds since the
+        first event less the hidden time before it, stopped at hidden_since while hidden.
+
+        :params timestamp: the time of the event
+        :params first_timestamp: the time of the user's first event
+        :params hidden_total: the total of the hidden periods that ended before the event
+        :params hidden_since: the start of the hidden period the event is in, if any
+        :returns: the time in seconds
+    """
+    return (
+        (timestamp if hidden_since is None else hidden_since) - first_timestamp
+    ).total_seconds() - hidden_total
+
+def _visibility(events: List[Dict]) -> Tuple[List[float], np.ndarray]:
+    """
+        The hidden time of a user's session. This is the one rule for the time the 
+        experience was hidden, used by the hidden time, the time to completion (and to 
+        each endpoint), the time on each narrative element, the funnel and the event rates: 
+        it's hidden from a visibility change to hidden (a repeated hidden doesn't start 
+        another period) until the next visibility change to visible. A hidden period that
+        isn't followed by a visible event isn't counted.
+
+        :params events: the user's (sorted) events
+        :returns: the length of each hidden period in seconds and the active clock, the
+            time of each event with the hidden time taken out (it stops while hidden)
+    """
+    hidden_times, clock = [], np.empty(len(events), dtype = np.float64)
+    if not events: return hidden_times, clock
+
+    first_timestamp = events[0]['timestamp']
+    hidden_total, hidden_since, hidden_index = 0.0, None, None
+    for idx, event in enumerate(events):
+        if event['action_name'] == BVC:
+            if event['data']['romper_to_state'] == 'hidden' and hidden_since is None:
+                hidden_since, hidden_index = event['timestamp'], idx
+            elif event['data']['romper_to_state'] == 'visible' and hidden_since is not None:
+                hidden_times.append((event['timestamp'] - hidden_since).total_seconds())
+                hidden_total += hidden_times[-1]
+                hidden_since = None
+
+        clock[idx] = _active_time(event['timestamp'], first_timestamp, hidden_total, hidden_since)
+
+    if hidden_since is not None: # never visible again, so the clock doesn't stop
+        for idx in range(hidden_index, len(events)):
+            clock[idx] = _active_time(events[idx]['timestamp'], first_timestamp, hidden_total)
+    return hidden_times, clock
+
+def _active_clock(events: List[Dict]) -> np.ndarray:
+    """
+        The time of each event (in seconds from the first event) with the time the 
+        experience was hidden taken out (see _visibility).
+
+        :params events: the user's (sorted) events
+        :returns: the time of each event
+    """
+    return _visibility(events)[1]
+
+def _nec_times(events: List[Dict], clock: np.ndarray) -> Dict[str, float]:
+    """
+        The time spent on each narrative element on the active clock, from each NEC to
+        the next NEC or, for the last NEC, to the last visibility change after it.
+
+        :params events: the user's (sorted) events
+        :params clock: the active clock of the events (see _visibility)
+        :returns: the time spent on each narrative element {nec -> time}
+    """
+    times = defaultdict(float)
+    span_nec, span_start, span_end = None, None, None # the open span
+    for idx, event in enumerate(events):
+        if event['action_name'] == NEC:
+            if span_nec is not None: times[span_nec] += clock[idx] - span_start
+            span_nec, span_start, span_end = event['data']['romper_to_state'], clock[idx], None
+        elif event['action_name'] == BVC and span_nec is not None:
+            span_end = clock[idx]
+
+    if span_end is not None: times[span_nec] += span_end - span_start
+    return times
+
+def _nec_time_statistics(
+    times: Dict[str, float], 
+    nec_durations: Optional[Dict[str, float]] = None
+) -> Dict[str, float]:
+    """
+        The average, standard deviation and median of the time spent on each narrative 
+        element (and normalised by their durations, if given).
+
+        :params times: the time spent on each narrative element {nec -> time}
+        :params nec_durations: the duration of each narrative element {nec -> duration}
+        :returns: the NEC time statistics
+    """
+    times_arr = [t for t in times.values()]
+    result = {
+        'avg_nec_time': np.mean(times_arr),
+        'std_nec_time': np.std(times_arr),
+        'med_nec_time': np.median(times_arr)
+    }
+
+    if nec_durations:
+        norm_times = []
+        for nec, time in times.items():
+            if nec not in nec_durations.keys():
+                continue 
+
+            if nec_durations[nec] == 0:
+                norm_times.append(0.0)
+            else:
+                norm_times.append(safe_division(time, nec_durations[nec]))
+
+        result.update({
+            'norm_avg_nec_time': np.mean(norm_times),
+            'norm_std_nec_time': np.std(norm_times)
+        })
+    return result
+
+def _event_statistics(
+    ua_counter: Dict[str, int],
+    include_link_choices: Optional[bool] = False,
+    include_user_set_variables: Optional[bool] = False
+) -> Dict[str, Union[int, float]]:
+    """
+        The event statistics (counts, proportions and total) from the counts of each event.
+
+        :params ua_counter: the number of each interaction event {event -> count}
+        :params include_link_choices: whether to include LC in the total count
+        :params include_user_set_variable: whether to include USV in the total count
+        :returns: the event statistics
+    """
+    ua_counter = defaultdict(int, ua_counter)
+
+    # subtract one from PLAY_PAUSE, there's always one at the beginning and
+    # only if the value is not 0
+    if ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] != 0:
+        ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] -= 1
+
+    # calculate the total number of events
+    total_events = sum(ua_counter.values())
+
+    if not include_link_choices:
+        total_events -= ua_counter['LINK_CHOICE_CLICKED']
+    
+    if not include_user_set_variables:
+        total_events -= ua_counter['USER_SET_VARIABLE']
+
+    # calculate relative frequency for each event
+    user_actions_proportion = defaultdict(float)
+    for event, count in ua_counter.items():
+        user_actions_proportion[event + '_proportion'] = safe_division(
+            count, total_events) / 100
+
+    return {**ua_counter, **user_actions_proportion, 'total_events': total_events}
+
+def _endpoint_statistics(endpoint_times: Dict[str, float]) -> Dict[str, Union[str, Dict[str, float]]]:
+    """
+        The statistics for multiple completion points.
+
+        :params endpoint_times: the time (on the active clock) of the last time each of 
+            the completion points was reached {completion point -> time}, in the order 
+            they were last reached
+        :returns: the completion point reached last ('ending', None if none were reached) 
+            and the time to each completion point reached ('endpoint_times')
+    """
+    return {
+        'ending': list(endpoint_times)[-1] if endpoint_times else None,
+        'endpoint_times': dict(endpoint_times)
+    }
+
 class Statistics(BaseExtractor):
     
     def __init__(
         self, 
         user_event_dict: Dict[str, List[Dict]], 
-        completion_point: Optional[str] = None,
+        completion_point: Optional[Union[str, Set[str]]] = None,
         n_jobs: Optional[int] = 1,
-        narrative_element_durations: Optional[Dict[str, float]] = None
+        narrative_element_durations: Optional[Dict[str, float]] = None,
+        presorted: Optional[bool] = False,
+        profile: Optional[bool] = False,
+        profile_callback: Optional[Callable[[Dict], None]] = None,
+        max_user_events: Optional[int] = None,
+        heavy_user_policy: Optional[str] = 'cap',
+        sketch_relative_accuracy: Optional[float] = DEFAULT_RELATIVE_ACCURACY
     ) -> None:        
+        """
+            :params user_event_dict: the users' events {user -> events}
+            :params completion_point: the narrative element (romper_to_state) that marks the
+                end of the experience, or a set of them for an experience with more than one
+                ending (reach_end is whether any of them were reached, time_to_completion is
+                the time to the one reached last, see ending and endpoint_times)
+            :params n_jobs: the number of processes (passed to joblib)
+            :params narrative_element_durations: the duration of each narrative element, to
+                normalise the time spent on them
+            :params presorted: the users' events are already sorted by their timestamps
+            :params profile: record the time taken by each stage, see profile_report
+            :params profile_callback: called with each stage as it's recorded
+            :params max_user_events: the most events of a user to process, see heavy_user_policy
+            :params heavy_user_policy: cap, isolate or skip the users with more than 
+                max_user_events events
+            :params sketch_relative_accuracy: the relative accuracy of the quantile sketches
+        """
         BaseExtractor.__init__(
             self,
-            user_event_dict = user_event_dict.copy(),
+            user_event_dict = user_event_dict,
             completion_point = completion_point,
             n_jobs = n_jobs,
+            presorted = presorted,
+            profile = profile,
+            profile_callback = profile_callback,
+            max_user_events = max_user_events,
+            heavy_user_policy = heavy_user_policy
         )
 
         self._statistics = {}
         self._time_statistics = {}
         self._pause_statistics = {}
+        self._pause_scheme_statistics = {}
         self._event_statistics = {}
         self._user_event_frequencies = {}
         self._nec_durations = narrative_element_durations
+        self._nec_times = None # the users x narrative elements times (NarrativeElementTimes)
+        self._nec_times_builder = None
+        self._nec_time_sketches = {} # {nec -> QuantileSketch}
+        self._sketch_relative_accuracy = sketch_relative_accuracy
+        self._funnels = {} # {points -> ({user -> funnel}, FunnelCounts)}
 
     def time_statistics(
         self, 
@@ -53,62 +261,7 @@ class Statistics(BaseExtractor):
             :params user_id: a specific user to get the statistics for
             :returns: dictionary of results {user -> {hidden_time: 0...}}
         """
-        def _get_timings(events):
-            times = defaultdict(float) # {<nec_name>: <time spent>}
-            for idx, event in enumerate(events):
-                if event == events[-1]: break 
-
-                if event['action_name'] == NEC:
-                    # search forward to gather all events between this NEC and the next
-                    intermediate_events = []
-                    for ev in events[idx + 1:]:
-                        intermediate_events.append(ev)
-
-                        # exit once we've found the next NEC
-                        if ev['action_name'] == NEC: break
-
-                    # if there's only one - i.e. the next NEC was immediately following
-                    if (len(intermediate_events) == 1 and 
-                        intermediate_events[0]['action_name'] == NEC):                       
-                        time_diff = ( # get the time difference in seconds
-                            intermediate_events[0]['timestamp'] - event['timestamp']
-                        ).total_seconds()
-                    else: # then we have some additional (BVC) events in between
-                        non_nec_events = [ # get all of those non-NEC events
-                            ev for ev in intermediate_events if ev['action_name'] != NEC
-                        ]
-                        hidden_times = []
-                        for non_nec_idx, non_nec_ev in enumerate(non_nec_events):
-                            hidden_times.append(get_hidden_time(
-                                non_nec_ev['timestamp'], non_nec_idx, non_nec_events
-                            ))
-
-                        time_diff = ( # get the time difference
-                            intermediate_events[-1]['timestamp'] - event['timestamp']
-                        ).total_seconds() - sum(hidden_times)
-
-                    times[event['data']['romper_to_state']] += time_diff # times.append(time_diff)
-            return times 
-
-        def _get_normalised_nec_time(user_timings):
-            times = []
-            
-            for nec, time in user_timings.items():
-                if nec not in self._nec_durations.keys():
-                    continue 
-
-                if self._nec_durations[nec] == 0:
-                    times.append(0.0)
-                else:
-                    default_duration = self._nec_durations[nec]
-                    times.append(safe_division(time, default_duration))
-
-            return {
-                'norm_avg_nec_time': np.mean(times),
-                'norm_std_nec_time': np.std(times)
-            }
-
-        def _get_average_nec_time(user_dict, no_event_set = None):
+        def _get_average_nec_time(user_dict, user_nec_times, no_event_set = None):
             result = {}
 
             for user, events in user_dict.items():
@@ -118,31 +271,7 @@ class Statistics(BaseExtractor):
                     }
                     continue
 
-                nec_bvc_events = [ # get the BVC and NEC events
-                    ev 
-                    for ev in events 
-                    if (ev['action_name'] == 'BROWSER_VISIBILITY_CHANGE' or 
-                        ev['action_name'] == 'NARRATIVE_ELEMENT_CHANGE')
-                ]
-
-                times = _get_timings(nec_bvc_events)
-                times_arr = [t for t in times.values()]
-
-                if self._nec_durations:
-                    norm_times = _get_normalised_nec_time(times)
-                    result[user] = {
-                        'avg_nec_time': np.mean(times_arr),
-                        'std_nec_time': np.std(times_arr),
-                        'med_nec_time': np.median(times_arr),
-                        'norm_avg_nec_time': norm_times['norm_avg_nec_time'],
-                        'norm_std_nec_time': norm_times['norm_std_nec_time']
-                    }
-                else:
-                    result[user] = {
-                        'avg_nec_time': np.mean(times_arr),
-                        'std_nec_time': np.std(times_arr),
-                        'med_nec_time': np.median(times_arr)
-                    }
+                result[user] = _nec_time_statistics(user_nec_times[user], self._nec_durations)
 
             return result
   
@@ -152,7 +281,7 @@ class Statistics(BaseExtractor):
 
             results = {user: {} for user in user_chunk}
 
-            timestamps = {}
+            timestamps, nec_times = {}, {}
             no_events_set = set([])
             # calculate the hidden time (and get the timestamps)
             for user, events in user_dict.items():
@@ -165,28 +294,21 @@ class Statistics(BaseExtractor):
 
                 timestamps[user] = [event['timestamp'] for event in events] # collect timestamps
 
-                hidden_times = []
-                hidden_time_completion_point = None 
-                timestamp_reached_completion_point = None
-                # for all events, if there is a visibility change to hidden
-                for index, event in enumerate(events): 
-                    if (event['action_name'] == 'BROWSER_VISIBILITY_CHANGE' and 
-                        event['data']['romper_to_state'] == 'hidden'):
-                        hidden_times.append(
-                            get_hidden_time(
-                                event['timestamp'],
-                                index,
-                                events
-                            )
-                        )
-
-                    # time of completion
-                    if self.completion_point:
+                # the hidden periods and the time of each event with them taken out
+                hidden_times, clock = _visibility(events)
+                nec_times[user] = _nec_times(events, clock)
+
+                # time of completion
+                time_to_completion = None
+                endpoint_times = {} # {completion point -> time}
+                if self.completion_point and self._users_reached_completion_point[user]:
+                    for index, event in enumerate(events):
                         if (event['action_type'] == 'STORY_NAVIGATION' and 
-                            event['data']['romper_to_state'] == self.completion_point and
-                            self._users_reached_completion_point[user]):
-                            hidden_time_completion_point = np.sum(hidden_times)
-                            timestamp_reached_completion_point = event['timestamp']
+                            event['data']['romper_to_state'] in self._completion_points):
+                            time_to_completion = clock[index]
+                            # (re-inserted, so the hits are in the order they were last reached)
+                            endpoint_times.pop(event['data']['romper_to_state'], None)
+                            endpoint_times[event['data']['romper_to_state']] = time_to_completion
 
                 # record the sum of the hidden times
                 results[user].update({'hidden_time': np.sum(hidden_times)})
@@ -195,26 +317,25 @@ class Statistics(BaseExtractor):
                 if self.completion_point:
                     if not self._users_reached_completion_point[user]:
                         results[user].update({'time_to_completion': 0.0})
-                    else:
-                        # have to take into account the hidden time.
-                        raw_time = (
-                            timestamp_reached_completion_point - timestamps[user][0]
-                            ).total_seconds()
-                        results[user].update({
-                            'time_to_completion': raw_time - hidden_time_completion_point
-                        })
+                    else: # (the hidden time is taken out by the clock)
+                        results[user].update({'time_to_completion': time_to_completion})
                     # add in whether the user reached teh end
                     results[user].update({
                         'reach_end': self._users_reached_completion_point[user],
                         'last_ne_seen': self.last_ne[user]
                     })
 
+                    # with multiple completion points, the ending the user reached (last) and
+                    # the time to each of the completion points they reached
+                    if not isinstance(self.completion_point, str):
+                        results[user].update(_endpoint_statistics(endpoint_times))
+
             # calculate the raw session length
             for user, ts in timestamps.items():
                 results[user].update({'raw_session_length': (ts[-1] - ts[0]).total_seconds()})
 
             # calculate the average (plus other statistics) NEC time
-            avg_nec_times = _get_average_nec_time(user_dict, no_events_set)
+            avg_nec_times = _get_average_nec_time(user_dict, nec_times, no_events_set)
             if self._nec_durations:
                 for user, res in avg_nec_times.items():
                     results[user].update({
@@ -237,7 +358,11 @@ class Statistics(BaseExtractor):
                 else: sess_length = res['raw_session_length'] - res['hidden_time']
                 results[user].update({'session_length': sess_length})
 
-            return results
+            # the time on each narrative element is collected (and sketched) here, so only
+            # the worker's entries and sketches are merged
+            builder = _TimesBuilder(self._sketch_relative_accuracy)
+            for user in results: builder.add(user, nec_times.get(user, {}))
+            return results, builder
 
         if not self._time_statistics: # we've not already calculated
             if user_id is not None: # if the user is wanting a specific user
@@ -247,19 +372,27 @@ class Statistics(BaseExtractor):
                 if user_id not in self.data.keys():
                     raise ValueError('Invalid User ID: {0}'.format(user_id))
 
+                if user_id in self.skipped_users: return {'skipped': True} # as in the results
+
                 # calculate the statistics for that user
-                return _get_stats(user_chunk = [user_id], data_chunk = self.data[user_id])[user_id]
+                return _get_stats(user_chunk = [user_id], data_chunk = self.data[user_id])[0][user_id]
 
             self._time_statistics = {user: {} for user, d in self.data.items()}
-            parallel = Parallel(n_jobs = self._num_cpu, verbose = verbose)
 
             # run the process to calculate the statistics
-            res = parallel(delayed(_get_stats) (u, e) for u, e in self._users_split)
+            res = self._run_parallel(
+                _get_stats, 'time_statistics', splits = self._users_split, verbose = verbose)
             
             # unpack the results into the time statistics dictionary
-            for r in res:
-                for u, s in r.items():
-                    self._time_statistics[u].update(s)
+            with self._profiler.stage('time_statistics', 'merge'):
+                self._nec_times_builder = _TimesBuilder(self._sketch_relative_accuracy)
+                for worker_statistics, worker_builder in res:
+                    for u, s in worker_statistics.items(): self._time_statistics[u].update(s)
+                    self._nec_times_builder.merge(worker_builder)
+
+                # the population's time on each narrative element
+                self._nec_time_sketches = self._nec_times_builder.sketches
+                self._flag_skipped(self._time_statistics)
                 
             return self._time_statistics
         else: # otherwise just return the pre-calculate statistics
@@ -274,6 +407,145 @@ class Statistics(BaseExtractor):
                 return self._time_statistics[user_id]
             return self._time_statistics
 
+    def nec_time_sketches(self, verbose: Optional[int] = 0) -> Dict[str, QuantileSketch]:
+        """
+            The distribution of the time spent on each narrative element over all of the 
+            users, as quantile sketches built while calculating the time statistics. The
+            sketches can be merged with those of other Statistics (e.g. partitions).
+
+            :params verbose: passed to the joblib backend
+            :returns: {narrative element -> QuantileSketch}
+        """
+        if not self._time_statistics: self.time_statistics(verbose = verbose)
+        return self._nec_time_sketches
+
+    def nec_time_matrix(self, verbose: Optional[int] = 0) -> NarrativeElementTimes:
+        """
+            The time each user spent on each narrative element (as used for avg_nec_time),
+            collected while calculating the time statistics, as a sparse matrix of users x
+            narrative elements with the column aggregates (e.g. column_means).
+
+            :params verbose: passed to the joblib backend
+            :returns: the times (NarrativeElementTimes)
+        """
+        if not self._time_statistics: self.time_statistics(verbose = verbose)
+        if self._nec_times is None:
+            self._nec_times = self._nec_times_builder.build()
+            self._nec_times_builder = None
+        return self._nec_times
+
+    def nec_time_quantiles(
+        self, 
+        quantiles: Optional[Sequence[float]] = (0.5, 0.9, 0.99),
+        verbose: Optional[int] = 0
+    ) -> Dict[str, Dict[str, float]]:
+        """
+            The percentiles of the time spent on each narrative element over all of the
+            users, estimated (within the sketch_relative_accuracy) from nec_time_sketches.
+
+            :params quantiles: the quantiles to estimate, between 0 and 1
+            :params verbose: passed to the joblib backend
+            :returns: {narrative element -> {'p50': ..., 'p90': ..., 'p99': ...}}
+        """
+        return {
+            nec: {'p{0:g}'.format(q * 100): sketch.quantile(q) for q in quantiles}
+            for nec, sketch in self.nec_time_sketches(verbose = verbose).items()
+        }
+
+    def _funnel(
+        self, 
+        points: List[str], 
+        verbose: Optional[int] = 0
+    ) -> Tuple[Dict[str, Dict], FunnelCounts]:
+        """ the funnel of each user and the counts over all of the users (see funnel) """
+        def _get_funnels(user_chunk, data_chunk):
+            user_dict = {user: [] for user in user_chunk}
+            for d in data_chunk: user_dict[d['user']].append(d)
+
+            # the worker's users are counted here, so only the counts are merged
+            results, counts = {}, FunnelCounts(points)
+            for user, events in user_dict.items():
+                # the time of each step on the clock that stops while hidden
+                clock, step_clocks = _active_clock(events), []
+                for idx, event in enumerate(events):
+                    if len(step_clocks) == len(points): break
+                    if (event['action_type'] == 'STORY_NAVIGATION' and 
+                        event['data']['romper_to_state'] == points[len(step_clocks)]):
+                        step_clocks.append(clock[idx])
+
+                results[user] = {
+                    'steps_reached': len(step_clocks),
+                    'furthest_step': points[len(step_clocks) - 1] if step_clocks else None,
+                    'step_times': np.diff(step_clocks, prepend = 0.0).tolist()
+                }
+                counts.add(results[user])
+            return results, counts
+
+        points = tuple(points)
+        if points not in self._funnels:
+            user_funnels, counts = {}, FunnelCounts(points)
+            res = self._run_parallel(_get_funnels, 'funnel', verbose = verbose)
+
+            with self._profiler.stage('funnel', 'merge'):
+                for worker_funnels, worker_counts in res:
+                    user_funnels.update(worker_funnels)
+                    counts.merge(worker_counts)
+                self._flag_skipped(user_funnels)
+            self._funnels[points] = (user_funnels, counts)
+        return self._funnels[points]
+
+    def funnel(
+        self,
+        points: List[str],
+        verbose: Optional[int] = 0,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Dict]:
+        """
+            A funnel over an ordered list of narrative elements (romper_to_state), e.g. the
+            chapters of the experience. A user reaches a step of the funnel at the first 
+            time they move to its narrative element after reaching the previous step.
+
+            :params points: the ordered narrative elements
+            :params verbose: passed to the joblib backend
+            :params user_id: a specific user to get the funnel for
+            :returns: {user -> {'steps_reached': the number of steps reached, 'furthest_step':
+                the last narrative element reached (or None), 'step_times': the time from 
+                the previous step (the start of the session for the first step) to each 
+                step reached, on a clock that stops while the experience is hidden}}
+        """
+        self._check_points(points)
+        user_funnels, _ = self._funnel(points, verbose = verbose)
+
+        if user_id is not None:
+            if not isinstance(user_id, str):
+                raise TypeError('User ID should be a string: {0}'.format(user_id))
+
+            if user_id not in user_funnels:
+                raise ValueError('Invalid User ID: {0}'.format(user_id))
+            return user_funnels[user_id]
+        return user_funnels
+
+    def funnel_counts(self, points: List[str], verbose: Optional[int] = 0) -> FunnelCounts:
+        """
+            The number of users reaching each step of the funnel (see funnel), the drop off
+            after each step and the distribution of the time between the steps.
+
+            :params points: the ordered narrative elements
+            :params verbose: passed to the joblib backend
+            :returns: the counts (FunnelCounts), e.g. funnel_counts(points).to_list(), a copy
+                so that merging other counts into it doesn't change those of this Statistics
+        """
+        self._check_points(points)
+        return copy.deepcopy(self._funnel(points, verbose = verbose)[1])
+
+    def _check_points(self, points: List[str]) -> None:
+        if not isinstance(points, (list, tuple)):
+            raise TypeError('points should be a list of narrative elements: {0} ({1})'.format(
+                points, type(points)))
+
+        if len(points) == 0:
+            raise ValueError('points cannot be empty: {0}'.format(points))
+
     def session_length(
         self, 
         user_id: Optional[str] = None, 
@@ -310,6 +582,7 @@ class Statistics(BaseExtractor):
         events: list,
         pauses_include_events: Optional[Set] = {},
         pauses_exclude_events: Optional[Set] = {}, 
+        pause_schemes: Optional[Dict[str, Dict[str, float]]] = None
     ) -> Dict[str, int]:
         """
             Given a set of user actions, count the number of
@@ -319,37 +592,42 @@ class Statistics(BaseExtractor):
             :params pauses_include_events: a set of events to include outside of the standard
                 USER_ACTION events, i.e., browser visibility and window orientation changes
             :params pauses_exclude_events: a set of events to exclude from the pause calculations.
+            :params pause_schemes: named pause schemes ({name -> {pause type -> lower bound}}),
+                all of the schemes are counted from the same gaps between the events and the
+                counts are returned for each scheme {name -> {pause type -> count}}
         """
-        pauses = []
-        previous_timestamp = events[0]['timestamp']
-        for event in events:
-            # if the event is a user action OR in the events we want to include AND not in the
-            # events we want to exclude, then calculate the pauses
-            if ((event['action_type'] == 'USER_ACTION' or 
-                event['action_name'] in pauses_include_events) and 
-                event['action_name'] not in pauses_exclude_events): 
+        schemes = pause_schemes if pause_schemes else {None: DEFAULT_PAUSE_SCHEME}
 
-                pause_type, diff = self._type_of_pause(previous_timestamp, event['timestamp'])
+        if len(events) == 0:
+            diffs = np.array([])
+        else:
+            # an event is included if it is a user action OR in the events we want to include 
+            # AND not in the events we want to exclude
+            mask = np.fromiter((
+                (event['action_type'] == 'USER_ACTION' or 
+                event['action_name'] in pauses_include_events) and 
+                event['action_name'] not in pauses_exclude_events
+                for event in events
+            ), dtype = bool, count = len(events))
+            mask[0] = True # the pauses are measured from the first event
 
-                # if there is a pause of some description, then add to the list
-                if pause_type != 0: 
-                    pauses.append(pause_type)
+            diffs = self._pause_gaps([event['timestamp'] for event in events], mask)
 
-                # set the previous timestamp to the current
-                previous_timestamp = event['timestamp']
+        counts = {}
+        for name, scheme in schemes.items():
+            pauses = self._bucket_pauses(diffs, list(scheme.values()))
+            scheme_counts = np.bincount(pauses[pauses >= 0], minlength = len(scheme))
+            counts[name] = {pause: int(count) for pause, count in zip(scheme, scheme_counts)}
 
-        
-        pauses = Counter(pauses)
-        return {
-            'SP': pauses['SP'], 'MP': pauses['MP'], 'LP': pauses['LP'], 'VLP': pauses['VLP']
-        }
+        return counts if pause_schemes else counts[None]
         
     def pause_statistics(
         self, 
         verbose: Optional[int] = 0, 
         user_id: Optional[str] = None,
         pauses_include_events: Optional[Set] = {},
-        pauses_exclude_events: Optional[Set] = {} 
+        pauses_exclude_events: Optional[Set] = {},
+        pause_schemes: Optional[Dict[str, Dict[str, float]]] = None
     ) -> Dict[str, Dict]:
         """ 
             Based on the event data supplied, calculate the pause
@@ -360,6 +638,10 @@ class Statistics(BaseExtractor):
             :params pauses_include_events: a set of events to include outside of the standard
                 USER_ACTION events, i.e., browser visibility and window orientation changes
             :params pauses_exclude_events: a set of events to exclude from the pause calculations.
+            :params pause_schemes: named pause schemes to count, in the format {name -> {pause 
+                type -> lower bound in seconds}}, e.g. {'default': {'SP': 1, 'MP': 5, 'LP': 15,
+                'VLP': 30}}. All of the schemes are counted in a single pass and the statistics
+                are keyed by scheme: {user -> {name -> {pause type -> count}}}
             :returns: a dictionary with a mapping from user to statistics
         """
         def _get_pauses(user_chunk, data_chunk):
@@ -369,54 +651,65 @@ class Statistics(BaseExtractor):
             results = {user: {} for user in user_chunk}
 
             for user, events in user_dict.items():
-                if len(events) < 1: # if the user has no events
-                    results[user].update({'SP': 0, 'MP': 0, 'LP': 0, 'VLP': 0})
-                    continue
-
+                # (if the user has no events, then all of the counts are 0)
                 results[user].update(
                     self._pause_counts(
                         events, 
                         pauses_include_events = pauses_include_events,
-                        pauses_exclude_events = pauses_exclude_events
+                        pauses_exclude_events = pauses_exclude_events,
+                        pause_schemes = pause_schemes
                     )
                 )
             
             return results
 
+        if pause_schemes is not None: self._check_pause_schemes(pause_schemes)
+
+        # the statistics for the pause schemes are stored separately, keyed by the schemes
+        if pause_schemes:
+            schemes_key = tuple(
+                (name, tuple(scheme.items())) for name, scheme in pause_schemes.items())
+            pause_stats = self._pause_scheme_statistics.setdefault(schemes_key, {})
+        else:
+            pause_stats = self._pause_statistics
+
         # if the statistics haven't been previously calculated
-        if not self._pause_statistics:
+        if not pause_stats:
             if user_id is not None: # if the user is asking for the stats of a specific user
                 if not isinstance(user_id, str):
                     raise TypeError('User Id should be a string: {0}'.format(user_id))
 
                 if user_id not in self.data.keys():
                     raise ValueError('Invalid user id: {0}'.format(user_id))
-                
+
+                if user_id in self.skipped_users: return {'skipped': True} # as in the results
+
                 # calculate the pause statistics for that individual (non-parallel)
                 return _get_pauses(user_chunk = [user_id], data_chunk = self.data[user_id])[user_id]
 
-            self._pause_statistics = {user: {} for user, d in self.data.items()}
-            parallel = Parallel(n_jobs = self._num_cpu, verbose = verbose)
+            pause_stats.update({user: {} for user, d in self.data.items()})
 
             # run the pause statistics job in parallel
-            res = parallel(delayed(_get_pauses) (u, e) for u, e in self._split_users())
+            res = self._run_parallel(_get_pauses, 'pause_statistics', verbose = verbose)
 
             # unpack the results and add to the pause statistics dictionary
-            for r in res:
-                for u, p in r.items():
-                    self._pause_statistics[u].update(p)
+            with self._profiler.stage('pause_statistics', 'merge'):
+                for r in res:
+                    for u, p in r.items():
+                        pause_stats[u].update(p)
+                self._flag_skipped(pause_stats)
 
-            return self._pause_statistics
+            return pause_stats
         else:
             if user_id is not None:
                 if not isinstance(user_id, str):
                     raise TypeError('User Id should be a string: {0}'.format(user_id))
 
-                if user_id not in self._pause_statistics.keys() or user_id not in self.data.keys():
+                if user_id not in pause_stats.keys() or user_id not in self.data.keys():
                     raise ValueError('Invalid user id: {0}'.format(user_id))
 
-                return self._pause_statistics[user_id]
-            return self._pause_statistics
+                return pause_stats[user_id]
+            return pause_stats
 
     def event_statistics(
         self,
@@ -455,29 +748,8 @@ class Statistics(BaseExtractor):
                     if event['action_name'] in interaction_events:
                         ua_counter[event['action_name']] += 1
                 
-                # subtract one from PLAY_PAUSE, there's always one at the beginning and
-                # only if the value is not 0
-                if ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] != 0:
-                    ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] -= 1
-
-                # calculate the total number of events
-                total_events = sum(ua_counter.values())
-
-                if not include_link_choices:
-                    total_events -= ua_counter['LINK_CHOICE_CLICKED']
-                
-                if not include_user_set_variables:
-                    total_events -= ua_counter['USER_SET_VARIABLE']
-
-                # calculate relative frequency for each event
-                user_actions_proportion = defaultdict(float)
-                for event, count in ua_counter.items():
-                    user_actions_proportion[event + '_proportion'] = safe_division(
-                        count, total_events) / 100
-
-                results[user].update(dict(ua_counter))
-                results[user].update(dict(user_actions_proportion))
-                results[user].update({'total_events': total_events})
+                results[user].update(_event_statistics(
+                    ua_counter, include_link_choices, include_user_set_variables))
                     
             return results 
 
@@ -498,20 +770,23 @@ class Statistics(BaseExtractor):
                 if user_id not in self.data.keys():
                     raise ValueError('Invalid user ID: {0}'.format(user_id))
 
+                if user_id in self.skipped_users: return {'skipped': True} # as in the results
+
                 # calculate the event statistics for that user
                 return _event_stats(
                     user_chunk = [user_id], data_chunk = self.data[user_id])[user_id]
             
             self._event_statistics = {user: {} for user, d in self.data.items()}
-            parallel = Parallel(n_jobs = self._num_cpu, verbose = verbose)
 
             # run the event extract in parallel
-            results = parallel(delayed(_event_stats) (u, e) for u, e in self._split_users())
+            results = self._run_parallel(_event_stats, 'event_statistics', verbose = verbose)
 
             # unpack the results and add to the event statistics dictionary
-            for res in results:
-                for user, event_stats in res.items():
-                    self._event_statistics[user].update(event_stats)
+            with self._profiler.stage('event_statistics', 'merge'):
+                for res in results:
+                    for user, event_stats in res.items():
+                        self._event_statistics[user].update(event_stats)
+                self._flag_skipped(self._event_statistics)
 
             return self._event_statistics
         else:
@@ -531,8 +806,9 @@ class Statistics(BaseExtractor):
         interaction_events: List[str], 
         user_id: Optional[str] = None, 
         include_pauses: Optional[bool] = False,
+        as_array: Optional[bool] = False,
         verbose: Optional[int] = 0
-    ) -> Dict[str, Dict[str, Dict[str, int]]]:
+    ) -> Union[Dict[str, Dict[str, Dict[str, int]]], EventCounts]:
         """ 
         From a list of events and give a set of time thresholds,
         calculate the frequency that events happen in those periods.
@@ -543,6 +819,10 @@ class Statistics(BaseExtractor):
         :params interaction_events: a set of events that you want to capture
         frequencies for.
         :params user_id: a specific user to capture event frequencies for.
+        :params include_pauses: whether to include the pause counts (SP, MP, LP and VLP).
+        :params as_array: return the counts as an EventCounts of users x thresholds
+        x events (the events sorted, then the pauses) rather than the dictionaries,
+        the users' events are counted straight into a preallocated array.
         :params verbose: the amount of std out (passed to joblib backend)
         :returns: a dictionary mapping users to an inner dictionary containing
         a mapping of time thresholds and the count of the interaction_events
@@ -603,62 +883,92 @@ class Statistics(BaseExtractor):
 
             return events_subset, events_beyond_max_frequency
 
+        def _threshold_subsets(events):
+            """ the index of each threshold and the events in it, until the user's events end """
+            if len(events) < 1: return # the user has no events
+
+            subset_ids = set([])
+            for i in range(len(frequencies) - 1):
+                event_subset, events_beyond_max_freq = _subset(
+                    frequencies[i], frequencies[i + 1], events,
+                    previous_subset_ids = subset_ids
+                )
+
+                # ids in subset
+                subset_ids.update([ev['id'] for ev in event_subset])
+            
+                """ 
+                Two exit conditions:
+                    1) the user has no events left
+                    2) they have events but are beyond the current
+                    max frequency. 
+                """
+                # if the length is zero and there's no events beyond the current
+                # max frequency (frequencies[i + 1])
+                if (len(event_subset) == 0 and not events_beyond_max_freq):
+                    break # there's no more events
+
+                yield i, event_subset
+
+        def _user_frequencies(events):
+            frequency_counts = {}
+            for idx, event_subset in _threshold_subsets(events):
+                ua_counter = defaultdict(int) # counter for all events
+                
+                # set the default for each of the events
+                for event in interaction_events: ua_counter[event] = 0
+
+                for event in event_subset: # ignoring segmentCompletions events
+                    if event['action_type'] == 'segmentCompletion': continue
+                    if event['action_name'] in interaction_events:
+                        ua_counter[event['action_name']] += 1
+
+                # if pauses need to be included
+                if include_pauses:
+                    for pause in ['SP', 'MP', 'LP', 'VLP']:
+                        ua_counter[pause] = 0
+
+                    for pause, count in self._pause_counts(event_subset).items():
+                        ua_counter[pause] = count
+
+                # need to drop the first play pause, it always happens at the start
+                if idx == 0 and ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] != 0:
+                    ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] -= 1
+
+                frequency_counts[str(frequencies[idx]) + '_' + str(frequencies[idx + 1])] = dict(ua_counter)
+
+            return frequency_counts
+
         def _get_frequencies(user_chunk, data_chunk):
             user_dict = {user: [] for user in user_chunk}
             for d in data_chunk: user_dict[d['user']].append(d)
 
-            results = {user: {} for user in user_chunk}
+            return {user: _user_frequencies(events) for user, events in user_dict.items()}
 
-            for user, events in user_dict.items():
-                if len(events) < 1: # the user has no events
-                    continue
-                
-                subset_ids = set([])
-                for idx, i in enumerate(range(len(frequencies) - 1)):
-                    event_subset, events_beyond_max_freq = _subset(
-                        frequencies[i], frequencies[i + 1], events,
-                        previous_subset_ids = subset_ids
-                    )
-
-                    # ids in subset
-                    subset_ids.update([ev['id'] for ev in event_subset])
-                
-                    """ 
-                    Two exit conditions:
-                        1) the user has no events left
-                        2) they have events but are beyond the current
-                        max frequency. 
-                    """
-                    # if the length is zero and there's no events beyond the current
-                    # max frequency (frequencies[i + 1])
-                    if (len(event_subset) == 0 and not events_beyond_max_freq):
-                        break # there's no more events
-
-                    ua_counter = defaultdict(int) # counter for all events
-                    
-                    # set the default for each of the events
-                    for event in interaction_events: ua_counter[event] = 0
+        def _fill_frequencies(user_chunk, data_chunk, counts, rows):
+            user_dict = {user: [] for user in user_chunk}
+            for d in data_chunk: user_dict[d['user']].append(d)
 
-                    for event in event_subset: # ignoring segmentCompletions events
-                        if event['action_type'] == 'segmentCompletion': continue
-                        if event['action_name'] in interaction_events:
-                            ua_counter[event['action_name']] += 1
+            # each worker counts the events of its own users (as codes into events_index)
+            # straight into their rows, so nothing is sent back
+            for user, events in user_dict.items():
+                for bucket, event_subset in _threshold_subsets(events):
+                    bucket_counts = np.bincount([
+                        event_codes[event['action_name']] for event in event_subset
+                        if event['action_type'] != 'segmentCompletion' and 
+                        event['action_name'] in event_codes
+                    ], minlength = len(events_index))
 
-                    # if pauses need to be included
                     if include_pauses:
-                        for pause in ['SP', 'MP', 'LP', 'VLP']:
-                            ua_counter[pause] = 0
-
-                        for pause, count in self._pause_counts(event_subset):
-                            ua_counter[pause] = count
+                        for pause, count in self._pause_counts(event_subset).items():
+                            bucket_counts[pause_codes[pause]] = count
 
                     # need to drop the first play pause, it always happens at the start
-                    if idx == 0 and ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] != 0:
-                        ua_counter['PLAY_PAUSE_BUTTON_CLICKED'] -= 1
+                    if bucket == 0 and play_pause_code is not None and bucket_counts[play_pause_code]:
+                        bucket_counts[play_pause_code] -= 1
 
-                    results[user][str(frequencies[i]) + '_' + str(frequencies[i + 1])] = dict(ua_counter)
-
-            return results
+                    counts[rows[user], bucket] = bucket_counts
+            return {} # (no results, as {user -> x} for _run_parallel)
         
         if not isinstance(frequencies, list):
             raise TypeError('Event Frequencies should be a list of second intervals: {0} ({1}'
@@ -673,6 +983,55 @@ class Statistics(BaseExtractor):
         if not all(isinstance(x, (int, float)) for x in frequencies):
             raise TypeError('Contents of event frequencies are not ints or floats.')
 
+        if as_array:
+            events_index = sorted(interaction_events)
+            event_codes = {event: code for code, event in enumerate(events_index)}
+            play_pause_code = event_codes.get('PLAY_PAUSE_BUTTON_CLICKED')
+            if include_pauses:
+                pause_codes = {
+                    pause: len(events_index) + code 
+                    for code, pause in enumerate(['SP', 'MP', 'LP', 'VLP'])
+                }
+                events_index += list(pause_codes)
+            buckets = [
+                str(frequencies[i]) + '_' + str(frequencies[i + 1]) 
+                for i in range(len(frequencies) - 1)
+            ]
+
+            if user_id is not None: # if a specific user is requested
+                if not isinstance(user_id, str):
+                    raise TypeError('User ID should be a string: {0} ({1})'.format(
+                user_id, type(user_id)))
+
+                if user_id not in self.data.keys():
+                    raise ValueError('Invalid user ID: {0}'.format(user_id))
+
+                # a skipped user has no row, as in the results for all of the users
+                if user_id in self.skipped_users:
+                    return EventCounts(
+                        np.zeros((0, len(buckets), len(events_index)), dtype = np.int32),
+                        [], buckets, events_index)
+
+                counts = np.zeros((1, len(buckets), len(events_index)), dtype = np.int32)
+                _fill_frequencies([user_id], self.data[user_id], counts, {user_id: 0})
+                return EventCounts(counts, [user_id], buckets, events_index)
+
+            # the skipped users are left out, the splits are contiguous blocks of rows
+            skipped = self.skipped_users
+            users = [user for user in self.data if user not in skipped]
+            rows = {user: row for row, user in enumerate(users)}
+
+            with preallocated_counts(
+                (len(users), len(buckets), len(events_index)), shared = self._num_cpu != 1
+            ) as shared_counts:
+                self._run_parallel(
+                    _fill_frequencies, 'event_frequencies', args = (shared_counts, rows),
+                    verbose = verbose)
+                with self._profiler.stage('event_frequencies', 'merge'):
+                    counts = np.array(shared_counts)
+
+            return EventCounts(counts, users, buckets, events_index)
+
         if not self._user_event_frequencies:
             if user_id is not None: # if a specific user is requested
                 if not isinstance(user_id, str):
@@ -682,19 +1041,22 @@ class Statistics(BaseExtractor):
                 if user_id not in self.data.keys():
                     raise ValueError('Invalid user ID: {0}'.format(user_id))
 
+                if user_id in self.skipped_users: return {'skipped': True} # as in the results
+
                 return _get_frequencies(
                     user_chunk = [user_id], data_chunk = self.data[user_id])[user_id]
 
             self._user_event_frequencies = {user: {} for user, d in self.data.items()}
-            parallel = Parallel(n_jobs = self._num_cpu, verbose = verbose)
 
             # run the event frequencies in parallel
-            results = parallel(delayed(_get_frequencies) (u, e) for u, e in self._split_users())
+            results = self._run_parallel(_get_frequencies, 'event_frequencies', verbose = verbose)
 
             # unpack the results and add the frequencies into the dictionary
-            for res in results:
-                for user, event_freq in res.items():
-                    self._user_event_frequencies[user].update(event_freq)
+            with self._profiler.stage('event_frequencies', 'merge'):
+                for res in results:
+                    for user, event_freq in res.items():
+                        self._user_event_frequencies[user].update(event_freq)
+                self._flag_skipped(self._user_event_frequencies)
 
             return self._user_event_frequencies 
         else:
@@ -710,8 +1072,155 @@ class Statistics(BaseExtractor):
             return self._user_event_frequencies
 
             
+    def partial_statistics(
+        self,
+        interaction_events: Set[str],
+        include_link_choices: Optional[bool] = False,
+        pauses_include_events: Optional[Set] = {},
+        pauses_exclude_events: Optional[Set] = {},
+        include_user_set_variables: Optional[bool] = False,
+        verbose: Optional[int] = 0
+    ) -> Dict:
+        """
+            The statistics of calculate_statistics as mergeable partial statistics, for
+            when the events are a shard of the users' events (e.g. a single day). The
+            partials of each shard are merged with merge_partial_statistics and turned
+            into the statistics with finalize_statistics, giving the same results as
+            calculate_statistics over all of the events.
+
+            :params interaction_events: a set of events that you want to track
+            :params include_link_choices: whether to include LC in the statistics
+            :params pauses_include_events: a set of events to include outside of the standard
+                USER_ACTION events, i.e., browser visibility and window orientation changes
+            :params pauses_exclude_events: a set of events to exclude from the pause calculations.
+            :params include_user_set_variables: whether to include USV in the statistics
+            :params verbose: verbosity level passed to joblib backend
+            :returns: a dictionary mapping users to their PartialStatistics, the skipped 
+                users (heavy_user_policy = 'skip') are left out as they have no partials
+        """
+        from .partial import PartialStatistics
+
+        if not isinstance(interaction_events, set):
+            raise TypeError('Interaction events should be a set of actions: {0} ({1})'.format(
+                interaction_events, type(interaction_events))
+            )
+
+        if len(interaction_events) == 0:
+            raise ValueError('Interaction events cannot be empty: {0}'.format(interaction_events))
+
+        params = {
+            'completion_point': self.completion_point,
+            'include_link_choices': include_link_choices,
+            'pauses_include_events': pauses_include_events,
+            'pauses_exclude_events': pauses_exclude_events,
+            'include_user_set_variables': include_user_set_variables,
+            'narrative_element_durations': self._nec_durations
+        }
+
+        def _partials(user_chunk, data_chunk):
+            user_dict = {user: [] for user in user_chunk}
+            for d in data_chunk: user_dict[d['user']].append(d)
+
+            return {
+                user: PartialStatistics.from_events(user, events, interaction_events, **params)
+                for user, events in user_dict.items()
+            }
+
+        results = self._run_parallel(_partials, 'partial_statistics', verbose = verbose)
+
+        partials = {}
+        with self._profiler.stage('partial_statistics', 'merge'):
+            for r in results: partials.update(r)
+        return partials
+
+    def event_rates(
+        self,
+        interaction_events: Set[str],
+        window: Optional[float] = 60,
+        stride: Optional[float] = 10,
+        sparse: Optional[bool] = False,
+        verbose: Optional[int] = 0
+    ) -> EventCounts:
+        """
+            The number of each interaction event in sliding windows over each user's 
+            session, e.g. a 60 second window every 10 seconds. The time is the session 
+            time less the time the experience was hidden.
+
+            :params interaction_events: the events to count
+            :params window: the length of each window in seconds
+            :params stride: the time between the start of each window in seconds
+            :params sparse: return the counts as a scipy.sparse matrix, rather than a
+                dense array (see EventCounts)
+            :params verbose: the level of output passed to the joblib backend
+            :returns: the counts (EventCounts) of the users x windows x events, the 
+                buckets are the start of each window and the rate is counts / window
+        """
+        if not isinstance(interaction_events, set):
+            raise TypeError('Interaction events should be a set of actions: {0}'.format(
+                interaction_events))
+
+        if len(interaction_events) == 0:
+            raise ValueError('Interaction events cannot be empty: {0}'.format(interaction_events))
+
+        if not isinstance(window, (int, float)) or not isinstance(stride, (int, float)):
+            raise TypeError('window and stride should be ints or floats: {0}, {1}'.format(
+                window, stride))
+
+        if window <= 0 or stride <= 0:
+            raise ValueError('window and stride should be positive: {0}, {1}'.format(
+                window, stride))
+
+        events_index = {event: idx for idx, event in enumerate(sorted(interaction_events))}
+
+        def _rates(user_chunk, data_chunk):
+            user_dict = {user: [] for user in user_chunk}
+            for d in data_chunk: user_dict[d['user']].append(d)
+
+            results = {}
+            for user, events in user_dict.items():
+                codes = np.fromiter(
+                    (events_index.get(event['action_name'], -1) for event in events), 
+                    dtype = np.int64, count = len(events))
+                results[user] = window_counts(
+                    _active_clock(events), codes, len(events_index), window, stride
+                ).astype(np.int32)
+            return results
+
+        res = self._run_parallel(_rates, 'event_rates', verbose = verbose)
+
+        with self._profiler.stage('event_rates', 'merge'):
+            user_counts = {}
+            for r in res: user_counts.update(r)
+
+            users = [user for user in self.data if user in user_counts]
+            n_windows = max((len(c) for c in user_counts.values()), default = 0)
+            window_starts = np.arange(n_windows) * stride
+            shape = (len(users), n_windows, len(events_index))
+
+            if sparse:
+                from scipy import sparse as sp # scipy is imported when it's first needed
+
+                # only the non-zero counts, the columns are (window, event) flattened
+                rows, columns, values = [], [], []
+                for row, user in enumerate(users):
+                    user_windows, user_events = np.nonzero(user_counts[user])
+                    rows.append(np.full(len(user_windows), row, dtype = np.int32))
+                    columns.append(user_windows * len(events_index) + user_events)
+                    values.append(user_counts[user][user_windows, user_events])
+                counts = sp.csr_matrix((
+                    np.concatenate(values or [np.zeros(0, dtype = np.int32)]), (
+                        np.concatenate(rows or [np.zeros(0, dtype = np.int32)]), 
+                        np.concatenate(columns or [np.zeros(0, dtype = np.int64)]))
+                ), shape = (len(users), n_windows * len(events_index)))
+            else:
+                counts = np.zeros(shape, dtype = np.int32)
+                for row, user in enumerate(users):
+                    counts[row, :len(user_counts[user])] = user_counts[user]
+
+        return EventCounts(counts, users, window_starts, list(events_index))
+
     def calculate_statistics(
-        self, 
+        self,
         interaction_events: List[str],
         user_id: Optional[str] = None,
         include_link_choices: Optional[bool] = False,
@@ -793,11 +1302,12 @@ class Statistics(BaseExtractor):
                 verbose = verbose
             )
             
-            for user in self._users: # build up the statistics dictionary
-                self._statistics[user] = {}
-                self._statistics[user].update(self._time_statistics[user])
-                self._statistics[user].update(self._pause_statistics[user])
-                self._statistics[user].update(self._event_statistics[user])
+            with self._profiler.stage('calculate_statistics', 'merge'):
+                for user in self._users: # build up the statistics dictionary
+                    self._statistics[user] = {}
+                    self._statistics[user].update(self._time_statistics[user])
+                    self._statistics[user].update(self._pause_statistics[user])
+                    self._statistics[user].update(self._event_statistics[user])
 
             return self._statistics
         else: # else, the statistics have been previously calculated
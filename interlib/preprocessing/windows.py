@@ -0,0 +1,139 @@
+"""
+Array outputs for the per-user event counts over time (users x buckets x events), an
+alternative to the nested dictionaries for large numbers of users.
+"""
+
+import os
+import shutil
+import tempfile
+
+from contextlib import contextmanager
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+
+class EventCounts():
+    """
+        The number of each event in each time bucket (or window) of each user. counts is
+        either a dense array of shape (n_users, n_buckets, n_events) or a scipy.sparse
+        CSR matrix of shape (n_users, n_buckets * n_events), where the row of a user is
+        their (n_buckets, n_events) counts flattened. The users, buckets and events
+        give the index of each axis.
+    """
+
+    def __init__(
+        self,
+        counts,
+        users: Sequence[str],
+        buckets: Sequence,
+        events: Sequence[str]
+    ) -> None:
+        """
+            :params counts: the dense array or sparse matrix of the counts
+            :params users: the user of each row
+            :params buckets: the label of each bucket, e.g. the start of each window
+            :params events: the event of each column
+        """
+        self.counts = counts
+        self.users = np.asarray(users, dtype = object)
+        self.buckets = np.asarray(buckets)
+        self.events = np.asarray(events, dtype = object)
+        self._user_rows = {user: row for row, user in enumerate(self.users)}
+
+    @property
+    def shape(self) -> Tuple[int, int, int]:
+        """ (n_users, n_buckets, n_events), for both the dense and sparse counts """
+        return (len(self.users), len(self.buckets), len(self.events))
+
+    @property
+    def is_sparse(self) -> bool:
+        return not isinstance(self.counts, np.ndarray)
+
+    def user(self, user: str) -> np.ndarray:
+        """
+            :params user: the user id
+            :returns: the user's counts as a dense (n_buckets, n_events) array
+        """
+        if user not in self._user_rows:
+            raise ValueError('Invalid user id: {0}'.format(user))
+
+        row = self._user_rows[user]
+        if self.is_sparse:
+            return self.counts[row].toarray().reshape(self.shape[1:])
+        return self.counts[row]
+
+    def to_dense(self) -> np.ndarray:
+        """ :returns: the counts as a dense (n_users, n_buckets, n_events) array """
+        if self.is_sparse: return self.counts.toarray().reshape(self.shape)
+        return self.counts
+
+
+def window_counts(
+    clock: np.ndarray,
+    codes: np.ndarray,
+    n_events: int,
+    window: float,
+    stride: float,
+    n_windows: Optional[int] = None
+) -> np.ndarray:
+    """
+        Count the events in each sliding window from the cumulative counts at the window
+        boundaries, so the cost is linear in the events however much the windows overlap.
+
+        :params clock: the (sorted) time of each event in seconds
+        :params codes: the index of each event, -1 for the events that aren't counted
+        :params n_events: the number of different events
+        :params window: the length of each window in seconds
+        :params stride: the time between the start of each window in seconds
+        :params n_windows: the number of windows, default is up to the last event
+        :returns: the counts, an (n_windows, n_events) array where the window k is the
+            events with k * stride <= time < k * stride + window
+    """
+    if n_windows is None:
+        n_windows = int(clock[-1] // stride) + 1 if len(clock) else 0
+
+    starts = np.arange(n_windows) * stride
+    bounds = np.unique(np.concatenate([starts, starts + window]))
+
+    # the number of each event between consecutive boundaries, then the cumulative
+    # counts before each boundary
+    counted = codes >= 0
+    intervals = np.searchsorted(bounds, clock[counted], side = 'right') - 1
+    in_range = intervals >= 0
+    histogram = np.bincount(
+        intervals[in_range] * n_events + codes[counted][in_range],
+        minlength = (len(bounds) + 1) * n_events
+    ).reshape(len(bounds) + 1, n_events)
+    cumulative = np.concatenate([
+        np.zeros((1, n_events), dtype = np.int64), np.cumsum(histogram, axis = 0)])
+
+    return (
+        cumulative[np.searchsorted(bounds, starts + window)] -
+        cumulative[np.searchsorted(bounds, starts)]
+    )
+
+
+@contextmanager
+def preallocated_counts(shape: Tuple[int, ...], shared: Optional[bool] = True):
+    """
+        A zeroed int32 array for the workers to fill in place. When shared, the array is
+        a memmap in a temporary folder, which joblib passes to the worker processes by
+        reference, so each worker writes its block of rows directly into it. The folder
+        is removed on exit, so keep the copy from np.array() rather than the memmap.
+
+        :params shape: the shape of the array
+        :params shared: whether the array is shared with other processes
+    """
+    if not shared or 0 in shape:
+        yield np.zeros(shape, dtype = np.int32)
+        return
+
+    folder = tempfile.mkdtemp(prefix = 'interlib_')
+    try:
+        counts = np.memmap(
+            os.path.join(folder, 'counts.mmap'), dtype = np.int32, mode = 'w+', shape = shape)
+        yield counts
+        del counts
+    finally:
+        shutil.rmtree(folder, ignore_errors = True)
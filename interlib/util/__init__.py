@@ -5,4 +5,9 @@ Utility functions and helpers for the library
 # ----- Imports ------
 
 from .helpers import *
-from .data import *
\ No newline at end of file
+from .event import *
+from .data import *
+from .partitions import *
+from .sketch import *
+from .ingest import *
+from .parse import *
@@ -7,20 +7,90 @@ from typing import (
     Union, 
     List,
     Dict,
-    Set
+    Set,
+    Tuple,
+    Iterator,
+    TYPE_CHECKING
 )
-from datetime import datetime as dt
+from collections import defaultdict
+from datetime import datetime as dt, timedelta
 
-import json, os
+import json, os, re
 import numpy as np
-import pandas as pd 
+
+if TYPE_CHECKING: # pandas is only imported when a DataFrame is requested
+    import pandas as pd
+
+from .helpers import is_sorted, intern_symbol
+from .event import Event, EventData
+
+
+def _parse_message(datum: Dict) -> Dict:
+    """ the parsed message data of a raw event (the 'message' field, or else 'data') """
+    return json.loads(datum['message'] if 'message' in datum else datum['data'])
+
+
+def _pad_timestamp(timestamp: str) -> str:
+    """ a raw timestamp string, with the milliseconds added if they're missing, to parse """
+    if len(timestamp) < 24: timestamp = timestamp + '.000'
+    return timestamp[:23]
+
+
+def _parse_timestamp_string(timestamp: str, datetime_format: str) -> dt:
+    """ parse a timestamp string in the raw format (see parse_raw_data) """
+    return dt.strptime(_pad_timestamp(timestamp), datetime_format)
+
+
+def _make_event(
+    event_id: Union[int, str],
+    user: str,
+    timestamp: dt,
+    action_type: str,
+    action_name: str,
+    data: Dict,
+    narrative_element: Optional[str] = None,
+    compact: Optional[bool] = False,
+    intern_symbols: Optional[bool] = True
+) -> Union[Dict, Event]:
+    """
+        Build an event (in the format returned by parse_raw_data) from its fields, this
+        is shared by all of the readers of the raw data.
+
+        :params data: the parsed message of the event
+        :params narrative_element: included in the event if not None
+        :params compact: build an Event record rather than a dict
+        :params intern_symbols: intern the categorical fields (see intern_symbol)
+        :returns: the event
+    """
+    symbol = intern_symbol if intern_symbols else lambda value: value
+
+    if compact:
+        event_data = EventData.from_dict(data)
+        event_data.romper_to_state = symbol(event_data.romper_to_state)
+        return Event(
+            event_id, symbol(user), timestamp, symbol(action_type), symbol(action_name),
+            event_data, narrative_element)
+
+    event_data = {symbol(k): v for k, v in data.items()}
+    if 'romper_to_state' in event_data:
+        event_data['romper_to_state'] = symbol(event_data['romper_to_state'])
+
+    event = {
+        'id': event_id, 'user': symbol(user), 'timestamp': timestamp,
+        'action_type': symbol(action_type), 'action_name': symbol(action_name),
+        'data': event_data
+    }
+    if narrative_element is not None: event['narrative_element'] = narrative_element
+    return event
 
 
 def parse_raw_data(
     raw_data: List[Dict], 
     datetime_format: str = "%Y-%m-%d %H:%M:%S.%f", 
-    include_narrative_element_id: bool = False
-) -> List[Dict]:
+    include_narrative_element_id: bool = False,
+    compact: bool = False,
+    intern_symbols: bool = True
+) -> List[Union[Dict, Event]]:
     """
         Given a list of raw data, parse it into the format that is used
         to user events.
@@ -28,37 +98,23 @@ def parse_raw_data(
         :params raw_data: a list of events (dictionaries)
         :params datetime_format: the format to parse the timestamp string
         :params include_narrative_element_id: do you want to include this field
+        :params compact: parse into compact Event records rather than dicts, these
+            only keep the fields of the data that the library uses
+        :params intern_symbols: intern the categorical fields (action_type, action_name,
+            user, romper_to_state and the data keys) so each distinct value is only 
+            stored once, see intern_symbol
         :returns: data parsed as a list of events
     """
-    parsed_data = []
-
-    for datum in raw_data:
-        # parse the message data
-        if 'message' in datum.keys():
-            parse_message = json.loads(datum['message'])
-        else:
-            parse_message = json.loads(datum['data'])
-        nested_data = {}
-        for key in parse_message:
-            nested_data[key] = parse_message[key]
-
-        # parse the timestamp into a datetime object
-        timestamp = datum['timestamp']
-        if len(timestamp) < 24: timestamp = timestamp + '.000'
-        timestamp = dt.strptime(timestamp[:23], datetime_format)
-
-        p_data = {
-            'id': datum['id'], 'user': datum['userid'],
-            'timestamp': timestamp, 'action_type': datum['item'],
-            'action_name': datum['action'], 'data': nested_data
-        }
-
-        if include_narrative_element_id:
-            p_data.update({'narrative_element': datum['narrative_element']})
-
-        parsed_data.append(p_data)
-
-    return parsed_data
+    return [
+        _make_event(
+            datum['id'], datum['userid'],
+            _parse_timestamp_string(datum['timestamp'], datetime_format),
+            datum['item'], datum['action'], _parse_message(datum),
+            datum['narrative_element'] if include_narrative_element_id else None,
+            compact, intern_symbols
+        )
+        for datum in raw_data
+    ]
 
 
 def parse_timestamp(
@@ -73,12 +129,7 @@ def parse_timestamp(
         :returns: updated data parameter
     """
     for event in data:
-        timestamp = event['timestamp']
-        if len(timestamp) < 24: timestamp = timestamp + '.000'
-        event.update(
-            (k , dt.strptime(timestamp[:23], datetime_format))
-            for k, v in event.items() if k == 'timestamp'
-        )
+        event['timestamp'] = _parse_timestamp_string(event['timestamp'], datetime_format)
     return data
 
 
@@ -104,7 +155,9 @@ def to_dict(
     sort: Optional[bool] = True,
     users_to_include: Optional[Set[str]] = None,
     start_button_filter: Optional[bool] = True,
-    already_parsed: Optional[bool] = False
+    already_parsed: Optional[bool] = False,
+    compact: Optional[bool] = False,
+    intern_symbols: Optional[bool] = True
 ) -> Union[Dict[str, List], List[Dict[str, List]]]:
     """
         Utility function to convert a raw dataset (in a json export from DB
@@ -117,10 +170,14 @@ def to_dict(
             datetime
         :params include_narrative_element: whether to include narrative element
             changes
-        :params sort: whether or not to sort the data by the timestamp.
+        :params sort: whether or not to sort the data by the timestamp. The sorted output
+            can be passed to the extractors with presorted = True to skip re-checking the order.
         :params users_to_include: a subset of user_ids that you want to extract the data for
         :params start_button_filter: only include users that have clicked the Start button, 
             indicating that they have accepted the data collection policy.
+        :params compact: use compact Event records rather than dicts for the events (see 
+            parse_raw_data), these can be passed to the extractors in the same way.
+        :params intern_symbols: intern the categorical fields while parsing (see parse_raw_data)
         :returns: dictionary of values: {user -> events} or, if split, then
             a list of dictionaries in [{user -> events}] format
     """
@@ -145,11 +202,14 @@ def to_dict(
     with open(path, 'r') as in_file: # read in the data provided
         if already_parsed:
             data = parse_timestamp(json.load(in_file), datetime_format)
+            if compact: data = [Event.from_dict(event) for event in data]
         else:
             data = parse_raw_data( # parse into our internal format at the same time
                 json.load(in_file), 
                 datetime_format, 
-                include_narrative_element_id
+                include_narrative_element_id,
+                compact,
+                intern_symbols
             )
     
     if start_button_filter:
@@ -195,9 +255,10 @@ def to_dict(
                 if event['user'] in user_ids: # if that user is in this segment
                     user_events[event['user']].append(event)
             
-            if sort: # if sort, then sort by timestamp
+            if sort: # if sort, then sort by timestamp (only those that are out of order)
                 for user in user_events.copy().keys():
-                    user_events[user] = sorted(user_events[user], key = lambda x: x['timestamp'])
+                    if not is_sorted(user_events[user]):
+                        user_events[user] = sorted(user_events[user], key = lambda x: x['timestamp'])
 
 
                 # for user, event in user_events.copy().items():
@@ -208,39 +269,58 @@ def to_dict(
 
         return events
     else:
-        if users_to_include:
-            user_ids = {
-                event['user'] for event in data if event['user'] in users_to_include
-            }
-        else:
-            user_ids = {event['user'] for event in data}
+        return _group_user_events(data, users_to_include, start_button_filter, sort)
 
-        if start_button_filter:
-            clicked_start_button = _get_users_clicked_start_button(data)
+def _group_user_events(
+    data: List[Dict],
+    users_to_include: Optional[Set[str]] = None,
+    start_button_filter: Optional[bool] = True,
+    sort: Optional[bool] = True
+) -> Dict[str, List]:
+    """
+        Group the parsed events into the {user -> events} format (see to_dict).
 
-        # build up the user events dict {user -> [events]}
-        user_events = {id: [] for id in user_ids}
+        :params data: the parsed events
+        :params users_to_include: a subset of user_ids that you want to extract the data for
+        :params start_button_filter: only include the events of users that have clicked 
+            the Start button
+        :params sort: whether or not to sort the data by the timestamp
+        :returns: dictionary of values: {user -> events}
+    """
+    if users_to_include:
+        user_ids = {
+            event['user'] for event in data if event['user'] in users_to_include
+        }
+    else:
+        user_ids = {event['user'] for event in data}
 
-        if start_button_filter:
-            for event in data:
-                if (event['user'] in user_ids and event['user'] in clicked_start_button):
-                    user_events[event['user']].append(event)
-        else:
-            for event in data:
-                if event['user'] in user_ids:
-                    user_events[event['user']].append(event)
-        
-        if sort:
-            # sort the events by the timestamp
-            for user, events in user_events.copy().items():
+    if start_button_filter:
+        clicked_start_button = _get_users_clicked_start_button(data)
+
+    # build up the user events dict {user -> [events]}
+    user_events = {id: [] for id in user_ids}
+
+    if start_button_filter:
+        for event in data:
+            if (event['user'] in user_ids and event['user'] in clicked_start_button):
+                user_events[event['user']].append(event)
+    else:
+        for event in data:
+            if event['user'] in user_ids:
+                user_events[event['user']].append(event)
+    
+    if sort:
+        # sort the events by the timestamp (only those that are out of order)
+        for user, events in user_events.copy().items():
+            if not is_sorted(events):
                 user_events[user] = sorted(events, key = lambda x: x['timestamp'])
 
-        return user_events
+    return user_events
 
 def to_dataframe(
     result_dictionary: Dict[str, Dict], 
     key_name: Optional[str] = 'user'
-) -> pd.DataFrame:
+) -> 'pd.DataFrame':
     """ 
         Given a dictionary of results, from the statistics package,
         convert it into a pandas dataframe format.
@@ -253,6 +333,8 @@ def to_dataframe(
         raise TypeError(f"result_dictionary should be a dictionary and be the output from the " +
                         f"Statistics package, current type: {type(result_dictionary)}")
 
+    import pandas as pd
+
     return pd.DataFrame.from_dict(
         result_dictionary, orient = 'index'
     ).reset_index().rename(columns = {'index': key_name})
@@ -339,6 +421,33 @@ def events_between_two_points(
             then you need to set this to true (default = False)
         :returns: dictionary of user events
     """
+    return events_between_multiple_points(
+        user_events, 
+        [(start_point, end_point)], 
+        filter = filter, 
+        using_representation_id = using_representation_id
+    )[(start_point, end_point)]
+
+def events_between_multiple_points(
+    user_events: Dict[str, List],
+    points: List[Tuple[str, str]],
+    filter: bool = False,
+    using_representation_id: bool = False
+) -> Dict[Tuple[str, str], Dict[str, List]]:
+    """
+        Batch version of events_between_two_points. Given a list of (start_point, end_point)
+        pairs, extract the events between each pair for all users, using a single pass
+        over each user's events (rather than one pass per pair).
+
+        :params user_events: dictionary of user events ({user -> [events]})
+        :params points: a list of (start_point, end_point) tuples, each a romper_to_state value
+            (or representation id, see using_representation_id)
+        :params filter: remove users with empty event lists (default = False)
+        :params using_representation_id: if you're passing representation ids rather than
+            romper_to_state values, then set this to true (default = False)
+        :returns: dictionary mapping each (start_point, end_point) pair to a dictionary 
+            of user events
+    """
     if not isinstance(user_events, dict): 
         raise ValueError(f"user_events must be a dictionary (current type: {type(user_events)}")
     elif len(user_events) == 0:
@@ -346,71 +455,79 @@ def events_between_two_points(
     elif not all(isinstance(l, list) for l in user_events.values()):
         raise ValueError(f"the values in user_events should be lists of events")
 
-    # add all users to dictionary with empty lists
-    events_subset = {user: [] for user in user_events.keys()}
+    if not isinstance(points, list):
+        raise TypeError(f"points should be a list of (start, end) tuples, current type: {type(points)}")
+    elif not all(isinstance(p, tuple) and len(p) == 2 for p in points):
+        raise ValueError(f"each item in points should be a (start_point, end_point) tuple")
+
+    points = list(dict.fromkeys(points)) # remove any duplicate pairs, preserving the order
+    field = 'current_narrative_element' if using_representation_id else 'romper_to_state'
+
+    # index the pairs by their start point, so each event only needs a single lookup
+    pairs_by_start = defaultdict(list)
+    for pair in points:
+        pairs_by_start[pair[0]].append(pair)
+
+    # add all users to each of the subsets with empty lists
+    events_subsets = {pair: {user: [] for user in user_events.keys()} for pair in points}
 
     for user, events in user_events.items():
-        # find the starting point index
-        start_idx = None 
-        for idx, event in enumerate(events):
-            if (event['action_type'] == 'STORY_NAVIGATION' and 
-                event['data']['romper_to_state'] == start_point and 
-                not using_representation_id
-            ):
-                start_idx = idx 
-                break
-            elif (event['action_type'] == 'STORY_NAVIGATION' and 
-                using_representation_id and 
-                event['data']['current_narrative_element'] == start_point
-            ):
-                start_idx = idx 
-                break 
-        
-        # iterate from that index, adding events until you reach the end
-        if start_idx is not None:
-            for idx, event in enumerate(events[start_idx:]):
-                # is the current event the one where they move to the end point?
-                if (event['action_type'] == 'STORY_NAVIGATION' and 
-                    event['data']['romper_to_state'] == end_point and 
-                    not using_representation_id
-                ):
-                    events_subset[user].append(event) # add the event
-                    break # exit, we've reached the endpoint
-                elif (event['action_type'] == 'STORY_NAVIGATION' and 
-                    using_representation_id and 
-                    event['data']['current_narrative_element'] == end_point
-                ):
-                    events_subset[user].append(event) # add the event 
-                    break # exit, we've reached the end point
-                else:
-                    events_subset[user].append(event)
+        waiting = dict(pairs_by_start) # the pairs where the start point hasn't been seen
+        open_pairs = [] # the pairs that are currently collecting events
+
+        for event in events:
+            if event['action_type'] == 'STORY_NAVIGATION':
+                state = event['data'][field]
+
+                # open any pairs that start at this point (the first occurrence only)
+                if state in waiting:
+                    open_pairs.extend(waiting.pop(state))
+            else:
+                state = None
+
+            if not open_pairs:
+                if not waiting: break # nothing is open and nothing can be opened
+                continue
+
+            still_open = []
+            for pair in open_pairs:
+                events_subsets[pair][user].append(event) # add the event
+                if state is None or state != pair[1]: # not reached the end point yet
+                    still_open.append(pair)
+            open_pairs = still_open
     
     if filter: # if we're asked to remove empty lists
         return {
-            user: events 
-            for user, events in events_subset.items() # for all users -> events
-            if events # if the list contains some events
+            pair: {user: events for user, events in subset.items() if events}
+            for pair, subset in events_subsets.items()
         }
     else:
-        return events_subset
+        return events_subsets
 
 def events_to_threshold(
     user_events: Dict[str, List],
-    threshold: Union[int, float],
-) -> Dict[str, List]:
+    threshold: Union[int, float, List[Union[int, float]]],
+) -> Union[Dict[str, List], Dict[Union[int, float], Dict[str, List]]]:
     """
         Given a dictionary of user events, filter the events down to
         those that happen up until the threshold. For example, if the
         threshold is set to 300 (indicating 5 minutes), then the function
         return a dictionary contain the users' events up until the 5 minute
-        threshold.
+        threshold (including the first event beyond the threshold).
+
+        Multiple thresholds can be passed as a list, e.g. [300, 600, 900], in
+        which case all of the prefixes are found in a single call. The cut-off
+        points are found using a binary search over each user's timestamps, so
+        the events must be sorted by timestamp.
 
         There is an assumption that all of the users in the dictionary have been
         pre-filtered to only include those that got up to, or past, the threshold.
 
-        :params user_events:
-        :params threshold:
-        :returns:
+        :params user_events: dictionary of user events ({user -> [events]})
+        :params threshold: the threshold in seconds, or a list of thresholds
+        :returns: dictionary of user events up until the threshold or, if a list 
+            of thresholds is passed, a dictionary mapping each threshold to the
+            dictionary of user events
     """
     if not isinstance(user_events, dict): 
         raise ValueError(f"user_events must be a dictionary (current type: {type(user_events)}")
@@ -419,24 +536,440 @@ def events_to_threshold(
     elif not all(isinstance(l, list) for l in user_events.values()):
         raise ValueError(f"the values in user_events should be lists of events")
 
-    filtered_user_events = {}
+    thresholds = threshold if isinstance(threshold, list) else [threshold]
+    if not all(isinstance(t, (int, float)) for t in thresholds):
+        raise TypeError(f"threshold should be an int/float or a list of int/float: {threshold}")
+
+    # the thresholds as microsecond offsets, the same resolution as the timestamps
+    offsets = np.array(
+        [np.floor(t * 1e6) for t in thresholds], dtype = np.int64
+    ).astype('timedelta64[us]')
+
+    filtered_user_events = {t: {} for t in thresholds}
     for user, events in user_events.items():
-        events_threshold = []
-        first_event_timestamp = None 
-        
-        for event in events:
-            if first_event_timestamp is None:
-                first_event_timestamp = event['timestamp']
-                events_threshold.append(event)
-                continue 
-            
-            # if the difference between the first and current event is greater than the threshold
-            if (event['timestamp'] - first_event_timestamp).total_seconds() > threshold:
-                events_threshold.append(event)
-                break # exit as we've met the threshold
-            else:
-                events_threshold.append(event)
+        if len(events) == 0:
+            for t in thresholds: filtered_user_events[t][user] = []
+            continue
+
+        timestamps = np.array([event['timestamp'] for event in events], dtype = 'datetime64[us]')
+
+        # the number of events at (or before) each threshold, then plus one to include
+        # the first event that is beyond the threshold. The first event is always included.
+        cut_offs = np.searchsorted(timestamps[1:], timestamps[0] + offsets, side = 'right') + 2
+
+        for t, cut_off in zip(thresholds, cut_offs):
+            filtered_user_events[t][user] = events[:cut_off]
+
+    if isinstance(threshold, list):
+        return filtered_user_events
+    return filtered_user_events[threshold]
+
 
-        filtered_user_events[user] = events_threshold
+# ----- Parquet / Arrow -----
 
-    return filtered_user_events            
+# the columns of the raw data (as exported from the DB) and the data fields used by the library
+RAW_COLUMNS = ('id', 'userid', 'timestamp', 'item', 'action')
+DATA_FIELDS = ('romper_to_state', 'romper_from_state', 'current_narrative_element')
+
+
+def _import_pyarrow():
+    """ pyarrow is an optional dependency, only needed for reading/writing Parquet """
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError('Reading and writing Parquet requires pyarrow: pip install pyarrow') from e
+    return pa, ds, pq
+
+
+def _parquet_columns(
+    schema,
+    path: Union[str, List[str]],
+    include_narrative_element_id: bool,
+    data_fields: Tuple[str]
+) -> Tuple[List[str], Optional[str], List[str]]:
+    """
+        The columns of the raw events to read from Parquet (see from_parquet).
+
+        :returns: the columns, the message (or data) column the data is read from (None 
+            if it's read from the data field columns) and the data field columns
+    """
+    missing_columns = set(RAW_COLUMNS) - set(schema.names)
+    if missing_columns:
+        raise ValueError('Missing columns in {0}: {1}'.format(path, missing_columns))
+
+    # which columns the data is read from
+    message_column = next((c for c in ('message', 'data') if c in schema.names), None)
+    field_columns = [f for f in data_fields if f in schema.names]
+    if field_columns: 
+        message_column = None # prefer the individual columns
+    elif message_column is None:
+        raise ValueError('No message/data column or data field columns in {0}'.format(path))
+
+    columns = list(RAW_COLUMNS) + (field_columns or [message_column])
+    if include_narrative_element_id: columns.append('narrativeelement')
+    return columns, message_column, field_columns
+
+
+def from_parquet(
+    path: Union[str, List[str]],
+    users_to_include: Optional[Set[str]] = None,
+    start_time: Optional[dt] = None,
+    end_time: Optional[dt] = None,
+    datetime_format: Optional[str] = "%Y-%m-%d %H:%M:%S.%f",
+    include_narrative_element_id: Optional[bool] = False,
+    start_button_filter: Optional[bool] = True,
+    sort: Optional[bool] = True,
+    compact: Optional[bool] = False,
+    data_fields: Optional[Tuple[str]] = DATA_FIELDS
+) -> Dict[str, List]:
+    """
+        Read the raw events from Parquet (a file, a list of files or a directory of 
+        (hive) partitioned files) into the format that is internally used: {user -> events}.
+
+        The files have the same columns as the raw data (id, userid, timestamp, item, action
+        and narrativeelement). The data of the events is read from either a struct message 
+        (or data) column or from a column per field, e.g. romper_to_state. Only the columns 
+        that are needed are read and the user and time filters are pushed down to the 
+        reader, so row groups and partitions that don't match are skipped. A string 
+        message column (JSON, as in the raw data) is also supported but is much slower.
+
+        :params path: the path(s) to the Parquet file(s) or directory
+        :params users_to_include: a subset of user_ids that you want to extract the data for
+        :params start_time: only include the events at or after this time
+        :params end_time: only include the events before this time
+        :params datetime_format: the format of the timestamps, if they are stored as strings
+        :params include_narrative_element_id: whether to include the narrative element
+        :params start_button_filter: only include users that have clicked the Start button
+        :params sort: whether or not to sort each user's events by the timestamp
+        :params compact: use compact Event records rather than dicts for the events
+        :params data_fields: the fields of the data (message) to read
+        :returns: dictionary of values: {user -> events}
+    """
+    pa, ds, _ = _import_pyarrow()
+    import pyarrow.compute as pc
+
+    if users_to_include is not None and not isinstance(users_to_include, set):
+        raise TypeError('users_to_include should be a set: {0} ({1})'.format(
+            users_to_include, type(users_to_include)))
+
+    for t in (start_time, end_time):
+        if t is not None and not isinstance(t, dt):
+            raise TypeError('start_time and end_time should be datetimes: {0} ({1})'.format(
+                t, type(t)))
+
+    dataset = ds.dataset(path, format = 'parquet', partitioning = 'hive')
+    schema = dataset.schema
+
+    columns, message_column, field_columns = _parquet_columns(
+        schema, path, include_narrative_element_id, data_fields)
+
+    # push the user and time filters down to the reader
+    user_filter = None
+    if users_to_include is not None:
+        user_filter = ds.field('userid').isin(list(users_to_include))
+
+    if start_button_filter:
+        start_filter = ds.field('action') == 'START_BUTTON_CLICKED'
+        if user_filter is not None: start_filter = start_filter & user_filter
+
+        clicked_start_button = dataset.to_table(columns = ['userid'], filter = start_filter)
+        user_filter = ds.field('userid').isin(
+            clicked_start_button.column('userid').unique())
+
+    row_filter, exact_time_filter = user_filter, False
+    timestamp_type = schema.field('timestamp').type
+    for t, op in ((start_time, '__ge__'), (end_time, '__lt__')):
+        if t is None: continue
+
+        if pa.types.is_timestamp(timestamp_type):
+            time_filter = getattr(ds.field('timestamp'), op)(pa.scalar(t, type = timestamp_type))
+        elif datetime_format == "%Y-%m-%d %H:%M:%S.%f":
+            # the strings sort by time, filter on the second and then exactly once parsed
+            second = t.replace(microsecond = 0)
+            if op == '__lt__': second = second + timedelta(seconds = 1)
+            time_filter = getattr(ds.field('timestamp'), op)(second.strftime('%Y-%m-%d %H:%M:%S'))
+            exact_time_filter = True
+        else:
+            exact_time_filter = True
+            continue
+
+        row_filter = time_filter if row_filter is None else row_filter & time_filter
+
+    table = dataset.to_table(columns = columns, filter = row_filter)
+
+    # group the events by user (and time) so each user is a contiguous run of rows
+    sort_keys = [('userid', 'ascending')]
+    if sort: # the ids break ties, the order of the rows can change between partitions
+        sort_keys.extend([('timestamp', 'ascending'), ('id', 'ascending')])
+    table = table.take(pc.sort_indices(table, sort_keys = sort_keys)) # (Table.sort_by is 7.0+)
+
+    users = table.column('userid').to_pylist()
+    if pa.types.is_timestamp(timestamp_type) and timestamp_type.unit == 'ns':
+        # datetimes only have microsecond precision
+        table = table.set_column(
+            table.schema.get_field_index('timestamp'), 'timestamp', 
+            table.column('timestamp').cast(pa.timestamp('us', timestamp_type.tz), safe = False))
+    timestamps = table.column('timestamp').to_pylist()
+    if not pa.types.is_timestamp(timestamp_type):
+        timestamps = [_parse_timestamp_string(t, datetime_format) for t in timestamps]
+
+    if field_columns:
+        field_values = [table.column(f).to_pylist() for f in field_columns]
+        data = [dict(zip(field_columns, values)) for values in zip(*field_values)]
+    elif pa.types.is_struct(schema.field(message_column).type):
+        data = table.column(message_column).to_pylist()
+    else:
+        data = [json.loads(message) for message in table.column(message_column).to_pylist()]
+
+    narrative_elements = (
+        table.column('narrativeelement').to_pylist() 
+        if include_narrative_element_id else [None] * len(users))
+
+    user_events = {}
+    for user, event_id, timestamp, action_type, action_name, event_data, narrative_element in zip(
+        users, table.column('id').to_pylist(), timestamps, table.column('item').to_pylist(),
+        table.column('action').to_pylist(), data, narrative_elements
+    ):
+        if exact_time_filter and (
+            (start_time is not None and timestamp < start_time) or 
+            (end_time is not None and timestamp >= end_time)):
+            continue
+
+        events = user_events.get(user)
+        if events is None: events = user_events[intern_symbol(user)] = []
+
+        # null columns/struct fields are fields that are missing from the message
+        event_data = {k: v for k, v in (event_data or {}).items() if v is not None}
+        events.append(_make_event(
+            event_id, user, timestamp, action_type, action_name, event_data, 
+            narrative_element if include_narrative_element_id else None, compact))
+
+    return user_events
+
+
+def to_parquet(
+    result_dictionary: Dict[str, Union[Dict, List]],
+    path: str,
+    key_name: Optional[str] = 'user',
+    value_name: Optional[str] = 'sequence'
+) -> None:
+    """
+        Write a dictionary of results (e.g. from Statistics or Sequences) to Parquet. 
+        When the results are dictionaries (statistics) each is written as a row, with 
+        a column per statistic, otherwise (sequences) the results are written to the
+        value_name column.
+
+        :params result_dictionary: the results {user -> results}
+        :params path: the path to write the Parquet file to
+        :params key_name: the name of the column for the keys (users)
+        :params value_name: the name of the column for the values, if they're not dicts
+    """
+    pa, _, pq = _import_pyarrow()
+
+    if not isinstance(result_dictionary, dict):
+        raise TypeError(f"result_dictionary should be a dictionary and be the output from the " +
+                        f"Statistics or Sequences package, current type: {type(result_dictionary)}")
+
+    rows = []
+    for key, value in result_dictionary.items():
+        if isinstance(value, dict): rows.append({key_name: key, **value})
+        else: rows.append({key_name: key, value_name: value})
+
+    # a column for each of the fields of any of the rows (Table.from_pylist is 7.0+)
+    columns = list(dict.fromkeys(field for row in rows for field in row))
+    pq.write_table(pa.table({c: [row.get(c) for row in rows] for c in columns}), path)
+
+
+# ----- SQL -----
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)?$')
+
+# the most users bound in one query (one parameter each), well under the limits of the
+# drivers (e.g. 999 parameters in older versions of SQLite), more are queried in batches
+_MAX_QUERY_USERS = 500
+
+
+def _placeholder(paramstyle: str, idx: int) -> str:
+    """ the placeholder for the idx-th query parameter in the DB-API paramstyle """
+    if paramstyle == 'qmark': return '?'
+    if paramstyle == 'format': return '%s'
+    if paramstyle == 'numeric': return ':{0}'.format(idx + 1)
+    if paramstyle == 'named': return ':p{0}'.format(idx)
+    if paramstyle == 'pyformat': return '%(p{0})s'.format(idx)
+    raise ValueError('Unknown paramstyle: {0}'.format(paramstyle))
+
+
+def _events_query(
+    table: str,
+    users_to_include: Optional[Set[str]] = None,
+    start_time: Optional[dt] = None,
+    end_time: Optional[dt] = None,
+    start_button_filter: Optional[bool] = True,
+    include_narrative_element_id: Optional[bool] = False,
+    paramstyle: Optional[str] = 'qmark'
+) -> Tuple[str, Union[List, Dict]]:
+    """
+        Build the (parameterised) query for the raw events, with the filters in 
+        the where clause and the events ordered by user and time. Each of the
+        users_to_include is a parameter, see iter_sql_users for the batches of users.
+
+        :returns: the query and its parameters
+    """
+    if not _IDENTIFIER.match(table):
+        raise ValueError('Invalid table name: {0}'.format(table))
+
+    columns = ['id', 'userid', 'timestamp', 'item', 'action', 'message']
+    if include_narrative_element_id: columns.append('narrativeelement')
+
+    conditions, params = [], []
+    def _param(value):
+        params.append(value)
+        return _placeholder(paramstyle, len(params) - 1)
+
+    if users_to_include is not None:
+        conditions.append('userid IN ({0})'.format(
+            ', '.join(_param(user) for user in sorted(users_to_include))) 
+            if users_to_include else '1 = 0')
+
+    if start_button_filter:
+        conditions.append(
+            'userid IN (SELECT userid FROM {0} WHERE action = {1})'.format(
+                table, _param('START_BUTTON_CLICKED')))
+
+    # the timestamps are stored as strings (that sort by time), so filter on the 
+    # second and then exactly once the timestamps have been parsed
+    if start_time is not None:
+        conditions.append('timestamp >= {0}'.format(
+            _param(start_time.replace(microsecond = 0).strftime('%Y-%m-%d %H:%M:%S'))))
+
+    if end_time is not None:
+        end_second = end_time.replace(microsecond = 0) + timedelta(seconds = 1)
+        conditions.append('timestamp < {0}'.format(
+            _param(end_second.strftime('%Y-%m-%d %H:%M:%S'))))
+
+    query = 'SELECT {0} FROM {1}'.format(', '.join(columns), table)
+    if conditions: query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY userid, timestamp, id'
+
+    if paramstyle in ('named', 'pyformat'):
+        params = {'p{0}'.format(idx): value for idx, value in enumerate(params)}
+    return query, params
+
+
+def iter_sql_users(
+    connection,
+    table: Optional[str] = 'events',
+    users_to_include: Optional[Set[str]] = None,
+    start_time: Optional[dt] = None,
+    end_time: Optional[dt] = None,
+    datetime_format: Optional[str] = "%Y-%m-%d %H:%M:%S.%f",
+    include_narrative_element_id: Optional[bool] = False,
+    start_button_filter: Optional[bool] = True,
+    compact: Optional[bool] = False,
+    batch_size: Optional[int] = 10000,
+    paramstyle: Optional[str] = 'qmark'
+) -> Iterator[Tuple[str, List]]:
+    """
+        Stream the users and their (sorted) events from a table of raw events in a 
+        database, see from_sql. The rows are fetched in batches, ordered by the user
+        and timestamp, so only one user's events are held at a time. A large set of
+        users_to_include is queried in (sorted) batches of users.
+
+        :returns: an iterator of (user, events)
+    """
+    if not isinstance(batch_size, int) or batch_size < 1:
+        raise ValueError('batch_size should be a positive int: {0}'.format(batch_size))
+
+    if users_to_include is not None and not isinstance(users_to_include, set):
+        raise TypeError('users_to_include should be a set: {0} ({1})'.format(
+            users_to_include, type(users_to_include)))
+
+    for t in (start_time, end_time):
+        if t is not None and not isinstance(t, dt):
+            raise TypeError('start_time and end_time should be datetimes: {0} ({1})'.format(
+                t, type(t)))
+
+    # the batches of users are in order, so the users are still streamed in order
+    user_batches = [users_to_include]
+    if users_to_include:
+        users = sorted(users_to_include)
+        user_batches = [
+            set(users[idx:idx + _MAX_QUERY_USERS]) 
+            for idx in range(0, len(users), _MAX_QUERY_USERS)
+        ]
+
+    cursor = connection.cursor()
+    try:
+        current_user, events = None, []
+        for user_batch in user_batches:
+            query, params = _events_query(
+                table, user_batch, start_time, end_time, start_button_filter,
+                include_narrative_element_id, paramstyle)
+            cursor.execute(query, params)
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows: break
+
+                for row in rows:
+                    event_id, user, timestamp, action_type, action_name, message = row[:6]
+
+                    if isinstance(timestamp, str):
+                        timestamp = _parse_timestamp_string(timestamp, datetime_format)
+                    if ((start_time is not None and timestamp < start_time) or 
+                        (end_time is not None and timestamp >= end_time)):
+                        continue
+
+                    if user != current_user:
+                        if events: yield current_user, events
+                        current_user, events = intern_symbol(user), []
+
+                    events.append(_make_event(
+                        event_id, user, timestamp, action_type, action_name, json.loads(message), 
+                        row[6] if include_narrative_element_id else None, compact))
+
+        if events: yield current_user, events
+    finally:
+        cursor.close()
+
+
+def from_sql(
+    connection,
+    table: Optional[str] = 'events',
+    users_to_include: Optional[Set[str]] = None,
+    start_time: Optional[dt] = None,
+    end_time: Optional[dt] = None,
+    datetime_format: Optional[str] = "%Y-%m-%d %H:%M:%S.%f",
+    include_narrative_element_id: Optional[bool] = False,
+    start_button_filter: Optional[bool] = True,
+    compact: Optional[bool] = False,
+    batch_size: Optional[int] = 10000,
+    paramstyle: Optional[str] = 'qmark'
+) -> Dict[str, List]:
+    """
+        Read the raw events from a table in a database (e.g. SQLite, or any DB-API 
+        connection) into the format that is internally used: {user -> events}. The 
+        table has the same columns as the raw data (id, userid, timestamp, item, action, 
+        message and narrativeelement) and the events are parsed in the same way as 
+        parse_raw_data. The filters are applied in the query and the events are sorted 
+        by the database.
+
+        :params connection: the DB-API connection, e.g. sqlite3.connect('events.db')
+        :params table: the name of the table of raw events
+        :params users_to_include: a subset of user_ids that you want to extract the data for
+        :params start_time: only include the events at or after this time
+        :params end_time: only include the events before this time
+        :params datetime_format: the format of the timestamps
+        :params include_narrative_element_id: whether to include the narrative element
+        :params start_button_filter: only include users that have clicked the Start button
+        :params compact: use compact Event records rather than dicts for the events
+        :params batch_size: the number of rows to fetch at a time
+        :params paramstyle: the paramstyle of the DB-API driver (sqlite3 uses qmark)
+        :returns: dictionary of values: {user -> events}
+    """
+    return dict(iter_sql_users(
+        connection, table, users_to_include, start_time, end_time, datetime_format,
+        include_narrative_element_id, start_button_filter, compact, batch_size, paramstyle
+    ))
@@ -0,0 +1,144 @@
+"""
+Compact event records, an alternative to the dict per event produced by parse_raw_data.
+"""
+
+from datetime import datetime as dt
+from typing import Optional, Union, Dict, Any
+
+import sys
+
+
+class _Record():
+    """
+        Base for the compact records, the fields can be read like a dict (record['field'])
+        so they can be used anywhere the library expects an event dict.
+    """
+    __slots__ = ()
+    _fields = frozenset()
+
+    # the records are mutable (like the dicts they replace), so they aren't hashable
+    __hash__ = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # a set of the fields, for a constant time check on each (hot) item lookup
+        cls._fields = frozenset(cls.__slots__)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self._fields: return getattr(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fields
+
+    def get(self, key: str, default: Optional[Any] = None) -> Any:
+        return getattr(self, key) if key in self._fields else default
+
+    def keys(self):
+        return self.__slots__
+
+    def items(self):
+        return ((key, getattr(self, key)) for key in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, type(self)): return NotImplemented
+        return all(getattr(self, key) == getattr(other, key) for key in self.__slots__)
+
+    def __repr__(self) -> str:
+        return '{0}({1})'.format(type(self).__name__, ', '.join(
+            '{0}={1!r}'.format(key, value) for key, value in self.items()))
+
+    def __getstate__(self):
+        return tuple(getattr(self, key) for key in self.__slots__)
+
+    def __setstate__(self, state):
+        for key, value in zip(self.__slots__, state):
+            object.__setattr__(self, key, value)
+
+
+class EventData(_Record):
+    """ The fields of an event's data (message) that are used by the library """
+    __slots__ = ('romper_to_state', 'romper_from_state', 'current_narrative_element')
+
+    def __init__(
+        self,
+        romper_to_state: Optional[Union[str, int]] = None,
+        romper_from_state: Optional[Union[str, int]] = None,
+        current_narrative_element: Optional[str] = None
+    ) -> None:
+        self.romper_to_state = romper_to_state
+        self.romper_from_state = romper_from_state
+        self.current_narrative_element = current_narrative_element
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'EventData':
+        """
+            :params data: the (parsed) message of an event
+            :returns: the compact version, any other fields are dropped
+        """
+        return cls(
+            data.get('romper_to_state'),
+            data.get('romper_from_state'),
+            data.get('current_narrative_element')
+        )
+
+    def to_dict(self) -> Dict:
+        return {key: value for key, value in self.items() if value is not None}
+
+
+class Event(_Record):
+    """
+        A compact (__slots__) event, accepted by the extractors and the util.data functions
+        in place of the event dicts. Only the fields of the data that the library uses are
+        kept (see EventData). The fields are stored as they are given, parse_raw_data
+        interns the categorical fields (unless intern_symbols = False) as does from_dict.
+    """
+    __slots__ = (
+        'id', 'user', 'timestamp', 'action_type', 'action_name', 'data', 'narrative_element'
+    )
+
+    def __init__(
+        self,
+        id: Union[int, str],
+        user: str,
+        timestamp: dt,
+        action_type: str,
+        action_name: str,
+        data: Optional[Union[EventData, Dict]] = None,
+        narrative_element: Optional[str] = None
+    ) -> None:
+        self.id = id
+        self.user = user
+        self.timestamp = timestamp
+        self.action_type = action_type
+        self.action_name = action_name
+        self.data = data if isinstance(data, EventData) else EventData.from_dict(data or {})
+        self.narrative_element = narrative_element
+
+    @classmethod
+    def from_dict(cls, event: Dict) -> 'Event':
+        """
+            :params event: an event in the format returned by parse_raw_data
+            :returns: the compact version of the event, with the action name and type interned
+        """
+        return cls(
+            event['id'], event['user'], event['timestamp'], sys.intern(event['action_type']),
+            sys.intern(event['action_name']), event['data'], event.get('narrative_element')
+        )
+
+    def to_dict(self) -> Dict:
+        """ :returns: the event in the format returned by parse_raw_data """
+        event = {
+            'id': self.id, 'user': self.user, 'timestamp': self.timestamp,
+            'action_type': self.action_type, 'action_name': self.action_name,
+            'data': self.data.to_dict()
+        }
+        if self.narrative_element is not None:
+            event['narrative_element'] = self.narrative_element
+        return event
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        # re-intern after being pickled (e.g. when sent to a joblib worker)
+        self.action_type = sys.intern(self.action_type)
+        self.action_name = sys.intern(self.action_name)
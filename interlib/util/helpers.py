@@ -2,7 +2,7 @@
 Helper functions for processing the data
 """
 from datetime import datetime as dt
-import json
+import json, sys
 
 ############################
 # Common statistical tasks
@@ -34,6 +34,21 @@ def missing_hidden_visibility_change(visbile_ts, current_index, events):
     
     return (visbile_ts - pseudo_hidden_ts).total_seconds()
 
+def is_sorted(events, key = 'timestamp'):
+    """ O(n) check of whether the events are already in order (by key) """
+    return all(
+        events[idx][key] <= events[idx + 1][key] for idx in range(len(events) - 1)
+    )
+
+def intern_symbol(value):
+    """
+        Intern a (categorical) string through the interpreter's symbol table, so each
+        distinct value is only stored once and comparisons against the library's 
+        constants (e.g. 'NARRATIVE_ELEMENT_CHANGE') can short-circuit on identity. 
+        Anything that isn't a string is returned as it is.
+    """
+    return sys.intern(value) if type(value) is str else value
+
 def safe_division(n, d):
     return n / d if d else 0
 
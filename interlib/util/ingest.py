@@ -0,0 +1,248 @@
+"""
+Ingest many raw data files at once: the files are read concurrently (asyncio), parsed
+in a pool of processes and the events are merged into the {user -> events} format as
+each batch is parsed.
+"""
+
+from typing import Optional, Iterable, Iterator, List, Dict, Set, Tuple
+
+import json, os, re
+
+from .data import parse_raw_data, _group_user_events
+from .helpers import is_sorted
+
+__all__ = ['ingest', 'ingest_async']
+
+_ARRAY_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def _read_batch(lines: Iterable[str], batch_size: int) -> Tuple[List[str], bool]:
+    """ 
+        the next batch_size (non-empty) lines of a JSON Lines file (or items of a JSON 
+        array, see _iter_array_items), and whether it's finished 
+    """
+    batch = []
+    for line in lines:
+        if line.strip(): batch.append(line)
+        if len(batch) == batch_size: return batch, False
+    return batch, True
+
+
+def _iter_array_items(in_file, chunk_size: int = 1 << 20) -> Iterator[str]:
+    """ 
+        The text of each item of a JSON array file, read chunk_size characters at a time 
+        rather than loading the whole file, so an array can be read in batches as well.
+    """
+    decoder, buffer = json.JSONDecoder(), ''
+    while '[' not in buffer: # the opening bracket
+        chunk = in_file.read(chunk_size)
+        if not chunk: return
+        buffer += chunk
+    pos = buffer.index('[') + 1
+
+    while True:
+        pos = _ARRAY_SEPARATORS.match(buffer, pos).end()
+        if buffer.startswith(']', pos): return
+
+        try:
+            _, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError: # the item continues in the next chunk
+            chunk = in_file.read(chunk_size)
+            if not chunk: raise
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+
+        yield buffer[pos:end]
+        pos = end
+
+
+def _is_json_array(in_file) -> bool:
+    """ whether the file is a JSON array (rather than JSON Lines) """
+    first_char = in_file.read(1)
+    while first_char.isspace(): first_char = in_file.read(1)
+    in_file.seek(0)
+    return first_char == '['
+
+
+def _parse_batch(
+    raw: List[str],
+    datetime_format: str,
+    include_narrative_element_id: bool,
+    compact: bool,
+    users_to_include: Optional[Set[str]]
+) -> Tuple[Dict[str, List], Set[str]]:
+    """
+        Parse a batch of the raw events (in a worker process).
+
+        :params raw: a list of the raw events (JSON Lines or the items of a JSON array)
+        :returns: the batch's {user -> events} (not sorted) and the users that clicked
+            the Start button in the batch
+    """
+    raw_data = [json.loads(line) for line in raw]
+    if users_to_include is not None:
+        raw_data = [datum for datum in raw_data if datum['userid'] in users_to_include]
+
+    data = parse_raw_data(raw_data, datetime_format, include_narrative_element_id, compact)
+    clicked_start_button = {
+        event['user'] for event in data if event['action_name'] == 'START_BUTTON_CLICKED'}
+
+    return _group_user_events(data, start_button_filter = False, sort = False), clicked_start_button
+
+
+async def ingest_async(
+    paths: List[str],
+    n_workers: Optional[int] = None,
+    n_readers: Optional[int] = 4,
+    batch_size: Optional[int] = 50000,
+    max_pending: Optional[int] = None,
+    datetime_format: Optional[str] = "%Y-%m-%d %H:%M:%S.%f",
+    include_narrative_element_id: Optional[bool] = False,
+    sort: Optional[bool] = True,
+    users_to_include: Optional[Set[str]] = None,
+    start_button_filter: Optional[bool] = True,
+    compact: Optional[bool] = False
+) -> Dict[str, List]:
+    """
+        The coroutine behind ingest, for use inside a running event loop (e.g. a notebook).
+        See ingest for the parameters.
+    """
+    import asyncio # asyncio and the process pool are imported when they're first needed
+    from concurrent.futures import ProcessPoolExecutor
+
+    if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+        raise TypeError('paths should be a list of file paths: {0}'.format(paths))
+
+    for path in paths:
+        if not os.path.isfile(path):
+            raise ValueError('File does not exist: {0}'.format(path))
+
+    for name, value in [('n_readers', n_readers), ('batch_size', batch_size)]:
+        if not isinstance(value, int) or value < 1:
+            raise ValueError('{0} should be a positive int: {1}'.format(name, value))
+
+    if n_workers is None: n_workers = os.cpu_count() or 1
+    if max_pending is None: max_pending = 2 * n_workers
+    if not isinstance(max_pending, int) or max_pending < 1:
+        raise ValueError('max_pending should be a positive int: {0}'.format(max_pending))
+
+    loop = asyncio.get_event_loop() # the running loop (get_running_loop is Python 3.7+)
+    pending = asyncio.Semaphore(max_pending) # the batches read but not yet merged
+    queue = asyncio.Queue()
+    for file_idx, path in enumerate(paths): queue.put_nowait((file_idx, path))
+
+    # each user's events are kept as (batch order, events) so that they can be put back
+    # in the order of the files, whichever order the batches finish in
+    user_batches, clicked_start_button = {}, set()
+    merges = []
+
+    async def _merge(order, parsing):
+        try:
+            batch_events, batch_clicked = await parsing
+            for user, events in batch_events.items():
+                if user in user_batches: user_batches[user].append((order, events))
+                else: user_batches[user] = [(order, events)]
+            clicked_start_button.update(batch_clicked)
+        finally:
+            pending.release()
+
+    async def _reader(pool):
+        while not queue.empty():
+            file_idx, path = queue.get_nowait()
+            in_file = await loop.run_in_executor(None, open, path, 'r')
+            try:
+                is_array = await loop.run_in_executor(None, _is_json_array, in_file)
+                lines = _iter_array_items(in_file) if is_array else in_file
+                batch_idx, finished = 0, False
+                while not finished:
+                    # wait for a pending batch to be merged before reading any more
+                    await pending.acquire()
+                    try:
+                        raw, finished = await loop.run_in_executor(
+                            None, _read_batch, lines, batch_size)
+                    except BaseException:
+                        pending.release()
+                        raise
+
+                    if not raw:
+                        pending.release()
+                        continue
+
+                    parsing = loop.run_in_executor(
+                        pool, _parse_batch, raw, datetime_format,
+                        include_narrative_element_id, compact, users_to_include)
+                    merges.append(asyncio.ensure_future(_merge((file_idx, batch_idx), parsing)))
+                    batch_idx += 1
+            finally:
+                in_file.close()
+
+    with ProcessPoolExecutor(max_workers = n_workers) as pool:
+        readers = [asyncio.ensure_future(_reader(pool)) for _ in range(n_readers)]
+        try:
+            await asyncio.gather(*readers)
+            await asyncio.gather(*merges)
+        except BaseException:
+            for task in readers + merges: task.cancel()
+            raise
+
+    user_events = {}
+    for user, batches in user_batches.items():
+        if start_button_filter and user not in clicked_start_button: continue
+
+        if len(batches) == 1: events = batches[0][1]
+        else: events = [event for _, batch in sorted(batches, key = lambda b: b[0]) for event in batch]
+
+        if sort and not is_sorted(events): events.sort(key = lambda x: x['timestamp'])
+        user_events[user] = events
+
+    return user_events
+
+
+def ingest(
+    paths: List[str],
+    n_workers: Optional[int] = None,
+    n_readers: Optional[int] = 4,
+    batch_size: Optional[int] = 50000,
+    max_pending: Optional[int] = None,
+    datetime_format: Optional[str] = "%Y-%m-%d %H:%M:%S.%f",
+    include_narrative_element_id: Optional[bool] = False,
+    sort: Optional[bool] = True,
+    users_to_include: Optional[Set[str]] = None,
+    start_button_filter: Optional[bool] = True,
+    compact: Optional[bool] = False
+) -> Dict[str, List]:
+    """
+        Read and parse many raw data files (e.g. daily exports) into a single {user -> events},
+        the same as to_dict on all of the files combined. The files are read concurrently by
+        n_readers, while the batches that have been read are parsed in a pool of n_workers
+        processes and merged into the user events as they finish. At most max_pending batches
+        are read but not yet merged, the readers wait for a batch to be merged before
+        reading another, which bounds the raw data held in memory.
+
+        Both JSON Lines files and JSON arrays are read in batches of batch_size events (the
+        items of an array are read a chunk of the file at a time, rather than loading it).
+
+        :params paths: the raw data files (JSON arrays or JSON Lines)
+        :params n_workers: the number of processes parsing the events, default is the cpu count
+        :params n_readers: the number of files read at the same time
+        :params batch_size: the number of events in each batch of a file
+        :params max_pending: the number of batches that can be read but not merged,
+            default is twice n_workers
+        :params datetime_format: the format to parse the timestamps
+        :params include_narrative_element_id: whether to include the narrative element
+        :params sort: whether or not to sort the users' events by the timestamp
+        :params users_to_include: a subset of user_ids that you want to extract the data for
+        :params start_button_filter: only include users that have clicked the Start button
+            (in any of the files)
+        :params compact: parse into compact Event records rather than dicts
+        :returns: dictionary of values: {user -> events}
+    """
+    import asyncio # asyncio is imported when it's first needed
+
+    # a new loop for each call, as asyncio.run (Python 3.7+) would
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(ingest_async(
+            paths, n_workers, n_readers, batch_size, max_pending, datetime_format,
+            include_narrative_element_id, sort, users_to_include, start_button_filter, compact))
+    finally:
+        loop.close()
@@ -0,0 +1,368 @@
+"""
+Parse the raw data across processes. Each worker parses a share of the raw events (a
+slice of the list or a byte range of a JSON Lines file) and sends them back as a
+columnar chunk grouped by user, rather than pickling every parsed event.
+
+The chunks (as_chunks = True) are the fast path: building the events from them is a 
+loop over every event in the main process (see ParsedChunk.user_events).
+"""
+
+from typing import Optional, Union, List, Dict, Tuple
+
+from datetime import datetime as dt
+
+import copy, json, os
+import numpy as np
+
+from .data import _make_event, _parse_message, _pad_timestamp
+from .event import Event
+from .ingest import _is_json_array
+
+__all__ = ['ParsedChunk', 'parse_raw_data_parallel']
+
+DEFAULT_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+# the padded timestamps in the default format: YYYY-MM-DD HH:MM:SS.fff
+_DEFAULT_FORMAT_SEPARATORS = {4: '-', 7: '-', 10: ' ', 13: ':', 16: ':', 19: '.'}
+
+
+def _is_default_format(timestamps: List[str]) -> bool:
+    """ 
+        whether all of the (padded) timestamps are exactly in the default format, numpy
+        parses these as strptime would but also accepts others (e.g. a 'T' separator) 
+    """
+    codes = np.array(timestamps, dtype = 'U23').view(np.uint32).reshape(len(timestamps), 23)
+    separators = list(_DEFAULT_FORMAT_SEPARATORS)
+    digits = np.delete(codes, separators, axis = 1)
+    return bool(
+        (codes[:, separators] == [ord(c) for c in _DEFAULT_FORMAT_SEPARATORS.values()]).all() and
+        ((digits >= ord('0')) & (digits <= ord('9'))).all())
+
+
+def _symbol_key(value):
+    """ 
+        the key of a value in the symbol table: the strings themselves, otherwise the type
+        as well (so True, 1 and 1.0 are different symbols) and the JSON of a list or dict
+    """
+    if type(value) is str: return value
+    if isinstance(value, (list, dict)): return (type(value), json.dumps(value))
+    return (type(value), value)
+
+
+def _id_column(ids: List) -> np.ndarray:
+    """ the event ids as an array, of their type if they're all ints, floats or strings """
+    if len({type(event_id) for event_id in ids}) == 1 and type(ids[0]) in (int, float, str):
+        try:
+            return np.array(ids)
+        except OverflowError: # an int beyond int64
+            pass
+    column = np.empty(len(ids), dtype = object)
+    column[:] = ids
+    return column
+
+
+class ParsedChunk():
+    """
+        A chunk of the parsed events in columns, grouped by user: the events of
+        users[i] are the rows offsets[i] to offsets[i + 1]. The ids and timestamps
+        are arrays (the timestamps as datetime64) and the categorical fields - the
+        action types and names, the narrative elements and the value of each of the
+        data keys - are code arrays into a shared table of symbols (-1 where an event 
+        doesn't have the data key). The keys of each event's data, in order, are a code 
+        into data_keys. The events are only built (see user_events) once the chunk is 
+        back in the main process.
+    """
+
+    def __init__(
+        self,
+        users: List[str],
+        offsets: np.ndarray,
+        ids: np.ndarray,
+        timestamps: np.ndarray,
+        symbols: List,
+        action_types: np.ndarray,
+        action_names: np.ndarray,
+        data_keys: List[Tuple[str, ...]],
+        data_layouts: np.ndarray,
+        data_columns: Dict[str, np.ndarray],
+        narrative_elements: Optional[np.ndarray] = None
+    ) -> None:
+        self.users = users
+        self.offsets = offsets
+        self.ids = ids
+        self.timestamps = timestamps
+        self.symbols = symbols
+        self.action_types = action_types
+        self.action_names = action_names
+        self.data_keys = data_keys
+        self.data_layouts = data_layouts
+        self.data_columns = data_columns
+        self.narrative_elements = narrative_elements
+
+    @classmethod
+    def from_raw(
+        cls,
+        raw_data: List[Dict],
+        datetime_format: Optional[str] = DEFAULT_DATETIME_FORMAT,
+        include_narrative_element_id: Optional[bool] = False
+    ) -> 'ParsedChunk':
+        """
+            Parse the raw events (as parse_raw_data) straight into the columns.
+
+            :params raw_data: a list of the raw events
+            :params datetime_format: the format to parse the timestamp string
+            :params include_narrative_element_id: do you want to include this field
+            :returns: the events grouped by user (in the order the users first appear) 
+                and otherwise in the order they were given
+        """
+        # order the rows by user first, so each user's events are a contiguous block
+        user_codes = {}
+        users = np.fromiter(
+            (user_codes.setdefault(datum['userid'], len(user_codes)) for datum in raw_data),
+            dtype = np.int64, count = len(raw_data))
+        raw_data = [raw_data[idx] for idx in np.argsort(users, kind = 'stable')]
+
+        symbols, symbol_codes, key_codes = [], {}, {}
+        def _code(value):
+            key = _symbol_key(value)
+            code = symbol_codes.get(key)
+            if code is None:
+                code = symbol_codes[key] = len(symbols)
+                symbols.append(value)
+            return code
+
+        def _codes(values):
+            try: # the strings (the usual case) are their own keys, so add the new ones first
+                for value in dict.fromkeys(values):
+                    if value not in symbol_codes: _code(value)
+                column = list(map(symbol_codes.get, values))
+            except TypeError: # (a list or dict)
+                column = [None] * len(values)
+            if None in column: # the values that are keyed with their type
+                column = [_code(value) if code is None else code for code, value in zip(column, values)]
+            return column
+
+        data_layouts, data_values = [0] * len(raw_data), []
+        for row, datum in enumerate(raw_data):
+            message = _parse_message(datum)
+            data_layouts[row] = key_codes.setdefault(tuple(message), len(key_codes))
+            data_values.append(tuple(message.values()))
+        data_layouts = np.array(data_layouts, dtype = np.int32)
+
+        # the values of each data key are coded a column at a time, for the events with 
+        # each layout (set of keys)
+        data_columns = {} # {key -> codes}
+        for layout, keys in enumerate(key_codes):
+            rows = np.flatnonzero(data_layouts == layout)
+            values = data_values if len(rows) == len(raw_data) else [
+                data_values[row] for row in rows.tolist()]
+            for key, column in zip(keys, zip(*values)):
+                if key not in data_columns:
+                    data_columns[key] = np.full(len(raw_data), -1, dtype = np.int32)
+                data_columns[key][rows] = _codes(column)
+
+        timestamps = [_pad_timestamp(datum['timestamp']) for datum in raw_data]
+        if (datetime_format == DEFAULT_DATETIME_FORMAT and timestamps and 
+            _is_default_format(timestamps)): # numpy parses these (ISO 8601) itself
+            timestamps = np.array(timestamps, dtype = 'datetime64[us]')
+        else: # (as does strptime, raising the same errors as parse_raw_data)
+            timestamps = np.array([
+                dt.strptime(timestamp, datetime_format) for timestamp in timestamps
+            ], dtype = 'datetime64[us]')
+
+        codes = lambda field: np.array(
+            _codes([datum[field] for datum in raw_data]), dtype = np.int32)
+        action_types, action_names = codes('item'), codes('action')
+        narrative_elements = codes('narrative_element') if include_narrative_element_id else None
+
+        return cls(
+            list(user_codes),
+            np.concatenate([[0], np.cumsum(np.bincount(users, minlength = len(user_codes)))]),
+            _id_column([datum['id'] for datum in raw_data]), timestamps,
+            symbols, action_types, action_names,
+            list(key_codes), data_layouts, data_columns, narrative_elements
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _symbol_array(self) -> np.ndarray:
+        """ the symbols as an object array, with None last (for the code -1) """
+        symbols = np.empty(len(self.symbols) + 1, dtype = object)
+        symbols[:-1] = self.symbols
+        return symbols
+
+    def _decode(self, codes: np.ndarray) -> List:
+        """ the values of a column of codes into the symbols (None for -1) """
+        return self._symbol_array()[codes].tolist()
+
+    def data_column(self, key: str) -> List:
+        """
+            :params key: a key of the events' data, e.g. romper_to_state
+            :returns: the value of the key for each event (None where the event doesn't 
+                have it), the same object for the events with the same list or dict value
+        """
+        if key not in self.data_columns: return [None] * len(self)
+        return self._decode(self.data_columns[key])
+
+    def user_events(
+        self,
+        compact: Optional[bool] = False,
+        intern_symbols: Optional[bool] = True
+    ) -> Dict[str, List[Union[Dict, Event]]]:
+        """
+            Build the events of the chunk (with _make_event, as parse_raw_data). Each of 
+            the columns is decoded in one go, but each event is still built one at a time
+            in the main process: for large data, working on the chunks themselves 
+            (as_chunks = True in parse_raw_data_parallel) avoids this.
+
+            :params compact: build compact Event records rather than dicts
+            :params intern_symbols: intern the categorical fields (see parse_raw_data)
+            :returns: {user -> events}
+        """
+        ids, timestamps = self.ids.tolist(), self.timestamps.astype(object) # datetime objects
+        action_types, action_names = self._decode(self.action_types), self._decode(self.action_names)
+        narrative_elements = (
+            self._decode(self.narrative_elements) if self.narrative_elements is not None 
+            else [None] * len(self))
+
+        # the data of the events with each of the layouts (keys), a column at a time
+        symbols, data = self._symbol_array(), [None] * len(self)
+        mutable = np.array([isinstance(symbol, (list, dict)) for symbol in symbols])
+        for layout, keys in enumerate(self.data_keys):
+            rows = np.flatnonzero(self.data_layouts == layout)
+            codes = [self.data_columns[key][rows] for key in keys]
+            columns = [symbols[key_codes].tolist() for key_codes in codes]
+            for row, values in zip(rows.tolist(), zip(*columns) if keys else [()] * len(rows)):
+                data[row] = dict(zip(keys, values))
+
+            # (the lists and dicts are shared by the events with the same value)
+            for key, key_codes in zip(keys, codes):
+                if mutable[key_codes].any():
+                    for row in rows.tolist(): data[row][key] = copy.deepcopy(data[row][key])
+
+        user_events = {}
+        for idx, user in enumerate(self.users):
+            events = [
+                _make_event(
+                    ids[row], user, timestamps[row], action_types[row], action_names[row],
+                    data[row], narrative_elements[row], compact, intern_symbols
+                )
+                for row in range(self.offsets[idx], self.offsets[idx + 1])
+            ]
+            user_events[events[0]['user']] = events # (interned) each user has an event
+
+        return user_events
+
+
+def _byte_ranges(path: str, n_ranges: int) -> List[Tuple[int, int]]:
+    """ split a file into n_ranges (roughly) equal byte ranges """
+    size = os.path.getsize(path)
+    bounds = [size * idx // n_ranges for idx in range(n_ranges + 1)]
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def _read_byte_range(path: str, start: int, end: int) -> List[Dict]:
+    """
+        The raw events of the lines that start in [start, end) of a JSON Lines file, so
+        each line belongs to exactly one range.
+    """
+    raw_data = []
+    with open(path, 'rb') as in_file:
+        if start > 0: # skip the line that started in the previous range
+            in_file.seek(start - 1)
+            in_file.readline()
+
+        while in_file.tell() < end:
+            line = in_file.readline()
+            if not line: break
+            if line.strip(): raw_data.append(json.loads(line))
+    return raw_data
+
+
+def _parse_chunk(
+    raw: Union[List[Dict], Tuple[str, int, int]],
+    datetime_format: str,
+    include_narrative_element_id: bool
+) -> ParsedChunk:
+    """ parse a slice of the raw events, or a (path, start, end) byte range, in a worker """
+    if isinstance(raw, tuple): raw = _read_byte_range(*raw)
+    return ParsedChunk.from_raw(raw, datetime_format, include_narrative_element_id)
+
+
+def parse_raw_data_parallel(
+    raw_data: Union[List[Dict], str],
+    n_jobs: Optional[int] = -1,
+    n_chunks: Optional[int] = None,
+    datetime_format: Optional[str] = DEFAULT_DATETIME_FORMAT,
+    include_narrative_element_id: Optional[bool] = False,
+    compact: Optional[bool] = False,
+    intern_symbols: Optional[bool] = True,
+    as_chunks: Optional[bool] = False,
+    verbose: Optional[int] = 0
+) -> Union[Dict[str, List[Union[Dict, Event]]], List[ParsedChunk]]:
+    """
+        parse_raw_data across n_jobs processes. The raw events (a list or a JSON Lines
+        file, which each worker reads its own byte range of) are split into n_chunks,
+        each worker parses its chunk and sends it back as a ParsedChunk, grouped by user
+        with the timestamps and categorical fields as arrays, which is far cheaper to
+        pickle than the parsed events. Timestamps that are exactly in the default format
+        are parsed by numpy, any others (e.g. with a 'T' separator) are parsed with strptime
+        so they're accepted or rejected just as by parse_raw_data.
+
+        :params raw_data: a list of the raw events or the path to a JSON Lines file (a JSON
+            array is loaded and then split)
+        :params n_jobs: the number of processes, as joblib (-1 is all of the cores)
+        :params n_chunks: the number of chunks, default is one per process
+        :params datetime_format: the format to parse the timestamp string
+        :params include_narrative_element_id: do you want to include this field
+        :params compact: parse into compact Event records rather than dicts
+        :params intern_symbols: intern the categorical fields (see parse_raw_data)
+        :params as_chunks: return the ParsedChunks rather than building the events, this
+            is the fast path for large data, as the events are built one at a time in 
+            the main process (see ParsedChunk.user_events)
+        :params verbose: the level of output passed to the joblib backend
+        :returns: {user -> events}, in the order of the raw events (not sorted), or the
+            list of ParsedChunks
+    """
+    from joblib import Parallel, delayed, effective_n_jobs # joblib is imported when it's first needed
+
+    if not isinstance(n_jobs, int):
+        raise TypeError('n_jobs should be an int: {0}'.format(n_jobs))
+
+    if n_chunks is None: n_chunks = effective_n_jobs(n_jobs)
+    if not isinstance(n_chunks, int) or n_chunks < 1:
+        raise ValueError('n_chunks should be a positive int: {0}'.format(n_chunks))
+
+    if isinstance(raw_data, str):
+        if not os.path.isfile(raw_data):
+            raise ValueError('File does not exist: {0}'.format(raw_data))
+
+        with open(raw_data, 'r') as in_file:
+            is_array = _is_json_array(in_file)
+            if is_array: raw_data = json.load(in_file)
+
+        if not is_array:
+            chunks = [(raw_data, start, end) for start, end in _byte_ranges(raw_data, n_chunks)]
+
+    if isinstance(raw_data, list):
+        bounds = [len(raw_data) * idx // n_chunks for idx in range(n_chunks + 1)]
+        chunks = [
+            raw_data[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+    elif not isinstance(raw_data, str):
+        raise TypeError('raw_data should be a list of events or a path: {0}'.format(
+            type(raw_data)))
+
+    parsed = Parallel(n_jobs = n_jobs, verbose = verbose)(
+        delayed(_parse_chunk) (chunk, datetime_format, include_narrative_element_id)
+        for chunk in chunks
+    )
+    if as_chunks: return parsed
+
+    # the chunks are in the order of the raw events, so each user's events are too
+    user_events = {}
+    for chunk in parsed:
+        for user, events in chunk.user_events(compact, intern_symbols).items():
+            if user in user_events: user_events[user].extend(events)
+            else: user_events[user] = events
+    return user_events
@@ -0,0 +1,232 @@
+"""
+Partition the raw data by user on disk, so that datasets larger than memory can be
+processed one partition at a time (see interlib.preprocessing.out_of_core).
+"""
+
+from typing import Optional, Union, List, Dict, Set, Iterator
+
+import json, os, pickle, shutil, tempfile, zlib
+
+from .data import parse_raw_data, from_parquet, _group_user_events, _import_pyarrow
+from .data import _parquet_columns, DATA_FIELDS
+
+PARTITION_FORMATS = ('jsonl', 'pickle')
+
+# the events (or rows) buffered, across all of the partitions, before they're written
+# out, so a file doesn't have to be kept open for each partition
+_BUFFER_ROWS = 100000
+
+
+def user_partition(user: str, n_partitions: int) -> int:
+    """
+        The partition that a user belongs to. This is stable between runs (and
+        processes), so a user's events always end up in the same partition.
+
+        :params user: the user id
+        :params n_partitions: the number of partitions
+        :returns: the index of the partition
+    """
+    return zlib.crc32(user.encode('utf-8')) % n_partitions
+
+
+def _iter_raw_events(path: str) -> Iterator[Dict]:
+    """ the raw events from a JSON Lines file (streamed) or a JSON array (loaded) """
+    with open(path, 'r') as in_file:
+        first_char = in_file.read(1)
+        while first_char.isspace(): first_char = in_file.read(1)
+        in_file.seek(0)
+
+        if first_char == '[':
+            yield from json.load(in_file)
+        else:
+            for line in in_file:
+                if line.strip(): yield json.loads(line)
+
+
+def _append_lines(paths: List[str], buffers: List[List[str]]) -> None:
+    """ append the buffered lines to each of the partitions (and empty the buffers) """
+    for path, lines in zip(paths, buffers):
+        if not lines: continue
+        with open(path, 'a') as out_file:
+            out_file.writelines(lines)
+        lines.clear()
+
+
+def write_partitions(
+    path: str,
+    out_dir: str,
+    n_partitions: int,
+    format: Optional[str] = 'jsonl',
+    datetime_format: Optional[str] = "%Y-%m-%d %H:%M:%S.%f"
+) -> List[str]:
+    """
+        Partition the raw events by user into n_partitions files. The raw events are
+        read from a JSON Lines file one at a time (a JSON array is also accepted but
+        has to be loaded in full).
+
+        :params path: the raw events (JSON Lines or a JSON array)
+        :params out_dir: the directory to write the partitions to
+        :params n_partitions: the number of partitions
+        :params format: jsonl (the raw events) or pickle (the parsed events, a binary cache
+            that is quicker to read)
+        :params datetime_format: the format to parse the timestamps, if format is pickle
+        :returns: the paths to the partitions
+    """
+    if not isinstance(n_partitions, int) or n_partitions < 1:
+        raise ValueError('n_partitions should be a positive int: {0}'.format(n_partitions))
+
+    if format not in PARTITION_FORMATS:
+        raise ValueError('format should be one of {0}: {1}'.format(PARTITION_FORMATS, format))
+
+    if not os.path.isfile(path):
+        raise ValueError('File does not exist: {0}'.format(path))
+
+    os.makedirs(out_dir, exist_ok = True)
+    jsonl_paths = [
+        os.path.join(out_dir, 'part-{0:05d}.jsonl'.format(idx)) for idx in range(n_partitions)]
+
+    for jsonl_path in jsonl_paths: open(jsonl_path, 'w').close()
+
+    buffers, n_buffered, partition_of = [[] for _ in range(n_partitions)], 0, {}
+    for event in _iter_raw_events(path):
+        user = event['userid']
+        partition = partition_of.get(user)
+        if partition is None: partition = partition_of[user] = user_partition(user, n_partitions)
+
+        buffers[partition].append(json.dumps(event) + '\n')
+        n_buffered += 1
+        if n_buffered == _BUFFER_ROWS:
+            _append_lines(jsonl_paths, buffers)
+            n_buffered = 0
+    _append_lines(jsonl_paths, buffers)
+
+    if format == 'jsonl': return jsonl_paths
+
+    # parse each of the partitions (one at a time) into the binary cache
+    pickle_paths = []
+    for jsonl_path in jsonl_paths:
+        with open(jsonl_path, 'r') as in_file:
+            data = parse_raw_data([json.loads(line) for line in in_file], datetime_format)
+
+        pickle_path = jsonl_path[:-len('.jsonl')] + '.p'
+        with open(pickle_path, 'wb') as out_file:
+            pickle.dump(data, out_file, protocol = pickle.HIGHEST_PROTOCOL)
+
+        os.remove(jsonl_path)
+        pickle_paths.append(pickle_path)
+    return pickle_paths
+
+
+def _read_partition(
+    path: str,
+    datetime_format: str,
+    users_to_include: Optional[Set[str]],
+    start_button_filter: bool
+) -> Dict[str, List]:
+    """ read a partition written by write_partitions into the {user -> events} format """
+    if path.endswith('.p'):
+        with open(path, 'rb') as in_file:
+            data = pickle.load(in_file)
+    else:
+        with open(path, 'r') as in_file:
+            data = parse_raw_data(
+                [json.loads(line) for line in in_file if line.strip()], datetime_format)
+
+    return _group_user_events(data, users_to_include, start_button_filter)
+
+
+def _spill_batches(spill_dir: str, buffers: List[List], spill_idx: int) -> None:
+    """ write the buffered record batches of each partition to a file in its directory """
+    pa, _, pq = _import_pyarrow()
+    for partition, batches in enumerate(buffers):
+        if not batches: continue
+        partition_dir = os.path.join(spill_dir, 'part-{0:05d}'.format(partition))
+        os.makedirs(partition_dir, exist_ok = True)
+        pq.write_table(
+            pa.Table.from_batches(batches),
+            os.path.join(partition_dir, '{0:05d}.parquet'.format(spill_idx)))
+        batches.clear()
+
+
+def iter_partitions(
+    path: Union[str, List[str]],
+    n_partitions: Optional[int] = None,
+    datetime_format: Optional[str] = "%Y-%m-%d %H:%M:%S.%f",
+    users_to_include: Optional[Set[str]] = None,
+    start_button_filter: Optional[bool] = True
+) -> Iterator[Dict[str, List]]:
+    """
+        Iterate over the partitions of the user events, one {user -> events} dictionary
+        at a time, so only a single partition is in memory.
+
+        The partitions are either the files written by write_partitions (a directory or
+        a list of the files) or Parquet (a file or directory, see from_parquet), where the
+        users are partitioned into n_partitions by user_partition. Parquet is scanned
+        once, routing the rows to their partition, and the partitions are spilled to a
+        temporary directory (removed once the iterator is finished) to be read one at
+        a time.
+
+        :params path: the partitions or the Parquet file(s)
+        :params n_partitions: the number of partitions to split Parquet into
+        :params datetime_format: the format to parse the timestamps
+        :params users_to_include: a subset of user_ids that you want to extract the data for
+        :params start_button_filter: only include users that have clicked the Start button
+        :returns: an iterator of {user -> events}
+    """
+    if isinstance(path, str) and os.path.isdir(path):
+        paths = sorted(
+            os.path.join(path, f) for f in os.listdir(path)
+            if f.startswith('part-') and f.endswith(('.jsonl', '.p')))
+        is_parquet = not paths
+    else:
+        paths = [path] if isinstance(path, str) else list(path)
+        is_parquet = all(p.endswith('.parquet') for p in paths)
+
+    if not is_parquet:
+        for partition_path in paths:
+            yield _read_partition(
+                partition_path, datetime_format, users_to_include, start_button_filter)
+        return
+
+    if not isinstance(n_partitions, int) or n_partitions < 1:
+        raise ValueError('n_partitions should be a positive int: {0}'.format(n_partitions))
+
+    pa, ds, _ = _import_pyarrow()
+    import pyarrow.compute as pc
+
+    row_filter = None
+    if users_to_include is not None:
+        row_filter = ds.field('userid').isin(list(users_to_include))
+    dataset = ds.dataset(path, format = 'parquet', partitioning = 'hive')
+    columns, _, _ = _parquet_columns(dataset.schema, path, False, DATA_FIELDS) # only those read
+
+    spill_dir = tempfile.mkdtemp(prefix = 'interlib_')
+    try:
+        buffers, n_buffered, n_spills = [[] for _ in range(n_partitions)], 0, 0
+        for batch in dataset.to_batches(columns = columns, filter = row_filter):
+            if not batch.num_rows: continue
+
+            # the partition of each (distinct) user, and then of each row
+            users = pc.unique(batch.column('userid'))
+            user_partitions = pa.array(
+                [user_partition(user, n_partitions) for user in users.to_pylist()], pa.int32())
+            row_partitions = pc.take(
+                user_partitions, pc.index_in(batch.column('userid'), value_set = users))
+
+            for partition in set(user_partitions.to_pylist()):
+                buffers[partition].append(batch.filter(pc.equal(row_partitions, partition)))
+
+            n_buffered += batch.num_rows
+            if n_buffered >= _BUFFER_ROWS:
+                _spill_batches(spill_dir, buffers, n_spills)
+                n_buffered, n_spills = 0, n_spills + 1
+        _spill_batches(spill_dir, buffers, n_spills)
+
+        for partition in range(n_partitions):
+            partition_dir = os.path.join(spill_dir, 'part-{0:05d}'.format(partition))
+            if not os.path.isdir(partition_dir): continue
+            yield from_parquet(
+                partition_dir, datetime_format = datetime_format,
+                start_button_filter = start_button_filter)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors = True)
@@ -0,0 +1,177 @@
+"""
+A mergeable streaming quantile sketch, for the distribution of a value (e.g. the time
+spent on a narrative element) over a population that is too large to keep every value.
+"""
+
+from typing import Optional, Union, Iterable, List, Dict
+
+import bisect, math
+
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BUCKETS = 2048
+
+
+class QuantileSketch():
+    """
+        A quantile sketch with logarithmic buckets (in the style of DDSketch): each value
+        is counted in the bucket gamma^(i - 1) < |value| <= gamma^i, so any quantile is
+        within the relative accuracy of the true value. The memory is bounded by the
+        number of buckets (the smallest buckets are collapsed together past max_buckets)
+        and merging two sketches adds their counts, so it's exact and associative - the
+        result doesn't depend on how the values were split between the workers.
+    """
+
+    def __init__(
+        self,
+        relative_accuracy: Optional[float] = DEFAULT_RELATIVE_ACCURACY,
+        max_buckets: Optional[int] = DEFAULT_MAX_BUCKETS
+    ) -> None:
+        """
+            :params relative_accuracy: the relative error of the quantiles, between 0 and 1
+            :params max_buckets: the most buckets kept for each of the positive and
+                negative values
+        """
+        if not 0 < relative_accuracy < 1:
+            raise ValueError('relative_accuracy should be between 0 and 1: {0}'.format(
+                relative_accuracy))
+
+        if not isinstance(max_buckets, int) or max_buckets < 1:
+            raise ValueError('max_buckets should be a positive int: {0}'.format(max_buckets))
+
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+
+        self._positive = {} # bucket index -> count
+        self._negative = {}
+        # the bucket indexes in order, kept up to date so they're never re-sorted
+        self._positive_indexes = []
+        self._negative_indexes = []
+        self._zeros = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _bucket(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, bucket: int) -> float:
+        """ the estimate for the values in a bucket (within the relative accuracy) """
+        return 2 * self._gamma ** bucket / (self._gamma + 1)
+
+    def _collapse(self, buckets: Dict[int, int], indexes: List[int]) -> None:
+        """ merge the smallest buckets together so there's at most max_buckets """
+        n_collapse = len(indexes) - self.max_buckets + 1
+        if n_collapse <= 1: return
+        target = indexes[n_collapse - 1]
+        for index in indexes[:n_collapse - 1]:
+            buckets[target] += buckets.pop(index)
+        del indexes[:n_collapse - 1]
+
+    def _add_to_bucket(
+        self, 
+        buckets: Dict[int, int], 
+        indexes: List[int], 
+        bucket: int, 
+        count: int
+    ) -> None:
+        if bucket in buckets:
+            buckets[bucket] += count
+            return
+
+        buckets[bucket] = count
+        bisect.insort(indexes, bucket)
+        self._collapse(buckets, indexes)
+
+    def add(self, value: Union[int, float], count: Optional[int] = 1) -> 'QuantileSketch':
+        """
+            :params value: the value to add to the sketch (not nan)
+            :params count: the number of times to add it
+            :returns: the sketch
+        """
+        if value > 0:
+            self._add_to_bucket(
+                self._positive, self._positive_indexes, self._bucket(value), count)
+        elif value < 0:
+            self._add_to_bucket(
+                self._negative, self._negative_indexes, self._bucket(-value), count)
+        elif math.isnan(value): # which would otherwise be counted as a zero
+            raise ValueError('Cannot add nan to a QuantileSketch')
+        else:
+            self._zeros += count
+
+        self.count += count
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        return self
+
+    def update(self, values: Iterable[Union[int, float]]) -> 'QuantileSketch':
+        """ add each of the values to the sketch """
+        for value in values: self.add(value)
+        return self
+
+    def merge(self, other: 'QuantileSketch') -> 'QuantileSketch':
+        """
+            Add the counts of another sketch (with the same relative accuracy) to this one.
+
+            :params other: the sketch to merge in
+            :returns: the sketch
+        """
+        if not isinstance(other, QuantileSketch):
+            raise TypeError('Can only merge a QuantileSketch: {0}'.format(type(other)))
+
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Cannot merge sketches with different accuracies: {0}, {1}'.format(
+                self.relative_accuracy, other.relative_accuracy))
+
+        for buckets, indexes, other_buckets in [
+            (self._positive, self._positive_indexes, other._positive), 
+            (self._negative, self._negative_indexes, other._negative)
+        ]:
+            for bucket, count in other_buckets.items():
+                buckets[bucket] = buckets.get(bucket, 0) + count
+            indexes[:] = sorted(buckets)
+            self._collapse(buckets, indexes)
+
+        self._zeros += other._zeros
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, q: float) -> float:
+        """
+            :params q: the quantile, between 0 and 1 (e.g. 0.5 for the median)
+            :returns: the estimate of the quantile (nan if the sketch is empty)
+        """
+        if not 0 <= q <= 1:
+            raise ValueError('q should be between 0 and 1: {0}'.format(q))
+
+        if self.count == 0: return math.nan
+        if q == 0: return self.min
+        if q == 1: return self.max
+
+        rank = q * (self.count - 1)
+        seen = 0
+        # the negative values are in decreasing size of bucket, then the zeros and the
+        # positive values in increasing size of bucket
+        for bucket in reversed(self._negative_indexes):
+            seen += self._negative[bucket]
+            if seen > rank: return max(-self._value(bucket), self.min)
+
+        seen += self._zeros
+        if seen > rank: return 0.0
+
+        for bucket in self._positive_indexes:
+            seen += self._positive[bucket]
+            if seen > rank: return min(self._value(bucket), self.max)
+
+        return self.max
+
+    def quantiles(self, qs: Iterable[float]) -> Dict[float, float]:
+        """ :returns: {q -> the estimate of the quantile} """
+        return {q: self.quantile(q) for q in qs}
@@ -0,0 +1,87 @@
+import pytest 
+
+import json
+
+from benchmarks.synthetic import generate_raw_events, write_raw_events, INTERACTION_EVENTS
+from benchmarks.run import run_benchmarks, run_case, compare, IMPORT_TIME_BUDGET
+from interlib.util import to_dict
+from interlib.preprocessing import Statistics, Sequences
+
+def test_generate_raw_events():
+    raw = list(generate_raw_events(5, events_per_user = 40, seed = 1))
+    assert len({e['userid'] for e in raw}) == 5
+    assert all(isinstance(json.loads(e['message']), dict) for e in raw)
+
+    # same seed, same data
+    assert raw == list(generate_raw_events(5, events_per_user = 40, seed = 1))
+    assert raw != list(generate_raw_events(5, events_per_user = 40, seed = 2))
+
+    def _toggles(events):
+        return [e for e in events if e['action'] == 'BROWSER_VISIBILITY_CHANGE']
+
+    assert _toggles(generate_raw_events(20, 40, visibility_density = 0.2))
+    assert not _toggles(generate_raw_events(20, 40, visibility_density = 0))
+
+def test_write_raw_events(tmp_path):
+    path = str(tmp_path / 'raw.json')
+    n_events = write_raw_events(path, 10, events_per_user = 30)
+
+    user_events = to_dict(path)
+    assert len(user_events) == 10
+    assert sum(len(events) for events in user_events.values()) == n_events
+
+    # the synthetic data can be consumed by the extractors
+    stats = Statistics(user_events, n_jobs = 1).calculate_statistics(INTERACTION_EVENTS)
+    assert set(stats.keys()) == set(user_events.keys())
+    seqs = Sequences(user_events, n_jobs = 1).get_sequences(INTERACTION_EVENTS, {
+        e: e[:2] for e in INTERACTION_EVENTS
+    })
+    assert set(seqs.keys()) == set(user_events.keys())
+
+def test_run_benchmarks():
+    results = run_benchmarks(users = [5], cases = ['to_dict'], events_per_user = 20)
+    assert [(r['case'], r['n_users']) for r in results['results']] == [('to_dict', 5)]
+    result = results['results'][0]
+    assert result['n_events'] > 0 and result['events_per_sec'] > 0
+    assert result['peak_rss_mb'] > 0
+
+    comparison = compare(results, results)
+    assert comparison[0]['speedup'] == pytest.approx(1.0)
+
+    # the import time is measured against its budget, but not asserted on (it's noisy)
+    assert results['import_time']['seconds'] > 0
+    assert results['import_time']['budget_seconds'] == IMPORT_TIME_BUDGET
+    assert [c['case'] for c in comparison] == ['to_dict', 'import']
+    assert 'import_time' not in run_benchmarks(
+        users = [5], cases = ['to_dict'], events_per_user = 20, import_time = False)
+
+    with pytest.raises(ValueError):
+        run_benchmarks(users = [5], cases = ['not_a_case'])
+
+    # a workload with many narrative element changes
+    dense = run_benchmarks(
+        users = [5], cases = ['to_dict'], events_per_user = 20, nec_density = 0.5, 
+        import_time = False)
+    assert dense['meta']['nec_density'] == 0.5
+    assert 'error' not in dense['results'][0]
+
+def test_run_benchmarks_parse():
+    # the parse cases count the raw events, and the case process exits even though 
+    # joblib has started workers
+    results = run_benchmarks(
+        users = [5], cases = ['parse', 'parse_parallel', 'parse_chunks'], events_per_user = 20,
+        n_jobs = 2, timeout = 120, import_time = False)
+    assert [r['case'] for r in results['results']] == ['parse', 'parse_parallel', 'parse_chunks']
+    assert all('error' not in r for r in results['results'])
+    assert len({r['n_events'] for r in results['results']}) == 1
+
+def test_run_case_failures(tmp_path):
+    path = str(tmp_path / 'raw.json')
+    write_raw_events(path, 5, events_per_user = 20)
+
+    # a case that doesn't finish in time is stopped and reported, rather than waited on
+    result = run_case('to_dict', path, timeout = 0.01, poll_interval = 0.05)
+    assert 'timed out' in result['error']
+
+    # as is a case that fails in the child
+    assert 'error' in run_case('to_dict', str(tmp_path / 'missing.json'), poll_interval = 0.05)
@@ -0,0 +1,124 @@
+import pytest
+
+import pickle
+
+import numpy as np
+
+from interlib.preprocessing import Statistics, NarrativeElementTimes
+
+@pytest.fixture
+def test_data():
+    with open('tests/test_data_files/test_data.p', 'rb') as data_in:
+        data = pickle.load(data_in)
+    return data
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_nec_time_matrix(test_data):
+    stats = Statistics(test_data, n_jobs = 2)
+    times = stats.nec_time_matrix()
+    time_stats = stats.time_statistics()
+
+    assert times.shape == (len(test_data), len(times.narrative_elements))
+    assert set(times.users) == set(test_data)
+
+    # the rows are the times behind the average NEC times
+    for user in test_data:
+        user_times = list(times.user(user).values())
+        if not user_times: continue
+        assert np.mean(user_times) == pytest.approx(time_stats[user]['avg_nec_time'])
+        assert np.median(user_times) == pytest.approx(time_stats[user]['med_nec_time'])
+
+    user_times = times.to_dict()
+    for nec in times.narrative_elements:
+        column = [t[nec] for t in user_times.values() if nec in t]
+        assert times.column(nec) == {u: t[nec] for u, t in user_times.items() if nec in t}
+        assert times.column_counts()[nec] == len(column)
+        assert times.column_sums()[nec] == pytest.approx(sum(column))
+        assert times.column_means()[nec] == pytest.approx(np.mean(column))
+        assert times.column_stds()[nec] == pytest.approx(np.std(column), abs = 1e-9)
+
+    with pytest.raises(ValueError):
+        times.column('not a narrative element')
+
+    with pytest.raises(ValueError):
+        times.user('not a user')
+
+def test_nec_time_matrix_from_dict():
+    times = NarrativeElementTimes.from_dict({
+        'a': {'intro': 10.0, 'end': 0.0}, 'b': {}, 'c': {'intro': 20.0}})
+
+    assert times.shape == (3, 2)
+    assert times.user('b') == {}
+    assert times.column_counts() == {'intro': 2, 'end': 1} # a visit of 0.0 is kept
+    assert times.column_means() == {'intro': 15.0, 'end': 0.0}
+    assert times.to_dict() == {'a': {'intro': 10.0, 'end': 0.0}, 'b': {}, 'c': {'intro': 20.0}}
+
+def test_narrative_paths(test_data):
+    from collections import Counter
+    from interlib.preprocessing import NarrativePaths
+
+    paths = NarrativePaths(test_data, n_jobs = 2)
+    user_paths = paths.get_paths()
+
+    sorted_data = {u: sorted(e, key = lambda x: x['timestamp']) for u, e in test_data.items()}
+    expected = {
+        user: [
+            e['data']['romper_to_state'] for e in events
+            if e['action_name'] == 'NARRATIVE_ELEMENT_CHANGE']
+        for user, events in sorted_data.items()
+    }
+    assert user_paths == expected
+
+    user = next(iter(test_data))
+    assert paths.get_paths(user_id = user) == expected[user]
+
+    # the encodings index into the narrative elements
+    elements = paths.narrative_elements
+    for user, codes in paths.path_encodings().items():
+        assert [elements[c] for c in codes] == expected[user]
+
+    # the transitions are the (from, to) of each NEC, apart from the first of a session
+    transitions = Counter(
+        (e['data']['romper_from_state'], e['data']['romper_to_state'])
+        for events in sorted_data.values() for e in events
+        if e['action_name'] == 'NARRATIVE_ELEMENT_CHANGE' and 
+        e['data']['romper_from_state'] not in ('null', '', None)
+    )
+    matrix = paths.transition_matrix().tocoo()
+    assert {
+        (elements[r], elements[c]): int(v) for r, c, v in zip(matrix.row, matrix.col, matrix.data)
+    } == dict(transitions)
+
+    # the most frequent full paths and prefixes
+    full_paths = Counter(tuple(p) for p in expected.values() if p)
+    top = paths.top_paths(k = 3)
+    assert [count for _, count in top] == [count for _, count in full_paths.most_common(3)]
+    assert all(full_paths[path] == count for path, count in top)
+
+    prefixes = Counter(tuple(p[:2]) for p in expected.values() if len(p) >= 2)
+    top = paths.top_paths(k = 2, prefix_length = 2)
+    assert [count for _, count in top] == [count for _, count in prefixes.most_common(2)]
+    assert all(prefixes[path] == count for path, count in top)
+
+    with pytest.raises(ValueError):
+        paths.top_paths(k = 0)
+
+    with pytest.raises(ValueError):
+        paths.top_paths(prefix_length = 0)
+
+def test_narrative_paths_merged_from_workers(test_data):
+    from interlib.preprocessing import NarrativePaths
+
+    def _transitions(paths):
+        elements, matrix = paths.narrative_elements, paths.transition_matrix().tocoo()
+        return {
+            (elements[r], elements[c]): int(v) for r, c, v in zip(matrix.row, matrix.col, matrix.data)}
+
+    # the workers' transition counts and tries are merged, however the users are split
+    expected = NarrativePaths(test_data, n_jobs = 1)
+    for paths in [NarrativePaths(test_data, n_jobs = 2), NarrativePaths(test_data, n_jobs = 2, profile = True)]:
+        assert paths.get_paths() == expected.get_paths()
+        assert _transitions(paths) == _transitions(expected)
+        assert sorted(paths.top_paths(k = 100)) == sorted(expected.top_paths(k = 100))
+        assert sorted(paths.top_paths(k = 100, prefix_length = 3)) == sorted(
+            expected.top_paths(k = 100, prefix_length = 3))
@@ -0,0 +1,85 @@
+import pytest 
+
+import json
+
+from interlib.util import to_dict, write_partitions, iter_partitions
+from interlib.preprocessing import Statistics, Sequences
+from interlib.preprocessing.out_of_core import process_partitions, JSONLinesSink, ParquetSink
+
+@pytest.fixture
+def data_location(): return 'tests/test_data_files/raw_test_data.json'
+
+@pytest.fixture
+def interaction_events():
+    return { # set of user actions we consider
+        'PLAY_PAUSE_BUTTON_CLICKED', 'BACK_BUTTON_CLICKED', 
+        'FULLSCREEN_BUTTON_CLICKED','NEXT_BUTTON_CLICKED', 
+        'SUBTITLES_BUTTON_CLICKED', 'VOLUME_CHANGE',
+        'VIDEO_SCRUBBED', 'SEEK_BACKWARD_BUTTON_CLICKED', 
+        'SEEK_FORWARD_BUTTON_CLICKED', 'VOLUME_MUTE_TOGGLED', 
+        'VARIABLE_PANEL_NEXT_CLICKED', 'VARIABLE_PANEL_BACK_CLICKED',
+        'BROWSER_VISIBILITY_CHANGE', 'WINDOW_ORIENTATION_CHANGE',
+        'NARRATIVE_ELEMENT_CHANGE', 'LINK_CHOICE_CLICKED',
+        'USER_SET_VARIABLE'
+    }
+
+@pytest.fixture
+def partitions_location(data_location, tmp_path):
+    return write_partitions(data_location, str(tmp_path / 'partitions'), 3, format = 'pickle')
+
+def test_process_partitions(data_location, partitions_location, interaction_events):
+    user_events = to_dict(data_location)
+
+    expected = Statistics(user_events).calculate_statistics(interaction_events)
+    results = process_partitions(
+        iter_partitions(partitions_location), 'statistics', 
+        interaction_events = interaction_events)
+    assert results == expected
+
+    aliases = {e: e[:3] for e in interaction_events}
+    expected = Sequences(user_events).get_sequences(interaction_events, aliases)
+    results = process_partitions(
+        iter_partitions(partitions_location), 'sequences', 
+        interaction_events = interaction_events, aliases = aliases)
+    assert results == expected
+
+    # any function from user events to results
+    results = process_partitions(
+        iter_partitions(partitions_location), lambda events: {u: len(e) for u, e in events.items()})
+    assert results == {u: len(e) for u, e in user_events.items()}
+
+def test_process_partitions_sinks(data_location, partitions_location, interaction_events, tmp_path):
+    expected = Statistics(to_dict(data_location)).calculate_statistics(interaction_events)
+
+    with JSONLinesSink(str(tmp_path / 'statistics.jsonl')) as sink:
+        assert process_partitions(
+            iter_partitions(partitions_location), 'statistics', sink = sink,
+            interaction_events = interaction_events) is None
+
+    with open(str(tmp_path / 'statistics.jsonl'), 'r') as in_file:
+        rows = [json.loads(line) for line in in_file]
+    assert len(rows) == len(expected)
+    for row in rows:
+        assert row == pytest.approx({'user': row['user'], **expected[row['user']]}, nan_ok = True)
+
+    pq = pytest.importorskip('pyarrow.parquet')
+    with ParquetSink(str(tmp_path / 'statistics')) as sink:
+        process_partitions(
+            iter_partitions(partitions_location), 'statistics', sink = sink,
+            interaction_events = interaction_events)
+    assert pq.read_table(str(tmp_path / 'statistics')).num_rows == len(expected)
+
+def test_process_partitions_errors(data_location, interaction_events):
+    user_events = to_dict(data_location)
+    
+    # a user in more than one partition, only checked when asked (it keeps every user id)
+    with pytest.raises(ValueError):
+        process_partitions(
+            [user_events, user_events], 'statistics', check_partitions = True,
+            interaction_events = interaction_events)
+
+    with pytest.raises(ValueError):
+        process_partitions([user_events], 'pauses')
+
+    with pytest.raises(TypeError):
+        process_partitions([user_events], 1)
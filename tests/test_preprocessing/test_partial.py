@@ -0,0 +1,154 @@
+import pytest
+
+import pickle
+
+import numpy as np
+
+from interlib.preprocessing import Statistics
+from interlib.preprocessing.partial import (
+    PartialStatistics, merge_partial_statistics, finalize_statistics)
+
+@pytest.fixture
+def test_data():
+    with open('tests/test_data_files/test_data.p', 'rb') as data_in:
+        data = pickle.load(data_in)
+    return data
+
+@pytest.fixture
+def interaction_events():
+    return { # set of user actions we consider
+        'PLAY_PAUSE_BUTTON_CLICKED', 'BACK_BUTTON_CLICKED',
+        'FULLSCREEN_BUTTON_CLICKED','NEXT_BUTTON_CLICKED',
+        'SUBTITLES_BUTTON_CLICKED', 'VOLUME_CHANGE',
+        'VIDEO_SCRUBBED', 'SEEK_BACKWARD_BUTTON_CLICKED',
+        'SEEK_FORWARD_BUTTON_CLICKED', 'VOLUME_MUTE_TOGGLED',
+        'VARIABLE_PANEL_NEXT_CLICKED', 'VARIABLE_PANEL_BACK_CLICKED',
+        'BROWSER_VISIBILITY_CHANGE', 'WINDOW_ORIENTATION_CHANGE',
+        'NARRATIVE_ELEMENT_CHANGE', 'LINK_CHOICE_CLICKED',
+        'USER_SET_VARIABLE'
+    }
+
+def _shard(user_events, n_shards):
+    """ split each user's (sorted) events into n_shards, without splitting ties """
+    shards = [{} for _ in range(n_shards)]
+    for user, events in user_events.items():
+        start = 0
+        for idx in range(n_shards):
+            end = len(events) if idx == n_shards - 1 else max(
+                start, (idx + 1) * len(events) // n_shards)
+            while 0 < end < len(events) and events[end]['timestamp'] == events[end - 1]['timestamp']:
+                end += 1
+            shards[idx][user] = events[start:end]
+            start = end
+    return shards
+
+def _assert_same(expected, results):
+    assert results.keys() == expected.keys()
+    for user, stats in expected.items():
+        assert results[user].keys() == stats.keys()
+        for key, value in stats.items():
+            if isinstance(value, float) and np.isnan(value): assert np.isnan(results[user][key])
+            else: assert results[user][key] == value, (user, key)
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_partial_statistics(test_data, interaction_events):
+    stats = Statistics(test_data)
+    expected = stats.calculate_statistics(interaction_events)
+
+    # a single shard is the same as a single run
+    _assert_same(expected, finalize_statistics(stats.partial_statistics(interaction_events)))
+
+    # the shards can be given in any order
+    shards = [
+        Statistics(shard, presorted = True).partial_statistics(interaction_events)
+        for shard in _shard(stats.data, 4)
+    ]
+    _assert_same(expected, finalize_statistics(merge_partial_statistics(*shards[::-1])))
+
+    # and merged in any grouping
+    user = max(test_data, key = lambda u: len(test_data[u]))
+    a, b, c, d = [shard[user] for shard in shards]
+    assert a.merge(b).merge(c.merge(d)).finalize() == ((a.merge(b)).merge(c)).merge(d).finalize()
+
+    with pytest.raises(ValueError):
+        a.merge(c).merge(b) # b is between a and c
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_partial_statistics_completion(test_data, interaction_events):
+    stats = Statistics(
+        test_data, completion_point = 'Intro Message',
+        narrative_element_durations = {'Intro Message': 10.0})
+    expected = stats.calculate_statistics(interaction_events)
+
+    shards = [
+        Statistics(
+            shard, completion_point = 'Intro Message', presorted = True,
+            narrative_element_durations = {'Intro Message': 10.0}
+        ).partial_statistics(interaction_events)
+        for shard in _shard(stats.data, 3)
+    ]
+    _assert_same(expected, finalize_statistics(merge_partial_statistics(*shards)))
+
+    # multiple completion points
+    endings = {'Thanks', 'CH00_Introduction'}
+    expected = Statistics(test_data, completion_point = endings).calculate_statistics(interaction_events)
+    endings_shards = [
+        Statistics(shard, completion_point = endings, presorted = True).partial_statistics(
+            interaction_events)
+        for shard in _shard(stats.data, 3)
+    ]
+    _assert_same(expected, finalize_statistics(merge_partial_statistics(*endings_shards)))
+
+    # the partials have to be calculated in the same way
+    user = next(iter(test_data))
+    other = PartialStatistics.from_events(user, stats.data[user], interaction_events)
+    with pytest.raises(ValueError):
+        shards[0][user].merge(other)
+
+    with pytest.raises(ValueError):
+        shards[0][user].merge(shards[0][next(u for u in test_data if u != user)])
+
+    with pytest.raises(TypeError):
+        shards[0][user].merge({})
+
+@pytest.mark.filterwarnings('ignore::RuntimeWarning')
+def test_partial_statistics_hidden_edges(interaction_events):
+    from datetime import datetime as dt, timedelta
+
+    start = dt(2021, 1, 1, 12, 0, 0)
+    def _event(seconds, action_type, action_name, state):
+        return {
+            'user': 'user_1', 'timestamp': start + timedelta(seconds = seconds),
+            'action_type': action_type, 'action_name': action_name,
+            'data': {'romper_to_state': state, 'romper_from_state': None}
+        }
+
+    # a repeated hidden, a completion point reached while hidden and a hidden at the end
+    events = [
+        _event(0, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Intro'),
+        _event(10, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'hidden'),
+        _event(15, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'hidden'),
+        _event(20, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Chapter 1'),
+        _event(100, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'visible'),
+        _event(110, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'visible'),
+        _event(130, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Credits'),
+        _event(140, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'hidden'),
+        _event(200, 'USER_ACTION', 'NEXT_BUTTON_CLICKED', None)
+    ]
+    for completion_point in ['Chapter 1', {'Chapter 1', 'Credits'}]:
+        expected = Statistics(
+            {'user_1': events}, completion_point = completion_point
+        ).calculate_statistics(interaction_events)
+
+        # the shards are split at every point (and in three at every pair of points)
+        splits = [(idx, ) for idx in range(1, len(events))] + [
+            (a, b) for a in range(1, len(events)) for b in range(a + 1, len(events))]
+        for split in splits:
+            edges = (0, ) + split + (len(events), )
+            shards = [
+                Statistics(
+                    {'user_1': events[a:b]}, completion_point = completion_point, presorted = True
+                ).partial_statistics(interaction_events)
+                for a, b in zip(edges, edges[1:])
+            ]
+            _assert_same(expected, finalize_statistics(merge_partial_statistics(*shards)))
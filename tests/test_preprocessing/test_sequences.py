@@ -174,6 +174,107 @@ def test_errors_are_thrown(test_data, interaction_events, aliases):
         # should throw an error when something other than a dictionary is passed
         seq.get_sequences(interaction_events = interaction_events, aliases = [])
 
+def test_sequences_multiple_time_thresholds(test_data, interaction_events, aliases):
+    thresholds = [60, 300, 600]
+    seq = Sequences(test_data, n_jobs = 1)
+    extracted_seqs = seq.get_sequences(
+        interaction_events = interaction_events,
+        aliases = aliases,
+        time_threshold = thresholds
+    )
+
+    assert set(extracted_seqs.keys()) == set(thresholds)
+
+    # each threshold should match extracting the sequences with that threshold alone
+    for threshold in thresholds:
+        single_seq = Sequences(test_data, n_jobs = 1)
+        single_seqs = single_seq.get_sequences(
+            interaction_events = interaction_events,
+            aliases = aliases,
+            time_threshold = threshold
+        )
+        assert extracted_seqs[threshold] == single_seqs
+
+    # a lower threshold should be a prefix of a higher one
+    for user in test_data.keys():
+        short, longer = extracted_seqs[60][user], extracted_seqs[600][user]
+        assert longer[:len(short)] == short
+
+    # the single user retrieval should return each of the thresholds
+    user = '0c5b7783-0320-4818-bcb8-e244de363591'
+    user_seqs = seq.get_sequences(interaction_events, aliases, user_id = user, time_threshold = thresholds)
+    assert user_seqs == {t: extracted_seqs[t][user] for t in thresholds}
+
+def test_sequences_multiple_time_thresholds_errors(test_data, interaction_events, aliases):
+    seq = Sequences(test_data, n_jobs = 1)
+
+    with pytest.raises(ValueError):
+        seq.get_sequences(interaction_events, aliases, time_threshold = [])
+
+    with pytest.raises(TypeError):
+        seq.get_sequences(interaction_events, aliases, time_threshold = ['60'])
+
+def test_sequences_pause_schemes(test_data, interaction_events, aliases):
+    pause_schemes = {
+        'default': {'SP': 1, 'MP': 5, 'LP': 15, 'VLP': 30},
+        'coarse': {'SHORT': 2, 'LONG': 60}
+    }
+    seq = Sequences(test_data, n_jobs = 1)
+    extracted_seqs = seq.get_sequences(
+        interaction_events = interaction_events,
+        aliases = aliases,
+        pause_schemes = pause_schemes
+    )
+
+    # the default scheme should be the same as the sequences without a scheme
+    default_seqs = Sequences(test_data, n_jobs = 1).get_sequences(interaction_events, aliases)
+    assert extracted_seqs['default'] == default_seqs
+
+    # the events are the same in both schemes, only the pauses differ
+    for user, sequence in extracted_seqs['coarse'].items():
+        assert set(sequence) & {'SP', 'MP', 'LP', 'VLP'} == set([])
+        assert (
+            [e for e in sequence if e not in {'SHORT', 'LONG'}] == 
+            [e for e in default_seqs[user] if e not in {'SP', 'MP', 'LP', 'VLP'}]
+        )
+
+    # the schemes can be combined with multiple thresholds
+    user = '0c5b7783-0320-4818-bcb8-e244de363591'
+    threshold_seqs = Sequences(test_data, n_jobs = 1).get_sequences(
+        interaction_events, aliases, time_threshold = [60, 600], pause_schemes = pause_schemes)
+    assert set(threshold_seqs.keys()) == set(pause_schemes.keys())
+    assert threshold_seqs['default'][600][user] == Sequences(test_data, n_jobs = 1).get_sequences(
+        interaction_events, aliases, user_id = user, time_threshold = 600)
+
+    # fetching a single user from the previously calculated sequences
+    user_seqs = seq.get_sequences(
+        interaction_events, aliases, user_id = user, pause_schemes = pause_schemes)
+    assert user_seqs == {name: extracted_seqs[name][user] for name in pause_schemes}
+
+def test_sequences_pause_schemes_errors(test_data, interaction_events, aliases):
+    seq = Sequences(test_data, n_jobs = 1)
+
+    with pytest.raises(TypeError):
+        seq.get_sequences(interaction_events, aliases, pause_schemes = [1, 5, 15, 30])
+
+    with pytest.raises(ValueError):
+        seq.get_sequences(
+            interaction_events, aliases, pause_schemes = {'bad': {'SP': 5, 'MP': 1}})
+
+def test_sequences_heavy_users(test_data, interaction_events, aliases):
+    heavy = {user for user, events in test_data.items() if len(events) > 150}
+    expected = Sequences(test_data, n_jobs = 2).get_sequences(interaction_events, aliases)
+
+    seq = Sequences(test_data, n_jobs = 2, max_user_events = 150, heavy_user_policy = 'isolate')
+    assert seq.get_sequences(interaction_events, aliases) == expected
+
+    # the skipped users have empty sequences, also when asked for on their own
+    seq = Sequences(test_data, n_jobs = 2, max_user_events = 150, heavy_user_policy = 'skip')
+    assert seq.skipped_users == heavy
+    assert all(seq.get_sequences(interaction_events, aliases, user_id = user) == [] for user in heavy)
+    for user, sequence in seq.get_sequences(interaction_events, aliases).items():
+        assert sequence == ([] if user in heavy else expected[user])
+
 # def test_sequence_time_threshold(test_data, interaction_events, aliases):
 #     seq = Sequences(test_data, n_jobs = 1)
 #     extracted_seq = seq.get_sequences(
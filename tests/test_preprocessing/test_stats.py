@@ -2,11 +2,13 @@ from numpy.core.defchararray import add
 import pytest
 
 import pickle, json, datetime
+import numpy as np
 from datetime import datetime as dt 
 from datetime import timedelta
 from collections import defaultdict
 
 from interlib.preprocessing.statistics import Statistics
+from interlib.preprocessing.base import PAUSE_TYPES
 
 # Fixtures
 @pytest.fixture
@@ -59,6 +61,35 @@ def test_init(test_data):
     assert stats.data.keys() == test_data.keys()
     assert stats.n_jobs == 1
     
+def test_init_sorting(test_data):
+    sorted_data = {
+        user: sorted(events, key = lambda x: x['timestamp']) for user, events in test_data.items()
+    }
+    unsorted_data = sorted_data.copy()
+    unsorted_user = list(unsorted_data.keys())[0]
+    unsorted_data[unsorted_user] = list(reversed(unsorted_data[unsorted_user]))
+
+    stats = Statistics(unsorted_data)
+
+    # only the out of order user should be sorted, the rest are kept in their order
+    assert ([e['timestamp'] for e in stats.data[unsorted_user]] == 
+            [e['timestamp'] for e in sorted_data[unsorted_user]])
+    for user, events in sorted_data.items():
+        if user != unsorted_user:
+            assert stats.data[user] == events
+
+    # presorted skips the check altogether
+    stats = Statistics(sorted_data, presorted = True)
+    assert all(stats.data[user] == events for user, events in sorted_data.items())
+
+    # the lists are copies, so changes to the caller's lists don't reach the extractor
+    user = next(iter(sorted_data))
+    n_events = len(sorted_data[user])
+    for data in [Statistics(sorted_data).data, stats.data]:
+        assert data[user] is not sorted_data[user]
+    sorted_data[user].pop()
+    assert len(stats.data[user]) == n_events
+    
 # ----- SPLIT USERS ------
 def test_split_users_correct_chunks(test_data):
     # test that the data is split up into the correct chunks
@@ -82,6 +113,104 @@ def test_split_users_correspond_to_data_chunk(test_data):
         assert len(users_in_d_chunk) == len(u_chunk)
         assert set(u_chunk.tolist()) == users_in_d_chunk
 
+# ----- PROFILING ------
+def test_profiling(test_data, interaction_events):
+    # profiling is off by default and doesn't change the results
+    stats = Statistics(test_data, n_jobs = 2)
+    expected = stats.calculate_statistics(interaction_events)
+    assert stats.profile_report() == []
+
+    recorded = []
+    stats = Statistics(test_data, n_jobs = 2, profile_callback = recorded.append)
+    assert stats.calculate_statistics(interaction_events) == expected
+
+    report = stats.profile_report()
+    assert report == recorded
+    assert [(r['method'], r['stage']) for r in report[:2]] == [
+        ('__init__', 'sort'), ('__init__', 'split')]
+    assert report[0]['n_events'] == sum(len(events) for events in test_data.values())
+    assert all(r['seconds'] >= 0 for r in report)
+
+    stages = {(r['method'], r['stage']): r for r in report}
+    for method in ['time_statistics', 'pause_statistics', 'event_statistics']:
+        assert (method, 'dispatch') in stages and (method, 'merge') in stages
+
+        compute = stages[(method, 'compute')]
+        assert compute['n_users'] == len(test_data)
+        assert len(compute['workers']) == 2
+        assert sum(w['n_users'] for w in compute['workers']) == len(test_data)
+        assert len(compute['slowest_users']) == 10
+        
+        slowest = [u['seconds'] for u in compute['slowest_users']]
+        assert slowest == sorted(slowest, reverse = True)
+
+    with pytest.raises(TypeError):
+        Statistics(test_data, profile_callback = 'not callable')
+
+def test_user_costs(test_data, interaction_events):
+    stats = Statistics(test_data, n_jobs = 2)
+    stats.calculate_statistics(interaction_events)
+    assert stats.user_costs() == {}
+
+    stats = Statistics(test_data, n_jobs = 2, profile = True)
+    stats.calculate_statistics(interaction_events)
+    costs = stats.user_costs()
+    assert costs.keys() == test_data.keys()
+    for user, cost in costs.items():
+        assert cost['n_events'] == len(test_data[user])
+        assert cost['seconds'] > 0
+
+# ----- HEAVY USERS ------
+def test_heavy_users(test_data, interaction_events):
+    heavy = {user for user, events in test_data.items() if len(events) > 150}
+    expected = Statistics(test_data, n_jobs = 2).calculate_statistics(interaction_events)
+
+    # cap: only the first max_user_events events of the heavy users are used
+    stats = Statistics(test_data, n_jobs = 2, max_user_events = 150)
+    assert stats.heavy_users == {user: len(test_data[user]) for user in heavy}
+    assert all(len(stats.data[user]) == 150 for user in heavy)
+    assert all(len(events) > 150 for user, events in test_data.items() if user in heavy)
+
+    capped = Statistics({
+        user: sorted(events, key = lambda x: x['timestamp'])[:150] 
+        for user, events in test_data.items()
+    }, n_jobs = 2)
+    assert (stats.calculate_statistics(interaction_events) == 
+        capped.calculate_statistics(interaction_events))
+
+    # isolate: the heavy users are given their own chunk, the results don't change
+    stats = Statistics(test_data, n_jobs = 2, max_user_events = 150, heavy_user_policy = 'isolate')
+    splits = [list(users) for users, _ in stats._split_users()]
+    assert len(splits) == 2 + len(heavy)
+    assert sorted(users[0] for users in splits[2:]) == sorted(heavy)
+    assert stats.calculate_statistics(interaction_events) == expected
+
+    # skip: the heavy users are flagged and not processed
+    stats = Statistics(test_data, n_jobs = 2, max_user_events = 150, heavy_user_policy = 'skip')
+    assert stats.skipped_users == heavy
+    res = stats.calculate_statistics(interaction_events)
+    for user, user_stats in res.items():
+        if user in heavy: assert user_stats == {'skipped': True}
+        else: assert user_stats == expected[user]
+
+    # the same for a single user, before the results for all of the users are cached
+    for user in heavy:
+        single = Statistics(test_data, max_user_events = 150, heavy_user_policy = 'skip')
+        assert single.calculate_statistics(interaction_events, user_id = user) == {'skipped': True}
+        assert single.time_statistics(user_id = user) == {'skipped': True}
+        assert single.event_frequencies([0, 60], interaction_events, user_id = user) == {'skipped': True}
+        assert single.event_frequencies(
+            [0, 60], interaction_events, user_id = user, as_array = True).shape[0] == 0
+
+    # and they have no partial statistics
+    assert not heavy & set(stats.partial_statistics(interaction_events))
+
+    with pytest.raises(ValueError):
+        Statistics(test_data, max_user_events = 0)
+
+    with pytest.raises(ValueError):
+        Statistics(test_data, max_user_events = 150, heavy_user_policy = 'ignore')
+
 # ----- TIME STATISTICS -----
 def test_time_statistics(test_data, ground_truth):
     stats = Statistics(test_data, n_jobs = -1)
@@ -175,6 +304,45 @@ def test_errors_type_of_pause(test_data):
     with pytest.raises(TypeError):
         stats._type_of_pause(1.0, 2.0)
 
+def test_bucket_pauses(test_data):
+    stats = Statistics(test_data)
+
+    ts = dt(2020, 1, 1, 10, 00, 00)
+    seconds = [0, 0.5, 1, 3, 5, 5.5, 10, 15, 20, 30, 30.001, 50]
+    timestamps = [ts + timedelta(0, sum(seconds[:i + 1])) for i in range(len(seconds))]
+
+    diffs = stats._pause_gaps(timestamps)
+    pauses = stats._bucket_pauses(diffs)
+    
+    # the vectorised version should agree with the pairwise version
+    for idx in range(len(timestamps) - 1):
+        pause_type, diff = stats._type_of_pause(timestamps[idx], timestamps[idx + 1])
+        assert diffs[idx] == diff
+        if pause_type == 0: assert pauses[idx] == -1
+        else: assert PAUSE_TYPES[pauses[idx]] == pause_type
+
+def test_bucket_pauses_mask_and_edges(test_data):
+    stats = Statistics(test_data)
+
+    ts = dt(2020, 1, 1, 10, 00, 00)
+    timestamps = [ts, ts + timedelta(0, 2), ts + timedelta(0, 4), ts + timedelta(0, 64)]
+
+    # masking out the middle event merges the two short pauses into one
+    diffs = stats._pause_gaps(timestamps, mask = [True, False, True, True])
+    pauses = stats._bucket_pauses(diffs)
+    assert list(diffs) == [4.0, 60.0]
+    assert [PAUSE_TYPES[p] for p in pauses] == ['SP', 'VLP']
+
+    # custom edges: < 3 isn't a pause, 3 to 10 is the first type and 10+ is the second 
+    pauses = stats._bucket_pauses(stats._pause_gaps(timestamps), bucket_edges = (3, 10))
+    assert list(pauses) == [-1, -1, 1]
+
+    with pytest.raises(ValueError):
+        stats._check_bucket_edges((5, 1))
+
+    with pytest.raises(ValueError):
+        stats._pause_gaps(list(reversed(timestamps)))
+
 def test_pause_statistics(test_data, ground_truth):
     stats = Statistics(test_data)
     res = stats.pause_statistics(
@@ -193,6 +361,51 @@ def test_pause_statistics(test_data, ground_truth):
         assert res[user]['LP'] == stat['LP']
         assert res[user]['VLP'] == stat['VLP']
 
+def test_pause_statistics_schemes(test_data, ground_truth):
+    pause_schemes = {
+        'default': {'SP': 1, 'MP': 5, 'LP': 15, 'VLP': 30},
+        'coarse': {'SHORT': 2, 'LONG': 60}
+    }
+    include_events = {'BROWSER_VISIBILITY_CHANGE', 'WINDOW_ORIENTATION_CHANGE'}
+    exclude_events = {'USER_SET_VARIABLE', 'LINK_CHOICE_CLICKED'}
+
+    stats = Statistics(test_data)
+    res = stats.pause_statistics(
+        pauses_include_events = include_events,
+        pauses_exclude_events = exclude_events,
+        pause_schemes = pause_schemes
+    )
+
+    # the coarse scheme, counted by hand: SHORT is 2 to 60 seconds, LONG is over 60 seconds
+    coarse = {
+        '7b06a205-c793-4bdf-8533-013dc092d341': (7, 0), '1e82e0fe-71f5-4a65-a0c3-02e70e564d3e': (5, 1),
+        '959c1a91-8b0f-4178-bc59-70499353204f': (8, 0), 'b194b76c-7866-4b6d-8502-93ffe6322b64': (12, 2),
+        '015879da-4ee5-40c7-8826-5c323a0df742': (7, 0), '9760a350-b073-42de-b86a-3f4cfeecaf6e': (6, 0),
+        'b1728dff-021d-4b82-9afc-8a29264b53e4': (5, 2), 'be3720be-3da1-419c-b912-cacc3f80a427': (5, 1),
+        '74e368cf-7a39-443d-a3cb-002f6957c8a3': (10, 0), '62d860e2-11ec-4a7c-82e2-c9bd3e369c83': (17, 1),
+        '21013769-f703-4531-9293-f2f4e114c248': (6, 0), '0c5b7783-0320-4818-bcb8-e244de363591': (4, 1),
+        'b4588353-cecb-4dee-ae8b-833d7888dec5': (15, 1)
+    }
+    for user, (short, long) in coarse.items():
+        assert res[user]['coarse'] == {'SHORT': short, 'LONG': long}
+
+    for user, stat in ground_truth.items():
+        assert set(res[user].keys()) == set(pause_schemes.keys())
+
+        # the default scheme should match the ground truth
+        for pause in ['SP', 'MP', 'LP', 'VLP']:
+            assert res[user]['default'][pause] == stat[pause]
+
+    # the schemes are stored separately to the standard pause statistics
+    assert stats.pause_statistics(
+        pauses_include_events = include_events,
+        pauses_exclude_events = exclude_events
+    )['959c1a91-8b0f-4178-bc59-70499353204f']['SP'] == (
+        ground_truth['959c1a91-8b0f-4178-bc59-70499353204f']['SP'])
+
+    with pytest.raises(ValueError):
+        stats.pause_statistics(pause_schemes = {'bad': {'SP': 5, 'MP': 1}})
+
 def test_empty_pauses_statistics(test_data):
     test_data_copy = test_data.copy()
     user_to_delete = list(test_data_copy.keys())[0]
@@ -364,6 +577,38 @@ def test_event_frequencies_single_user(test_data, event_frequencies, interaction
         for event, count in counts.items(): # for each event and count
             assert test_counts[event] == count # assert that they're the same
 
+def test_event_frequencies_array(test_data, event_frequencies, interaction_events):
+    frequencies = [v * 60 for v in range(0, 6)]
+    stats = Statistics(test_data, n_jobs = 2)
+
+    res = stats.event_frequencies(frequencies, interaction_events, as_array = True)
+    assert not res.is_sparse and res.counts.dtype == np.int32
+    assert res.shape == (len(test_data), 5, len(interaction_events))
+    assert list(res.buckets) == ['0_60', '60_120', '120_180', '180_240', '240_300']
+    assert list(res.events) == sorted(interaction_events)
+
+    # the same counts as the dictionaries
+    for user, freq in event_frequencies.items():
+        for time, counts in freq.items():
+            bucket = list(res.buckets).index(time)
+            for event, count in counts.items():
+                if event in interaction_events:
+                    assert res.user(user)[bucket, list(res.events).index(event)] == count
+
+    # a single user, with the pauses
+    user = 'be3720be-3da1-419c-b912-cacc3f80a427'
+    single = stats.event_frequencies(
+        frequencies, interaction_events, user_id = user, include_pauses = True, as_array = True)
+    assert single.shape == (1, 5, len(interaction_events) + 4)
+    assert list(single.events[-4:]) == ['SP', 'MP', 'LP', 'VLP']
+    assert (single.user(user)[:, :-4] == res.user(user)).all()
+
+    pauses = Statistics(test_data).event_frequencies(
+        frequencies, interaction_events, user_id = user, include_pauses = True)
+    for time, counts in pauses.items():
+        bucket = list(single.buckets).index(time)
+        assert list(single.user(user)[bucket, -4:]) == [counts[p] for p in ['SP', 'MP', 'LP', 'VLP']]
+
 def test_event_frequencies_errors(test_data, event_frequencies, interaction_events):
     stats = Statistics(test_data)
 
@@ -541,4 +786,228 @@ def test_norm_time(test_data, narrative_element_durations):
     #     print(u, s['norm_avg_nec_time'], s['norm_std_nec_time'])
 
     # appears to output the correct values - needs proper testing.
-    
\ No newline at end of file
+    
+def test_nec_time_quantiles(test_data):
+    stats = Statistics(test_data, n_jobs = 2)
+    quantiles = stats.nec_time_quantiles()
+
+    # the time each user spent on each narrative element
+    times = defaultdict(list)
+    for user, user_times in stats.nec_time_matrix().to_dict().items():
+        for nec, time in user_times.items(): times[nec].append(time)
+
+    assert quantiles.keys() == times.keys()
+    for nec, nec_quantiles in quantiles.items():
+        assert set(nec_quantiles) == {'p50', 'p90', 'p99'}
+        assert len(stats.nec_time_sketches()[nec]) == len(times[nec])
+        for q, value in zip([0.5, 0.9, 0.99], nec_quantiles.values()):
+            assert value == pytest.approx(
+                np.quantile(times[nec], q, method = 'lower'), rel = 0.01, abs = 1e-9)
+
+def test_nec_times_merged_from_workers(test_data):
+    # the workers' entries and sketches are merged, however the users are split
+    expected = Statistics(test_data, n_jobs = 1)
+    for stats in [Statistics(test_data, n_jobs = 2), Statistics(test_data, n_jobs = 2, profile = True)]:
+        assert stats.nec_time_matrix().to_dict() == expected.nec_time_matrix().to_dict()
+        assert stats.nec_time_quantiles() == expected.nec_time_quantiles()
+        for nec, sketch in stats.nec_time_sketches().items():
+            assert len(sketch) == len(expected.nec_time_sketches()[nec])
+
+def test_funnel(test_data):
+    points = ['Intro Message', 'CH00_Introduction', 'Thanks']
+    stats = Statistics(test_data, n_jobs = 2)
+    funnels = stats.funnel(points)
+    assert funnels.keys() == test_data.keys()
+
+    for user, events in stats.data.items():
+        path = [e['data']['romper_to_state'] for e in events if e['action_type'] == 'STORY_NAVIGATION']
+        steps = 0
+        for element in path:
+            if steps < len(points) and element == points[steps]: steps += 1
+
+        assert funnels[user]['steps_reached'] == steps
+        assert funnels[user]['furthest_step'] == (points[steps - 1] if steps else None)
+        assert len(funnels[user]['step_times']) == steps
+
+    # a single point is on the same clock as the time to completion
+    completion = Statistics(test_data, completion_point = 'Thanks').time_statistics()
+    for user, user_funnel in stats.funnel(['Thanks']).items():
+        if user_funnel['steps_reached']:
+            assert user_funnel['step_times'][0] == pytest.approx(
+                completion[user]['time_to_completion'])
+
+    counts = stats.funnel_counts(points)
+    steps = [f['steps_reached'] for f in funnels.values()]
+    assert counts.n_users == len(test_data)
+    assert list(counts.reached) == [sum(s > i for s in steps) for i in range(len(points))]
+    assert list(counts.drop_off) == [sum(s == i + 1 for s in steps) for i in range(len(points))]
+    assert [step['point'] for step in counts.to_list()] == points
+
+    # the counts are the same however the users are split (or when profiling)
+    single = Statistics(test_data, n_jobs = 1).funnel_counts(points)
+    assert list(single.reached) == list(counts.reached)
+    assert single.merge(counts).n_users == 2 * len(test_data)
+    profiled = Statistics(test_data, n_jobs = 2, profile = True)
+    assert profiled.funnel(points) == funnels
+    assert profiled.funnel_counts(points).to_list() == counts.to_list()
+
+    # merging into the counts doesn't change those of the Statistics
+    counts.merge(stats.funnel_counts(points))
+    assert stats.funnel_counts(points).n_users == len(test_data)
+
+    skipping = Statistics(test_data, n_jobs = 2, max_user_events = 150, heavy_user_policy = 'skip')
+    assert skipping.skipped_users
+    for user, user_funnel in skipping.funnel(points).items():
+        if user in skipping.skipped_users: assert user_funnel == {'skipped': True}
+        else: assert user_funnel == funnels[user]
+    assert skipping.funnel_counts(points).n_users == len(test_data) - len(skipping.skipped_users)
+
+    assert stats.funnel(points, user_id = next(iter(test_data))) == funnels[next(iter(test_data))]
+
+    with pytest.raises(ValueError):
+        stats.funnel([])
+
+    with pytest.raises(TypeError):
+        stats.funnel('Thanks')
+
+    with pytest.raises(ValueError):
+        counts.merge(stats.funnel_counts(['Thanks']))
+
+def test_funnel_hidden_time():
+    start = dt(2021, 1, 1, 12, 0, 0)
+    def _event(seconds, action_type, action_name, state):
+        return {
+            'user': 'user_1', 'timestamp': start + timedelta(seconds = seconds),
+            'action_type': action_type, 'action_name': action_name, 
+            'data': {'romper_to_state': state}
+        }
+
+    # the second step is reached while the experience is hidden (from 10s to 100s)
+    events = [
+        _event(0, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Intro'),
+        _event(10, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'hidden'),
+        _event(20, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Chapter 1'),
+        _event(100, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'visible'),
+        _event(130, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Credits')
+    ]
+    funnel = Statistics({'user_1': events}).funnel(['Intro', 'Chapter 1', 'Credits'])['user_1']
+    assert funnel['steps_reached'] == 3
+    assert funnel['step_times'] == [0.0, 10.0, 30.0]
+
+def test_funnel_matches_endpoint_times():
+    start = dt(2021, 1, 1, 12, 0, 0)
+    def _event(seconds, action_type, action_name, state):
+        return {
+            'user': 'user_1', 'timestamp': start + timedelta(seconds = seconds),
+            'action_type': action_type, 'action_name': action_name,
+            'data': {'romper_to_state': state}
+        }
+
+    # hidden from 10s to 100s (hidden twice), Chapter 1 is reached while hidden and the
+    # experience is hidden at the end without becoming visible again
+    events = [
+        _event(0, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Intro'),
+        _event(10, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'hidden'),
+        _event(15, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'hidden'),
+        _event(20, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Chapter 1'),
+        _event(100, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'visible'),
+        _event(130, 'STORY_NAVIGATION', 'NARRATIVE_ELEMENT_CHANGE', 'Credits'),
+        _event(140, 'USER_ACTION', 'BROWSER_VISIBILITY_CHANGE', 'hidden'),
+        _event(200, 'USER_ACTION', 'NEXT_BUTTON_CLICKED', None)
+    ]
+    points = ['Intro', 'Chapter 1', 'Credits']
+    stats = Statistics({'user_1': events}, completion_point = set(points))
+    time_stats = stats.time_statistics()['user_1']
+    assert time_stats['hidden_time'] == 90.0
+    assert time_stats['session_length'] == 110.0
+    assert time_stats['endpoint_times'] == {'Intro': 0.0, 'Chapter 1': 10.0, 'Credits': 40.0}
+
+    # the funnel and the endpoint times are on the same clock
+    funnel = stats.funnel(points)['user_1']
+    endpoint_times = [time_stats['endpoint_times'][point] for point in points]
+    assert funnel['step_times'] == np.diff(endpoint_times, prepend = 0.0).tolist()
+
+    # as are the time on each narrative element (from one to the next)
+    assert stats.nec_time_matrix().user('user_1') == {
+        'Intro': 10.0, 'Chapter 1': 30.0, 'Credits': 10.0}
+
+def test_multiple_completion_points(test_data):
+    endings = {'Thanks', 'CH00_Introduction', 'Not an ending'}
+    stats = Statistics(test_data, completion_point = endings)
+    time_stats = stats.time_statistics()
+
+    single = {
+        ending: Statistics(test_data, completion_point = ending).time_statistics() 
+        for ending in endings
+    }
+    for user, user_stats in time_stats.items():
+        reached = {e for e in endings if single[e][user]['reach_end']}
+        assert user_stats['reach_end'] == bool(reached)
+        assert user_stats['endpoint_times'] == {
+            e: single[e][user]['time_to_completion'] for e in reached}
+        assert user_stats['last_ne_seen'] == single['Thanks'][user]['last_ne_seen']
+
+        if reached: # the ending is the completion point reached last
+            assert user_stats['ending'] in reached
+            assert user_stats['time_to_completion'] == user_stats['endpoint_times'][user_stats['ending']]
+            assert user_stats['time_to_completion'] == max(
+                single[e][user]['time_to_completion'] for e in reached)
+        else:
+            assert user_stats['ending'] is None
+            assert user_stats['time_to_completion'] == 0.0
+
+    # a single completion point doesn't have the extra statistics
+    assert 'ending' not in single['Thanks'][next(iter(test_data))]
+
+    with pytest.raises(TypeError):
+        Statistics(test_data, completion_point = ['Thanks'])
+
+    with pytest.raises(TypeError):
+        Statistics(test_data, completion_point = {'Thanks', 1})
+
+def test_event_rates(test_data, interaction_events):
+    from interlib.preprocessing.statistics import _active_clock
+
+    stats = Statistics(test_data, n_jobs = 2)
+    rates = stats.event_rates(interaction_events, window = 60, stride = 25)
+    assert rates.shape == rates.counts.shape
+    assert rates.shape[0] == len(test_data) and rates.shape[2] == len(interaction_events)
+    assert list(rates.buckets[:3]) == [0, 25, 50]
+
+    # against counting the events in each window
+    events_index = {event: idx for idx, event in enumerate(rates.events)}
+    for row, user in enumerate(rates.users):
+        clock = _active_clock(stats.data[user])
+        assert (np.diff(clock) > -1e-9).all() # the hidden time is taken out
+        
+        for window, start in enumerate(rates.buckets[::7]):
+            expected = np.zeros(len(events_index), dtype = int)
+            for event, time in zip(stats.data[user], clock):
+                if start <= time < start + 60 and event['action_name'] in events_index:
+                    expected[events_index[event['action_name']]] += 1
+            assert (rates.user(user)[window * 7] == expected).all()
+
+    sparse_rates = stats.event_rates(interaction_events, window = 60, stride = 25, sparse = True)
+    assert sparse_rates.is_sparse and sparse_rates.shape == rates.shape
+    assert (sparse_rates.to_dense() == rates.counts).all()
+    assert (sparse_rates.user(rates.users[0]) == rates.user(rates.users[0])).all()
+
+    with pytest.raises(ValueError):
+        stats.event_rates(interaction_events, window = 0)
+
+    with pytest.raises(TypeError):
+        stats.event_rates(list(interaction_events))
+
+def test_active_clock():
+    from interlib.preprocessing.statistics import _active_clock
+
+    start = dt(2020, 1, 1)
+    events = [
+        {'action_name': name, 'timestamp': start + timedelta(seconds = secs), 'data': {'romper_to_state': state}}
+        for name, secs, state in [
+            ('NEXT_BUTTON_CLICKED', 0, None), ('BROWSER_VISIBILITY_CHANGE', 10, 'hidden'),
+            ('NEXT_BUTTON_CLICKED', 20, None), ('BROWSER_VISIBILITY_CHANGE', 40, 'visible'),
+            ('NEXT_BUTTON_CLICKED', 45, None)
+        ]
+    ]
+    assert list(_active_clock(events)) == [0, 10, 10, 10, 15]
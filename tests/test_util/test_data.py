@@ -1,12 +1,16 @@
 import pytest 
 
-import json
+import json, pickle, sys, sqlite3
+from datetime import datetime as dt
 import pandas as pd
 from numpy import delete
 
 from interlib.util.data import to_dict, _get_users_clicked_start_button
 from interlib.util.data import to_dataframe, reached_point, events_between_two_points
-from interlib.util import parse_raw_data
+from interlib.util.data import events_between_multiple_points, events_to_threshold
+from interlib.util.data import from_parquet, to_parquet, DATA_FIELDS
+from interlib.util.data import from_sql, iter_sql_users, _events_query
+from interlib.util import parse_raw_data, Event, EventData
 from interlib.preprocessing.statistics import Statistics
 
 @pytest.fixture
@@ -76,6 +80,90 @@ def test_to_dict_user_subset(user_ids, data_location):
         assert user in subset_include
         assert user not in subset_exclude
 
+def test_to_dict_compact(user_ids, data_location, interaction_events):
+    user_events = to_dict(data_location)
+    compact_events = to_dict(data_location, compact = True)
+
+    assert compact_events.keys() == user_events.keys()
+    for user, events in compact_events.items():
+        assert all(isinstance(event, Event) for event in events)
+        assert all(isinstance(event['data'], EventData) for event in events)
+        assert [e['id'] for e in events] == [e['id'] for e in user_events[user]]
+
+        for event, expected in zip(events, user_events[user]):
+            assert Event.from_dict(expected) == event
+            assert event['data']['romper_to_state'] == expected['data'].get('romper_to_state')
+
+    # the util functions and the extractors accept the compact events
+    assert reached_point(compact_events, 'CH00_Introduction') == reached_point(
+        user_events, 'CH00_Introduction')
+    assert (events_between_two_points(compact_events, 'CH00_Introduction', '09_Ronaldo') ==
+        {
+            user: [Event.from_dict(e) for e in events] for user, events in 
+            events_between_two_points(user_events, 'CH00_Introduction', '09_Ronaldo').items()
+        })
+    assert (Statistics(compact_events).calculate_statistics(interaction_events) ==
+        Statistics(user_events).calculate_statistics(interaction_events))
+
+def test_to_dict_intern_symbols(data_location):
+    user_events = to_dict(data_location)
+    assert user_events == to_dict(data_location, intern_symbols = False)
+
+    # one copy of each distinct value
+    for field in ['user', 'action_type', 'action_name']:
+        symbols = {}
+        for events in user_events.values():
+            for event in events:
+                assert symbols.setdefault(event[field], event[field]) is event[field]
+                assert event[field] is sys.intern(event[field])
+    
+    for events in to_dict(data_location, compact = True).values():
+        for event in events:
+            assert event['user'] is sys.intern(event['user'])
+            if isinstance(event['data']['romper_to_state'], str):
+                state = event['data']['romper_to_state']
+                assert state is sys.intern(state)
+
+def test_event_record():
+    event = {
+        'id': 1, 'user': 'user_1', 'timestamp': dt(2021, 1, 1, 12, 0, 0),
+        'action_type': 'STORY_NAVIGATION', 'action_name': 'NARRATIVE_ELEMENT_CHANGE',
+        'data': {'romper_to_state': 'Intro', 'romper_from_state': 'null', 'other': 'dropped'}
+    }
+    compact = Event.from_dict(event)
+    assert compact['action_name'] is sys.intern('NARRATIVE_ELEMENT_CHANGE')
+    assert compact['data']['romper_to_state'] == 'Intro'
+    assert compact['data']['current_narrative_element'] is None
+    assert 'other' not in compact['data']
+    assert compact.to_dict() == {
+        **event, 'data': {'romper_to_state': 'Intro', 'romper_from_state': 'null'}}
+
+    # survives being sent to a worker
+    assert pickle.loads(pickle.dumps(compact)) == compact
+
+    with pytest.raises(KeyError):
+        compact['not_a_field']
+    assert 'action_name' in compact and 'not_a_field' not in compact
+
+    # mutable, like the event dicts, so not hashable
+    with pytest.raises(TypeError):
+        hash(compact)
+
+def test_parse_raw_data_compact_intern_symbols():
+    raw_data = [{
+        'id': 1, 'userid': ''.join(['user', '_1']), 'timestamp': '2021-01-01 12:00:00.000',
+        'item': ''.join(['STORY', '_NAVIGATION']), 'action': ''.join(['NARRATIVE', '_ELEMENT_CHANGE']),
+        'message': json.dumps({'romper_to_state': 'Intro', 'romper_from_state': 'null'})
+    }]
+    interned, = parse_raw_data(raw_data, compact = True)
+    assert interned['user'] is sys.intern('user_1')
+    assert interned['action_type'] is sys.intern('STORY_NAVIGATION')
+
+    not_interned, = parse_raw_data(raw_data, compact = True, intern_symbols = False)
+    assert not_interned['user'] is raw_data[0]['userid']
+    assert not_interned['action_type'] is raw_data[0]['item']
+    assert not_interned == interned
+
 def test_get_users_clicked_start_button(data_location, user_ids):
     with open(data_location, 'r') as in_file:
         data = parse_raw_data(
@@ -261,5 +349,325 @@ def test_events_between_two_points_using_representation_id(data_location):
             else:
                 assert events[0]['data']['current_narrative_element'] == start
 
+def test_events_between_multiple_points(data_location):
+    user_events = to_dict(data_location)
+
+    points = [
+        ('CH00_Introduction', '09_Ronaldo'),
+        ('CH00_Introduction', '05: Selena'),
+        ('05: Selena', '09_Ronaldo')
+    ]
+
+    batch_events = events_between_multiple_points(user_events, points)
+    assert list(batch_events.keys()) == points
+
+    # the number of events of each user (first 8 characters of the id) and the ids 
+    # of their first and last events, counted from the fixture
+    expected = {
+        ('CH00_Introduction', '09_Ronaldo'): {
+            '015879da': (31, 24106432, 24106551), '0c5b7783': (23, 24024698, 24031445),
+            '21013769': (72, 24014586, 24015203), '62d860e2': (178, 26578228, 26579450),
+            '74e368cf': (42, 26550515, 26550566), '7b06a205': (69, 25729055, 25729246),
+            '959c1a91': (36, 24175112, 24175368), '9760a350': (40, 24127275, 24127479),
+            'b1728dff': (30, 24126804, 24127112), 'b194b76c': (40, 24201840, 24201959),
+            'b4588353': (61, 24017921, 24018308)
+        },
+        ('CH00_Introduction', '05: Selena'): {
+            '015879da': (31, 24106432, 24106551), '0c5b7783': (23, 24024698, 24031445),
+            '21013769': (50, 24014586, 24014966), '62d860e2': (76, 26578228, 26578306),
+            '74e368cf': (42, 26550515, 26550566), '7b06a205': (69, 25729055, 25729246),
+            '959c1a91': (85, 24175112, 24175572), '9760a350': (40, 24127275, 24127479),
+            'b1728dff': (88, 24126804, 24128670), 'b194b76c': (186, 24201840, 24204483),
+            'b4588353': (162, 24017921, 24018527)
+        },
+        ('05: Selena', '09_Ronaldo'): {
+            '21013769': (23, 24014966, 24015203), '62d860e2': (103, 26578306, 26579450)
+        }
+    }
+    for pair, subset in batch_events.items():
+        assert subset.keys() == user_events.keys() # all of the users, without filter
+        assert {
+            user[:8]: (len(events), events[0]['id'], events[-1]['id'])
+            for user, events in subset.items() if events
+        } == expected[pair]
+
+def test_events_between_multiple_points_filter_and_representation_id(data_location):
+    user_events = to_dict(data_location)
+
+    points = [
+        ('66f663b2-16ec-4321-abc3-5f582d0649ef', '0d51a32c-d05c-439b-8317-8b36ef0e6d10'),
+        ('0d51a32c-d05c-439b-8317-8b36ef0e6d10', '66f663b2-16ec-4321-abc3-5f582d0649ef')
+    ]
+
+    batch_events = events_between_multiple_points(
+        user_events, points, filter = True, using_representation_id = True)
+
+    # the number of events of each user (first 8 characters of the id), from the fixture
+    expected = [
+        {
+            '015879da': 18, '0c5b7783': 7, '21013769': 59, '62d860e2': 166, '74e368cf': 30, 
+            '7b06a205': 60, '959c1a91': 26, '9760a350': 26, 'b1728dff': 21, 'b194b76c': 41,
+            'b4588353': 58, 'be3720be': 59
+        },
+        {'959c1a91': 46, 'b1728dff': 55, 'b194b76c': 134, 'b4588353': 94}
+    ]
+    for pair, counts in zip(points, expected):
+        assert {user[:8]: len(events) for user, events in batch_events[pair].items()} == counts
+
+def test_events_between_multiple_points_errors(data_location):
+    user_events = to_dict(data_location)
+
+    # test that a type error is thrown when the points are not a list
+    with pytest.raises(TypeError):
+        events_between_multiple_points(user_events, ('CH00_Introduction', '09_Ronaldo'))
+
+    # test that a value error is thrown when the points are not pairs
+    with pytest.raises(ValueError):
+        events_between_multiple_points(user_events, [('CH00_Introduction', )])
+
+# ----- events to threshold test -----
+def test_events_to_threshold(data_location):
+    user_events = to_dict(data_location)
+    threshold = 300
+
+    threshold_events = events_to_threshold(user_events, threshold)
+
+    assert threshold_events.keys() == user_events.keys()
+    for user, events in threshold_events.items():
+        # the events should be a prefix of the user's events
+        assert events == user_events[user][:len(events)]
+
+        # all but the last event should be within the threshold
+        first_ts = events[0]['timestamp']
+        for event in events[:-1]:
+            assert (event['timestamp'] - first_ts).total_seconds() <= threshold
+        
+        # if the events have been cut short, then the last should be beyond the threshold
+        if len(events) < len(user_events[user]):
+            assert (events[-1]['timestamp'] - first_ts).total_seconds() > threshold
+
+def test_events_to_threshold_multiple_thresholds(data_location):
+    user_events = to_dict(data_location)
+    thresholds = [300, 600, 900]
+
+    threshold_events = events_to_threshold(user_events, thresholds)
+
+    # the number of events of each user (first 8 characters of the id), from the fixture
+    counts = {
+        '015879da': 40, '0c5b7783': 13, '21013769': 84, '62d860e2': 159, '74e368cf': 59,
+        '7b06a205': 75, '959c1a91': 98, '9760a350': 49, 'b1728dff': 74, 'b194b76c': 195,
+        'b4588353': 171, 'be3720be': 71
+    }
+    after_five_minutes = {'7b06a205': 76, 'b1728dff': 97, 'be3720be': 76}
+    expected = {
+        300: counts, 600: dict(counts, **after_five_minutes), 900: dict(counts, **after_five_minutes)
+    }
+
+    assert list(threshold_events.keys()) == thresholds
+    for threshold in thresholds:
+        assert {
+            user[:8]: len(events) for user, events in threshold_events[threshold].items()
+        } == expected[threshold]
+        for user, events in threshold_events[threshold].items():
+            assert events == user_events[user][:len(events)]
+
+    with pytest.raises(TypeError):
+        events_to_threshold(user_events, ['300'])
+
 # TODO: test for parse raw data
 
+
+
+# ----- parquet -----
+@pytest.fixture
+def raw_columns(data_location):
+    """ the raw data as columns, with the data fields as strings (as they would be in parquet) """
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+
+    columns = {c: [r[c] for r in raw] for c in ['id', 'userid', 'item', 'action', 'narrativeelement']}
+    columns['timestamp'] = [e['timestamp'] for e in parse_raw_data(raw)]
+
+    messages = [json.loads(r['message']) for r in raw]
+    for field in DATA_FIELDS:
+        columns[field] = [
+            str(m[field]) if field in m and m[field] is not None else None for m in messages]
+    return columns
+
+def _expected_events(user_events):
+    """ the user events with only the data fields (as strings) """
+    return {user: [{
+        **e, 'data': {k: str(v) for k, v in e['data'].items() if k in DATA_FIELDS}
+    } for e in events] for user, events in user_events.items()}
+
+def test_from_parquet(data_location, raw_columns, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    expected = _expected_events(to_dict(data_location))
+
+    # the data as a column per field
+    pq.write_table(pa.table(raw_columns), str(tmp_path / 'fields.parquet'))
+    assert from_parquet(str(tmp_path / 'fields.parquet')) == expected
+
+    # the data in a struct message column, partitioned by the action type
+    struct_columns = {c: v for c, v in raw_columns.items() if c not in DATA_FIELDS}
+    struct_columns['message'] = [
+        {f: raw_columns[f][i] for f in DATA_FIELDS} for i in range(len(raw_columns['id']))]
+    pq.write_to_dataset(
+        pa.table(struct_columns), str(tmp_path / 'dataset'), partition_cols = ['item'])
+    assert from_parquet(str(tmp_path / 'dataset')) == expected
+
+    # the raw (JSON) message and string timestamps
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+    pq.write_table(pa.table({
+        c: [r[c] for r in raw] for c in ['id', 'userid', 'timestamp', 'item', 'action', 'message']
+    }), str(tmp_path / 'raw.parquet'))
+    assert from_parquet(str(tmp_path / 'raw.parquet')) == to_dict(data_location)
+
+    compact = from_parquet(str(tmp_path / 'fields.parquet'), compact = True)
+    assert {u: [e.to_dict() for e in events] for u, events in compact.items()} == expected
+
+    pq.write_table(pa.table({'id': [1]}), str(tmp_path / 'bad.parquet'))
+    with pytest.raises(ValueError):
+        from_parquet(str(tmp_path / 'bad.parquet'))
+
+def test_from_parquet_filters(data_location, raw_columns, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    expected = _expected_events(to_dict(data_location, start_button_filter = False))
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+    string_columns = {**raw_columns, 'timestamp': [r['timestamp'] for r in raw]}
+
+    pq.write_table(pa.table(raw_columns), str(tmp_path / 'data.parquet'))
+    pq.write_table(pa.table(string_columns), str(tmp_path / 'strings.parquet'))
+
+    users = set(list(expected.keys())[:5])
+    start, end = dt(2019, 8, 5, 7, 0, 0), dt(2019, 9, 5, 20, 16, 41, 291000)
+
+    for path in [str(tmp_path / 'data.parquet'), str(tmp_path / 'strings.parquet')]:
+        user_events = from_parquet(path, users_to_include = users, start_button_filter = False)
+        assert user_events == {user: expected[user] for user in users}
+
+        user_events = from_parquet(
+            path, start_time = start, end_time = end, start_button_filter = False)
+        in_range = {
+            user: [e for e in events if start <= e['timestamp'] < end]
+            for user, events in expected.items()
+        }
+        assert user_events == {user: events for user, events in in_range.items() if events}
+
+    with pytest.raises(TypeError):
+        from_parquet(str(tmp_path / 'data.parquet'), users_to_include = ['a', 'b'])
+
+    with pytest.raises(TypeError):
+        from_parquet(str(tmp_path / 'data.parquet'), start_time = '2019-08-05')
+
+def test_to_parquet(data_location, interaction_events, tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    from interlib.preprocessing import Sequences
+
+    user_events = to_dict(data_location)
+    stats = Statistics(user_events).calculate_statistics(interaction_events)
+    to_parquet(stats, str(tmp_path / 'statistics.parquet'))
+
+    rows = pq.read_table(str(tmp_path / 'statistics.parquet')).to_pylist()
+    assert len(rows) == len(stats)
+    for row in rows:
+        assert row == pytest.approx({'user': row['user'], **stats[row['user']]}, nan_ok = True)
+
+    sequences = Sequences(user_events).get_sequences(
+        interaction_events, {e: e[:3] for e in interaction_events})
+    to_parquet(sequences, str(tmp_path / 'sequences.parquet'))
+
+    rows = pq.read_table(str(tmp_path / 'sequences.parquet')).to_pylist()
+    assert {row['user']: row['sequence'] for row in rows} == sequences
+
+    with pytest.raises(TypeError):
+        to_parquet([], str(tmp_path / 'bad.parquet'))
+
+
+# ----- sql -----
+@pytest.fixture
+def sql_connection(data_location):
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+
+    columns = [
+        'id', 'experienceid', 'userid', 'timestamp', 'item', 
+        'action', 'message', 'narrativeelement', 'representation'
+    ]
+    connection = sqlite3.connect(':memory:')
+    connection.execute('CREATE TABLE events ({0})'.format(', '.join(columns)))
+    connection.executemany(
+        'INSERT INTO events VALUES ({0})'.format(', '.join('?' for _ in columns)),
+        [tuple(r[c] for c in columns) for r in raw]
+    )
+    yield connection
+    connection.close()
+
+def test_from_sql(data_location, sql_connection, user_ids):
+    assert from_sql(sql_connection) == to_dict(data_location)
+    assert from_sql(sql_connection, batch_size = 7) == to_dict(data_location)
+    assert (from_sql(sql_connection, start_button_filter = False) == 
+        to_dict(data_location, start_button_filter = False))
+
+    subset = set(list(user_ids)[:5])
+    assert (from_sql(sql_connection, users_to_include = subset) == 
+        to_dict(data_location, users_to_include = subset))
+    assert from_sql(sql_connection, users_to_include = set()) == {}
+
+    # the users are streamed in order, each with all of their events
+    streamed = list(iter_sql_users(sql_connection, batch_size = 10))
+    assert [user for user, _ in streamed] == sorted(user for user, _ in streamed)
+    assert dict(streamed) == to_dict(data_location)
+
+    compact = from_sql(sql_connection, compact = True)
+    assert all(isinstance(e, Event) for events in compact.values() for e in events)
+
+def test_from_sql_many_users(data_location, sql_connection, user_ids):
+    # as older versions of SQLite, which only allowed 999 parameters in a query
+    sql_connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)
+    users = user_ids | {'missing_user_{0}'.format(idx) for idx in range(2000)}
+
+    streamed = list(iter_sql_users(sql_connection, users_to_include = users))
+    assert [user for user, _ in streamed] == sorted(user for user, _ in streamed)
+    assert (dict(streamed) == 
+        to_dict(data_location, users_to_include = users))
+
+def test_from_sql_time_range(data_location, sql_connection):
+    start, end = dt(2019, 8, 5, 22, 44, 32), dt(2019, 9, 5, 20, 16, 41, 291000)
+
+    in_range = {
+        user: [e for e in events if start <= e['timestamp'] < end]
+        for user, events in to_dict(data_location).items()
+    }
+    assert (from_sql(sql_connection, start_time = start, end_time = end) == 
+        {user: events for user, events in in_range.items() if events})
+
+def test_from_sql_errors(sql_connection):
+    with pytest.raises(ValueError):
+        from_sql(sql_connection, table = 'events; DROP TABLE events')
+
+    with pytest.raises(ValueError):
+        from_sql(sql_connection, batch_size = 0)
+
+    with pytest.raises(TypeError):
+        from_sql(sql_connection, users_to_include = ['a'])
+
+    with pytest.raises(TypeError):
+        from_sql(sql_connection, start_time = '2019-08-05')
+
+def test_events_query_paramstyle():
+    query, params = _events_query(
+        'events', users_to_include = {'a', 'b'}, paramstyle = 'format')
+    assert 'userid IN (%s, %s)' in query and query.endswith('ORDER BY userid, timestamp, id')
+    assert params == ['a', 'b', 'START_BUTTON_CLICKED']
+
+    query, params = _events_query('events', users_to_include = {'a'}, paramstyle = 'named')
+    assert 'userid IN (:p0)' in query
+    assert params == {'p0': 'a', 'p1': 'START_BUTTON_CLICKED'}
@@ -0,0 +1,22 @@
+import pytest
+
+import subprocess, sys
+
+# the heavy (or rarely needed) dependencies that are only imported when they're first
+# used, numpy is the only heavy dependency that is imported up front. Checking which
+# modules were imported, rather than timing the import, keeps the test deterministic,
+# the import time itself is measured against its budget by benchmarks/run.py.
+LAZY_MODULES = ('pandas', 'nltk', 'joblib', 'scipy', 'pyarrow', 'asyncio', 'concurrent.futures')
+
+def _imported_modules(module):
+    output = subprocess.run(
+        [sys.executable, '-c', 'import sys, {0}; print(" ".join(sys.modules))'.format(module)],
+        stdout = subprocess.PIPE, universal_newlines = True, check = True
+    ).stdout
+    return set(output.split())
+
+@pytest.mark.parametrize('module', ['interlib', 'interlib.preprocessing', 'interlib.util'])
+def test_lazy_imports(module):
+    modules = _imported_modules(module)
+    for lazy_module in LAZY_MODULES:
+        assert lazy_module not in modules
@@ -0,0 +1,92 @@
+import pytest
+
+import asyncio, json
+
+from interlib.util import to_dict
+from interlib.util.ingest import ingest, ingest_async, _iter_array_items
+
+@pytest.fixture
+def data_location(): return 'tests/test_data_files/raw_test_data.json'
+
+@pytest.fixture
+def daily_files(data_location, tmp_path):
+    """ the raw data split (interleaved) into a JSON array and two JSON Lines files """
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+    days = [raw[i::3] for i in range(3)]
+
+    paths = [str(tmp_path / 'day_0.json'), str(tmp_path / 'day_1.jsonl'), str(tmp_path / 'day_2.jsonl')]
+    with open(paths[0], 'w') as out_file:
+        json.dump(days[0], out_file)
+    for path, day in zip(paths[1:], days[1:]):
+        with open(path, 'w') as out_file:
+            for event in day: out_file.write(json.dumps(event) + '\n')
+
+    combined = str(tmp_path / 'combined.json')
+    with open(combined, 'w') as out_file:
+        json.dump([event for day in days for event in day], out_file)
+    return paths, combined
+
+def test_ingest(daily_files):
+    paths, combined = daily_files
+    expected = to_dict(combined)
+
+    # small batches with little room to read ahead, the result is the same as to_dict
+    assert ingest(paths, n_workers = 2, batch_size = 50, max_pending = 2) == expected
+    assert ingest(paths, n_workers = 1, n_readers = 1) == expected
+
+    # the events are kept in the order of the files when they're not sorted
+    unsorted = ingest(paths, n_workers = 2, batch_size = 13, sort = False, start_button_filter = False)
+    assert unsorted == to_dict(combined, sort = False, start_button_filter = False)
+
+    users = set(list(expected)[:3])
+    assert ingest(paths, n_workers = 1, users_to_include = users) == to_dict(
+        combined, users_to_include = users)
+
+def test_ingest_async(daily_files):
+    paths, combined = daily_files
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(
+            ingest_async(paths, n_workers = 1, batch_size = 100)) == to_dict(combined)
+    finally:
+        loop.close()
+
+def test_iter_array_items(daily_files, tmp_path):
+    paths, _ = daily_files
+    with open(paths[0], 'r') as in_file:
+        expected = json.load(in_file)
+
+    # the items are split across many small chunks of the file
+    with open(paths[0], 'r') as in_file:
+        assert [json.loads(item) for item in _iter_array_items(in_file, chunk_size = 7)] == expected
+
+    path = str(tmp_path / 'indented.json')
+    with open(path, 'w') as out_file:
+        json.dump(expected[:5], out_file, indent = 4)
+    with open(path, 'r') as in_file:
+        assert [json.loads(item) for item in _iter_array_items(in_file, chunk_size = 16)] == expected[:5]
+
+    with open(path, 'w') as out_file: out_file.write(' [ ] ')
+    with open(path, 'r') as in_file:
+        assert list(_iter_array_items(in_file)) == []
+
+    with open(path, 'w') as out_file: out_file.write('[{"id": 1}, {"id": ')
+    with open(path, 'r') as in_file:
+        with pytest.raises(ValueError):
+            list(_iter_array_items(in_file, chunk_size = 4))
+
+def test_ingest_errors(daily_files, tmp_path):
+    paths, _ = daily_files
+
+    with pytest.raises(TypeError):
+        ingest(paths[0])
+
+    with pytest.raises(ValueError):
+        ingest(paths + [str(tmp_path / 'missing.json')])
+
+    with pytest.raises(ValueError):
+        ingest(paths, batch_size = 0)
+
+    with pytest.raises(ValueError):
+        ingest(paths, max_pending = 0)
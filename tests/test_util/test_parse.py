@@ -0,0 +1,119 @@
+import pytest
+
+import json
+
+from interlib.util import parse_raw_data
+from interlib.util.parse import parse_raw_data_parallel, ParsedChunk
+
+@pytest.fixture
+def raw_data():
+    with open('tests/test_data_files/raw_test_data.json', 'r') as in_file:
+        data = json.load(in_file)
+    return data
+
+@pytest.fixture
+def jsonl_location(raw_data, tmp_path):
+    path = str(tmp_path / 'raw.jsonl')
+    with open(path, 'w') as out_file:
+        for event in raw_data: out_file.write(json.dumps(event) + '\n')
+    return path
+
+def _group(events):
+    user_events = {}
+    for event in events: user_events.setdefault(event['user'], []).append(event)
+    return user_events
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_parse_raw_data_parallel(raw_data, compact):
+    expected = _group(parse_raw_data(raw_data, compact = compact))
+
+    res = parse_raw_data_parallel(raw_data, n_jobs = 2, n_chunks = 5, compact = compact)
+    assert res == expected
+    assert list(res) == list(expected) # the users are in the order they first appear
+
+    # the narrative element and a different datetime format
+    for datum in raw_data:
+        datum['narrative_element'] = datum['narrativeelement']
+        datum['timestamp'] = datum['timestamp'].replace('-', '/')
+    expected = _group(parse_raw_data(
+        raw_data, '%Y/%m/%d %H:%M:%S.%f', include_narrative_element_id = True, compact = compact))
+    assert parse_raw_data_parallel(
+        raw_data, n_jobs = 1, n_chunks = 3, datetime_format = '%Y/%m/%d %H:%M:%S.%f', 
+        include_narrative_element_id = True, compact = compact) == expected
+
+@pytest.mark.parametrize('n_chunks', [1, 3, 50])
+def test_parse_raw_data_parallel_file(raw_data, jsonl_location, n_chunks):
+    expected = _group(parse_raw_data(raw_data))
+
+    # each line of the file is in exactly one of the byte ranges
+    chunks = parse_raw_data_parallel(jsonl_location, n_jobs = 2, n_chunks = n_chunks, as_chunks = True)
+    assert all(isinstance(chunk, ParsedChunk) for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) == len(raw_data)
+    assert parse_raw_data_parallel(jsonl_location, n_jobs = 2, n_chunks = n_chunks) == expected
+
+    # a JSON array is loaded and then split
+    assert parse_raw_data_parallel(
+        'tests/test_data_files/raw_test_data.json', n_jobs = 1, n_chunks = n_chunks) == expected
+
+def test_parse_raw_data_parallel_n_jobs(raw_data):
+    # the default number of chunks follows joblib's n_jobs, e.g. all but one of the cores
+    expected = _group(parse_raw_data(raw_data))
+    assert parse_raw_data_parallel(raw_data, n_jobs = -2) == expected
+    assert parse_raw_data_parallel(raw_data, n_jobs = 1, intern_symbols = False) == expected
+
+def test_parse_raw_data_parallel_timestamps(raw_data):
+    # numpy would parse these, but they're not in the format so strptime rejects them
+    for timestamp in ['2019-08-05T22:44:32.123', '2019-8-5 22:44:32.123']:
+        raw = [dict(raw_data[0], timestamp = timestamp)]
+        with pytest.raises(ValueError):
+            parse_raw_data(raw)
+        with pytest.raises(ValueError):
+            parse_raw_data_parallel(raw, n_jobs = 1)
+
+    # anything after the milliseconds is dropped by both
+    raw = [dict(raw_data[0], timestamp = '2019-08-05 22:44:32.123+01:00')]
+    assert parse_raw_data_parallel(raw, n_jobs = 1) == _group(parse_raw_data(raw))
+
+def test_parse_raw_data_parallel_errors(raw_data, tmp_path):
+    with pytest.raises(TypeError):
+        parse_raw_data_parallel({}, n_jobs = 1)
+
+    with pytest.raises(TypeError):
+        parse_raw_data_parallel(raw_data, n_jobs = '1')
+
+    with pytest.raises(ValueError):
+        parse_raw_data_parallel(raw_data, n_jobs = 1, n_chunks = 0)
+
+    with pytest.raises(ValueError):
+        parse_raw_data_parallel(str(tmp_path / 'missing.jsonl'), n_jobs = 1)
+
+def test_parsed_chunk_data_columns(raw_data):
+    # the values that are equal but of a different type are different symbols, the
+    # events that don't have a key are None in its column
+    values = [True, 1, 1.0, '1', [1], {'a': 1}, [1], None]
+    raw = [
+        dict(raw_data[idx], message = json.dumps({'romper_id': value, 'value': value}))
+        for idx, value in enumerate(values)
+    ]
+    raw.append(dict(raw_data[len(values)], message = json.dumps({'romper_id': 'other'})))
+
+    chunk = ParsedChunk.from_raw(raw)
+    user_values = {}
+    for datum in raw: 
+        user_values.setdefault(datum['userid'], []).append(json.loads(datum['message']))
+    assert chunk.data_column('romper_id') == [
+        message['romper_id'] for messages in user_values.values() for message in messages]
+    assert chunk.data_column('value') == [
+        message.get('value') for messages in user_values.values() for message in messages]
+    assert chunk.data_column('missing') == [None] * len(raw)
+
+    user_events, expected = chunk.user_events(), _group(parse_raw_data(raw))
+    assert user_events == expected
+    value_types = lambda user_events: [ # (== doesn't tell True, 1 and 1.0 apart)
+        type(event['data'].get('value')) for events in user_events.values() for event in events]
+    assert value_types(user_events) == value_types(expected)
+
+    # each event has its own list or dict
+    lists = [event['data']['value'] for events in user_events.values() for event in events
+        if event['data'].get('value') == [1]]
+    assert len(lists) == 2 and lists[0] is not lists[1]
@@ -0,0 +1,124 @@
+import pytest 
+
+import json, os, tempfile
+
+from interlib.util import to_dict, partitions as partitions_module
+from interlib.util.partitions import user_partition, write_partitions, iter_partitions
+
+@pytest.fixture
+def data_location(): return 'tests/test_data_files/raw_test_data.json'
+
+@pytest.fixture
+def jsonl_location(data_location, tmp_path):
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+
+    path = str(tmp_path / 'raw.jsonl')
+    with open(path, 'w') as out_file:
+        for event in raw: out_file.write(json.dumps(event) + '\n')
+    return path
+
+def test_user_partition():
+    assert user_partition('user_1', 4) == user_partition('user_1', 4)
+    assert all(0 <= user_partition('user_{0}'.format(i), 4) < 4 for i in range(100))
+    assert len({user_partition('user_{0}'.format(i), 4) for i in range(100)}) == 4
+
+@pytest.mark.parametrize('format', ['jsonl', 'pickle'])
+def test_write_and_iter_partitions(data_location, jsonl_location, tmp_path, format):
+    expected = to_dict(data_location)
+
+    paths = write_partitions(jsonl_location, str(tmp_path / 'partitions'), 3, format = format)
+    assert len(paths) == 3 and all(os.path.isfile(p) for p in paths)
+
+    partitions = list(iter_partitions(str(tmp_path / 'partitions')))
+    assert len(partitions) == 3
+
+    # each user is in a single partition, with all of their events
+    all_users = [user for partition in partitions for user in partition]
+    assert sorted(all_users) == sorted(expected.keys())
+    for idx, partition in enumerate(partitions):
+        for user, events in partition.items():
+            assert user_partition(user, 3) == idx
+            assert events == expected[user]
+
+    # the JSON array can also be partitioned
+    write_partitions(data_location, str(tmp_path / 'from_json'), 3, format = format)
+    assert list(iter_partitions(str(tmp_path / 'from_json'))) == partitions
+
+def test_iter_partitions_parquet(data_location, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+    columns = ['id', 'userid', 'timestamp', 'item', 'action', 'message']
+    pq.write_table(pa.table({c: [r[c] for r in raw] for c in columns}), str(tmp_path / 'raw.parquet'))
+
+    expected = to_dict(data_location)
+    partitions = list(iter_partitions(str(tmp_path / 'raw.parquet'), n_partitions = 4))
+    assert 1 < len(partitions) <= 4
+    assert {u: e for partition in partitions for u, e in partition.items()} == expected
+
+    with pytest.raises(ValueError):
+        list(iter_partitions(str(tmp_path / 'raw.parquet')))
+
+def test_iter_partitions_parquet_columns(data_location, tmp_path, monkeypatch):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+    columns = ['id', 'userid', 'timestamp', 'item', 'action', 'message', 'representation']
+    pq.write_table(pa.table({c: [r[c] for r in raw] for c in columns}), str(tmp_path / 'raw.parquet'))
+
+    # only the columns that are needed are read (and spilled)
+    spilled_columns = set()
+    spill_batches = partitions_module._spill_batches
+    def _spy(spill_dir, buffers, spill_idx):
+        spilled_columns.update(name for batches in buffers for b in batches for name in b.schema.names)
+        spill_batches(spill_dir, buffers, spill_idx)
+    monkeypatch.setattr(partitions_module, '_spill_batches', _spy)
+
+    partitions = list(iter_partitions(str(tmp_path / 'raw.parquet'), n_partitions = 2))
+    assert spilled_columns == set(columns) - {'representation'}
+    assert {u: e for partition in partitions for u, e in partition.items()} == to_dict(data_location)
+
+def test_partitions_buffered(data_location, jsonl_location, tmp_path, monkeypatch):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+
+    expected = list(iter_partitions(write_partitions(
+        jsonl_location, str(tmp_path / 'partitions'), 3)))
+
+    # the events are written out (and the Parquet rows spilled) many times
+    monkeypatch.setattr(partitions_module, '_BUFFER_ROWS', 7)
+    assert list(iter_partitions(write_partitions(
+        jsonl_location, str(tmp_path / 'buffered'), 3))) == expected
+
+    with open(data_location, 'r') as in_file:
+        raw = json.load(in_file)
+    columns = ['id', 'userid', 'timestamp', 'item', 'action', 'message']
+    pq.write_table(
+        pa.table({c: [r[c] for r in raw] for c in columns}), str(tmp_path / 'raw.parquet'),
+        row_group_size = 5)
+
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path / 'spill'))
+    os.makedirs(str(tmp_path / 'spill'))
+    partitions = list(iter_partitions(str(tmp_path / 'raw.parquet'), n_partitions = 3))
+    assert partitions == [p for p in expected if p]
+    assert os.listdir(str(tmp_path / 'spill')) == [] # the spilled partitions are removed
+
+    subset = set(list(to_dict(data_location))[:3])
+    partitions = iter_partitions(
+        str(tmp_path / 'raw.parquet'), n_partitions = 3, users_to_include = subset)
+    assert {u for partition in partitions for u in partition} == subset
+
+def test_write_partitions_errors(jsonl_location, tmp_path):
+    with pytest.raises(ValueError):
+        write_partitions(jsonl_location, str(tmp_path), 0)
+
+    with pytest.raises(ValueError):
+        write_partitions(jsonl_location, str(tmp_path), 2, format = 'csv')
+
+    with pytest.raises(ValueError):
+        write_partitions(str(tmp_path / 'missing.jsonl'), str(tmp_path), 2)
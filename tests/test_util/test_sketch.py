@@ -0,0 +1,58 @@
+import pytest
+
+import numpy as np
+
+from interlib.util import QuantileSketch
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(42)
+    return np.concatenate([
+        rng.lognormal(3, 1.5, 20000), np.zeros(100), -rng.exponential(2, 100)])
+
+def test_quantiles(values):
+    sketch = QuantileSketch(relative_accuracy = 0.01).update(values)
+    assert len(sketch) == len(values)
+
+    for q in [0.01, 0.1, 0.5, 0.9, 0.99]:
+        expected = np.quantile(values, q, method = 'lower')
+        assert sketch.quantile(q) == pytest.approx(expected, rel = 0.01)
+
+    assert sketch.quantile(0) == values.min()
+    assert sketch.quantile(1) == values.max()
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+    with pytest.raises(ValueError):
+        sketch.quantile(1.5)
+
+    with pytest.raises(ValueError):
+        sketch.add(float('nan'))
+    assert len(sketch) == len(values)
+
+def test_merge(values):
+    sketch = QuantileSketch().update(values)
+
+    # merging is exact, it doesn't depend on how the values are split
+    merged = QuantileSketch()
+    for chunk in np.array_split(values[::-1], 7): merged.merge(QuantileSketch().update(chunk))
+    assert merged.quantiles([0.5, 0.9, 0.99]) == sketch.quantiles([0.5, 0.9, 0.99])
+    assert len(merged) == len(sketch)
+
+    with pytest.raises(ValueError):
+        merged.merge(QuantileSketch(relative_accuracy = 0.05))
+
+    with pytest.raises(TypeError):
+        merged.merge([1, 2, 3])
+
+def test_bounded_buckets(values):
+    sketch = QuantileSketch(max_buckets = 300).update(values)
+    assert len(sketch._positive) <= 300
+    assert sketch._positive_indexes == sorted(sketch._positive)
+
+    # the smallest buckets are collapsed, the largest values are still accurate
+    for q in [0.9, 0.99]:
+        expected = np.quantile(values, q, method = 'lower')
+        assert sketch.quantile(q) == pytest.approx(expected, rel = 0.01)
+
+    with pytest.raises(ValueError):
+        QuantileSketch(relative_accuracy = 0)